@@ -1,8 +1,14 @@
 
 # wrapper functions of ccg2lambda/scripts/
-from subprocess import run
+from subprocess import run, Popen, PIPE, DEVNULL
+from concurrent.futures import Future
 from pathlib import Path
+import atexit
 import logging
+import queue
+import tempfile
+import threading
+import time
 from lxml import etree
 
 from scripts.semantic_index import SemanticIndex
@@ -10,18 +16,23 @@ from scripts.semparse import semantic_parse_sentence
 from scripts.semantic_types import get_dynamic_library_from_doc
 from scripts.logic_parser import logic_parser, LogicalExpressionException
 
+from scripts.coqtop_pool import read_lines
 from scripts.theorem import make_coq_script, prove_script
 
 
+JIGG_CMD = ["java", "-Xmx4g", "-cp", "ja/jigg-v-0.4/jar/*",
+            "jigg.pipeline.Pipeline",
+            "-annotators", "ssplit,kuromoji,ccg", "-ccg.kBest", "10"]
+# set to False to launch a new JVM for every sentence
+USE_JIGG_DAEMON = True
+
+
 def _jiggparse(inputname, outname):
     assert inputname.exists()
     assert not inputname.is_dir()
     assert not outname.is_dir()
-    jigg_dir = "ja/jigg-v-0.4/jar/*"
-    jigg = run(["java", "-Xmx4g", "-cp", jigg_dir, "jigg.pipeline.Pipeline",
-                "-annotators", "ssplit,kuromoji,ccg", "-ccg.kBest", "10",
-                "-file", str(inputname),
-                "-output", str(outname)], capture_output=True)
+    jigg = run(JIGG_CMD + ["-file", str(inputname),
+                           "-output", str(outname)], capture_output=True)
     stdout = jigg.stdout.decode()
     stderr = jigg.stderr.decode()
     # print("stdout:", stdout)
@@ -32,15 +43,162 @@ def _jiggparse(inputname, outname):
     return
 
 
-def _semparse(inputname):
-    assert inputname.exists()
-    semantic_template = "ja/semantic_templates_ja_emnlp2016.yaml"
-    logging.basicConfig(level=logging.CRITICAL)
+class JiggError(Exception):
+    pass
+
+
+class JiggDaemon:
+    """
+    A jigg Pipeline kept running in interactive mode, so that the JVM starts
+    and loads its models only once. Sentences are written to its stdin (one
+    per line) and the XML of each of them is read from its stdout.
+    Sentences queued by several threads are sent to jigg in batches, and
+    the process is restarted if it crashes or does not answer in time.
+    """
+
+    def __init__(self, cmd=JIGG_CMD, timeout=60, startup_timeout=300,
+                 max_batch=16):
+        self.cmd = cmd
+        self.timeout = timeout
+        self.startup_timeout = startup_timeout
+        self.max_batch = max_batch
+        self.process = None
+        self.lines = None
+        self.requests = queue.Queue()
+        self.worker = threading.Thread(target=self._serve)
+        self.worker.daemon = True
+        self.worker.start()
+
+    def parse(self, japanese):
+        """Returns the jigg XML (bytes) of a japanese text."""
+        future = Future()
+        self.requests.put((' '.join(japanese.splitlines()), future))
+        return future.result()
+
+    def close(self):
+        self.requests.put(None)
+        self._stop()
+
+    def _serve(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+            batch = [request]
+            while len(batch) < self.max_batch:
+                try:
+                    request = self.requests.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    self.requests.put(None)
+                    break
+                batch.append(request)
+            try:
+                roots = self._parse_batch([line for line, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), root in zip(batch, roots):
+                future.set_result(root)
+
+    def _parse_batch(self, lines):
+        for attempt in range(2):
+            try:
+                timeout = self.timeout
+                if self.process is None or self.process.poll() is not None:
+                    self._start()
+                    timeout = self.startup_timeout
+                self.process.stdin.write(''.join(l + '\n' for l in lines))
+                self.process.stdin.flush()
+                return [self._read_root(timeout) for _ in lines]
+            except (JiggError, OSError, ValueError) as e:
+                logging.warning(f'jigg daemon failed ({e}); restarting it.')
+                self._stop()
+        raise JiggError('jigg daemon failed twice')
+
+    def _start(self):
+        self.process = Popen(self.cmd, stdin=PIPE, stdout=PIPE,
+                             stderr=DEVNULL, universal_newlines=True,
+                             encoding='utf-8', bufsize=1)
+        self.lines = queue.Queue()
+        reader = threading.Thread(target=read_lines,
+                                  args=(self.process.stdout, self.lines))
+        reader.daemon = True
+        reader.start()
+
+    def _stop(self):
+        if self.process is not None:
+            try:
+                self.process.kill()
+                self.process.wait()
+            except OSError:
+                pass
+            self.process = None
+
+    def _read_root(self, timeout):
+        # interactive mode may print a prompt before the XML
+        deadline = time.time() + timeout
+        xml_lines = []
+        while True:
+            try:
+                line = self.lines.get(timeout=max(deadline - time.time(), 0))
+            except queue.Empty:
+                raise JiggError('jigg did not answer in time')
+            if line is None:
+                raise JiggError('jigg exited unexpectedly')
+            if not xml_lines and '<root' in line:
+                line = line[line.index('<root'):]
+            if xml_lines or line.startswith('<root'):
+                xml_lines.append(line)
+            if xml_lines and '</root>' in line:
+                break
+        xml_str = ''.join(xml_lines)
+        xml_str = xml_str[:xml_str.index('</root>') + len('</root>')]
+        return xml_str.encode('utf-8')
+
+
+_jigg_daemon = None
+_jigg_daemon_lock = threading.Lock()
 
-    semantic_index = SemanticIndex(semantic_template)
 
+def get_jigg_daemon():
+    global _jigg_daemon
+    if not USE_JIGG_DAEMON:
+        return None
+    with _jigg_daemon_lock:
+        if _jigg_daemon is None:
+            _jigg_daemon = JiggDaemon()
+            atexit.register(_jigg_daemon.close)
+    return _jigg_daemon
+
+
+def _semparse(inputname):
+    assert inputname.exists()
     parser = etree.XMLParser(remove_blank_text=True)
     root = etree.parse(str(inputname), parser)
+    return _semparse_root(root)
+
+
+SEMANTIC_TEMPLATE = "ja/semantic_templates_ja_emnlp2016.yaml"
+_semantic_index = None
+_semantic_index_lock = threading.Lock()
+
+
+def get_semantic_index():
+    # loaded once and shared by all threads (it is read-only)
+    global _semantic_index
+    with _semantic_index_lock:
+        if _semantic_index is None:
+            _semantic_index = SemanticIndex(SEMANTIC_TEMPLATE)
+    return _semantic_index
+
+
+def _semparse_root(root):
+    logging.basicConfig(level=logging.CRITICAL)
+
+    semantic_index = get_semantic_index()
 
     sentences = root.findall('.//sentence')
     assert len(sentences) == 1
@@ -94,30 +252,43 @@ def filter_formulas(formulas):
     return filtered_formulas_str
 
 
+def jiggparse(japanese_input):
+    """Returns the jigg XML (bytes) of japanese_input."""
+    daemon = get_jigg_daemon()
+    if daemon is not None:
+        try:
+            return daemon.parse(japanese_input)
+        except JiggError as e:
+            logging.error(f'jigg daemon unavailable ({e}); '
+                          'falling back to a new jigg process.')
+    # a private directory per call, so that concurrent calls do not collide
+    with tempfile.TemporaryDirectory(prefix='ccg2lambda') as tmpdir:
+        tmptxt = Path(tmpdir) / 'tmp.txt'
+        tmpccg = Path(tmpdir) / 'tmpccg.xml'
+        tmptxt.write_text(japanese_input)
+        _jiggparse(tmptxt, tmpccg)
+        return tmpccg.read_bytes()
+
+
 def j2l(japanese_input):
-    # prepare text file which contains japanese_input
-    tmpdir = Path('/tmp/ccg2lambda')
-    tmpdir.mkdir(exist_ok=True)
-    tmptxt = tmpdir / 'tmp.txt'
-    tmpccg = tmpdir / 'tmpccg.xml'
-    tmptxt.write_text(japanese_input)
-
-    # convert tmp.txt to formulas&Parameters
-    _jiggparse(tmptxt, tmpccg)
-    dynamic_library_str, formulas_str = _semparse(tmpccg)
+    # convert japanese_input to formulas&Parameters
+    ccg_xml = jiggparse(japanese_input)
+    parser = etree.XMLParser(remove_blank_text=True)
+    root = etree.fromstring(ccg_xml, parser)
+    dynamic_library_str, formulas_str = _semparse_root(root)
     return dynamic_library_str, formulas_str
 
 
-def _prove(premises, conclusion, dynamic_library_str):
+def _prove(premises, conclusion, dynamic_library_str, timeout=100):
     coq_script = make_coq_script(premises, conclusion,
                                  dynamic_library_str)
-    inf_result_bool = prove_script(coq_script, timeout=100)
+    inf_result_bool = prove_script(coq_script, timeout=timeout)
     return inf_result_bool
 
 
-def prove(premises, conclusion, dynamic_library_strs):
+def prove(premises, conclusion, dynamic_library_strs, timeout=100):
     dls = '\n'.join(dynamic_library_strs)
-    inf_result_bool = _prove(premises, conclusion, dls)
+    inf_result_bool = _prove(premises, conclusion, dls, timeout)
     return inf_result_bool
 
 
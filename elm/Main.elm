@@ -12,7 +12,9 @@ import Http
 import Json.Decode as Decode exposing (Decoder, field, index, int, string)
 import Json.Encode as Encode
 import List.Extra
+import Process
 import Table
+import Task
 import Tree as TvTree
 import TreeView as Tv
 import Url
@@ -35,6 +37,10 @@ type alias AllTable =
     { jatable : List Japanese, lotable : List Logic, thtable : List Theorem }
 
 
+type alias Job =
+    { id : String, status : String, message : String }
+
+
 type alias Model =
     { jatable : List Japanese
     , jaState : Table.State
@@ -86,6 +92,9 @@ type Msg
     | UpdateGood FormGood
     | Delete FormDelete
     | Registered (Result Http.Error String)
+    | Submitted (Result Http.Error Job)
+    | PollJob String
+    | GotJob (Result Http.Error Job)
     | UpdateFormJapanese String
     | UpdateFormTheorem FormTheorem
     | UpdateFormTryprove FormTryprove
@@ -194,6 +203,22 @@ update msg model =
         Registered result ->
             registeredHelper model result
 
+        Submitted result ->
+            case result of
+                Ok job ->
+                    ( { model | message = job.message }, pollJob job.id )
+
+                Err err ->
+                    ( { model | message = "Http.Error:" ++ handleHttpError err }
+                    , Cmd.none
+                    )
+
+        PollJob jobId ->
+            ( model, getJob jobId )
+
+        GotJob result ->
+            gotJobHelper model result
+
         UpdateFormJapanese japanese ->
             ( { model | formJa = japanese }, Cmd.none )
 
@@ -230,6 +255,26 @@ registeredHelper model result =
             )
 
 
+gotJobHelper : Model -> Result Http.Error Job -> ( Model, Cmd Msg )
+gotJobHelper model result =
+    case result of
+        Ok job ->
+            if job.status == "done" || job.status == "failed" then
+                ( { model | message = job.message }
+                , getAllTable
+                )
+
+            else
+                ( { model | message = job.message }
+                , pollJob job.id
+                )
+
+        Err err ->
+            ( { model | message = "Http.Error:" ++ handleHttpError err }
+            , Cmd.none
+            )
+
+
 handleHttpError : Http.Error -> String
 handleHttpError httperror =
     case httperror of
@@ -503,9 +548,9 @@ apiUrl =
 registerJapanese : String -> Cmd Msg
 registerJapanese japanese =
     Http.post
-        { url = UB.relative [ apiUrl, "reg_ja" ] []
+        { url = UB.relative [ apiUrl, "jobs", "reg_ja" ] []
         , body = Http.jsonBody (Encode.object [ ( "japanese", Encode.string japanese ) ])
-        , expect = Http.expectJson Registered messageDecoder
+        , expect = Http.expectJson Submitted submittedDecoder
         }
 
 
@@ -555,14 +600,14 @@ transform formTransform =
 tryprove : FormTryprove -> Cmd Msg
 tryprove formTryprove =
     Http.post
-        { url = UB.relative [ apiUrl, "try_prove" ] []
+        { url = UB.relative [ apiUrl, "jobs", "try_prove" ] []
         , body =
             Http.jsonBody <|
                 Encode.object
                     [ ( "premises_id", Encode.string formTryprove.premises )
                     , ( "conclusion_id", Encode.int <| stringToInt formTryprove.conclusion )
                     ]
-        , expect = Http.expectJson Registered messageDecoder
+        , expect = Http.expectJson Submitted submittedDecoder
         }
 
 
@@ -604,6 +649,39 @@ messageDecoder =
     field "message" string
 
 
+pollIntervalMs : Float
+pollIntervalMs =
+    500
+
+
+pollJob : String -> Cmd Msg
+pollJob jobId =
+    Task.perform (\_ -> PollJob jobId) (Process.sleep pollIntervalMs)
+
+
+getJob : String -> Cmd Msg
+getJob jobId =
+    Http.get
+        { url = UB.relative [ apiUrl, "jobs", jobId ] []
+        , expect = Http.expectJson GotJob jobDecoder
+        }
+
+
+submittedDecoder : Decoder Job
+submittedDecoder =
+    Decode.map2 (\jobId message -> Job jobId "queued" message)
+        (field "job_id" string)
+        messageDecoder
+
+
+jobDecoder : Decoder Job
+jobDecoder =
+    Decode.map3 Job
+        (field "id" string)
+        (field "status" string)
+        messageDecoder
+
+
 getAllTable : Cmd Msg
 getAllTable =
     Http.get
@@ -0,0 +1,71 @@
+from collections import OrderedDict
+import itertools
+import logging
+import queue
+import threading
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobQueue:
+    """
+    Runs slow operations (parsing, proving) on a pool of worker threads.
+    submit() returns a job id at once, and status() reports the state
+    ('queued', 'running', 'done' or 'failed') and the result of a job.
+    At most max_pending jobs wait in the queue; further submissions raise
+    QueueFull. Only the last max_finished finished jobs are remembered.
+    Job ids start with prefix, so that ids of several queues do not clash.
+    """
+
+    def __init__(self, num_workers=2, max_pending=100, max_finished=1000,
+                 prefix=''):
+        self.prefix = prefix
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.max_finished = max_finished
+        self.jobs = OrderedDict()
+        self.finished = OrderedDict()
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.workers = []
+        for _ in range(num_workers):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self, kind, fn, *args):
+        with self.lock:
+            job_id = f'{self.prefix}{next(self.ids)}'
+            job = {'id': job_id, 'kind': kind, 'status': 'queued',
+                   'result': None, 'error': None}
+            try:
+                self.pending.put_nowait((job, fn, args))
+            except queue.Full:
+                raise QueueFull(f'{self.pending.maxsize} jobs are waiting')
+            self.jobs[job_id] = job
+        return job_id
+
+    def status(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return None if job is None else dict(job)
+
+    def _work(self):
+        while True:
+            job, fn, args = self.pending.get()
+            with self.lock:
+                job['status'] = 'running'
+            try:
+                result = fn(*args)
+                status, error = 'done', None
+            except Exception as e:
+                logging.exception(f"job {job['id']} ({job['kind']}) failed")
+                result, status, error = None, 'failed', str(e)
+            with self.lock:
+                job.update(status=status, result=result, error=error)
+                self.finished[job['id']] = job
+                while len(self.finished) > self.max_finished:
+                    old_id, _ = self.finished.popitem(last=False)
+                    del self.jobs[old_id]
@@ -1,43 +1,196 @@
 from sqlite3 import connect, Error
+from collections import OrderedDict
+from multiprocessing import TimeoutError
 from pathlib import Path
+from subprocess import TimeoutExpired
+import argparse
 import json
+import multiprocessing
+import os
+import queue
+import threading
 
 from scripts.logic_parser import logic_parser, LogicalExpressionException
 from ccg2lambda import j2l, prove
 
 
 DBPATH = Path('database') / 'default.sqlite'
+# seconds to wait for a worker of prove_many beyond coqtop's own timeout
+kTimeoutMargin = 30
+# columns of each table, as returned by the info_* and page_* functions
+TABLE_COLUMNS = {'japanese': ['id', 'japanese'],
+                 'logic': ['id', 'jid', 'formula', 'types', 'good'],
+                 'theorem': ['id', 'premises', 'conclusion', 'result']}
+kMaxPageSize = 1000
+# revisions kept in the changes table; older clients reload everything
+kMaxChanges = 100000
+
+# connections kept open to the database, so that sqlite3 can also reuse
+# its cache of prepared statements
+kPoolSize = 8
+# seconds to wait for a free connection
+kPoolTimeout = 30
+
+
+class ConnectionPool:
+    """
+    At most size connections to the database at path, opened when first
+    needed. get() checks out a connection, waiting up to timeout seconds
+    for one to be returned with put() if all of them are in use.
+    """
+
+    def __init__(self, path, size=kPoolSize, timeout=kPoolTimeout):
+        self.path = path
+        self.timeout = timeout
+        # None stands for a connection that is not opened yet
+        self.idle = queue.LifoQueue()
+        for _ in range(size):
+            self.idle.put(None)
+
+    def get(self):
+        try:
+            conn = self.idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise Error(f'no free connection to {self.path} '
+                        f'after {self.timeout} seconds')
+        if conn is None:
+            try:
+                conn = self._open()
+            except Error:
+                self.idle.put(None)
+                raise
+        return conn
+
+    def put(self, conn):
+        self.idle.put(conn)
+
+    def _open(self):
+        # connections are used by one thread at a time, but not always
+        # by the thread that opened them
+        conn = connect(self.path, timeout=30, cached_statements=256,
+                       check_same_thread=False)
+        # WAL lets readers proceed while another connection is writing.
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+
+_pool = None
+_pool_key = None
+_pool_lock = threading.Lock()
+# the connection checked out by each thread
+_local = threading.local()
+
+
+def _get_pool():
+    # one pool per database and process (connections are not forked)
+    global _pool, _pool_key
+    key = (str(DBPATH), os.getpid())
+    with _pool_lock:
+        if _pool_key != key:
+            _pool = ConnectionPool(str(DBPATH))
+            _pool_key = key
+    return _pool
+
+
+def _conn():
+    # the same connection is used by a thread until it calls release_conn()
+    pool = _get_pool()
+    if getattr(_local, 'pool', None) is not pool:
+        release_conn()
+        _local.conn = pool.get()
+        _local.pool = pool
+    return _local.conn
+
+
+def release_conn():
+    # returns the connection of this thread to its pool,
+    # e.g. at the end of each request
+    pool = getattr(_local, 'pool', None)
+    if pool is not None:
+        if pool is _pool:
+            pool.put(_local.conn)
+        else:
+            _local.conn.close()
+        _local.conn = None
+        _local.pool = None
+
+
+def _create_indexes(conn):
+    try:
+        with conn:
+            conn.execute('''CREATE INDEX IF NOT EXISTS logic_jid
+                 ON logic (jid)''')
+            conn.execute('''CREATE INDEX IF NOT EXISTS japanese_japanese
+                 ON japanese (japanese)''')
+    except Error:
+        # the tables could not be created
+        pass
+
+
+def _create_change_log(conn):
+    # every insert, update and delete gets a new revision number,
+    # so that clients can ask only for the rows changed since their last one
+    try:
+        with conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS changes
+                 (rev integer primary key autoincrement, tbl text,
+                  row_id integer)''')
+            for table in TABLE_COLUMNS:
+                for event, row in [('INSERT', 'NEW'), ('UPDATE', 'NEW'),
+                                   ('DELETE', 'OLD')]:
+                    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS
+                         {table}_{event.lower()}_changes
+                         AFTER {event} ON {table} BEGIN
+                         INSERT INTO changes (tbl, row_id)
+                         VALUES ('{table}', {row}.id); END''')
+            # only the last kMaxChanges revisions are kept
+            conn.execute(f'''CREATE TRIGGER IF NOT EXISTS changes_trim
+                 AFTER INSERT ON changes BEGIN
+                 DELETE FROM changes WHERE rev <= NEW.rev - {kMaxChanges};
+                 END''')
+    except Error:
+        # the tables could not be created
+        pass
 
 
 def init_db():
-    conn = connect(DBPATH)
-    c = conn.cursor()
+    conn = _conn()
     success = True
     try:
-        c.execute('''CREATE TABLE japanese
-             (id integer primary key, japanese text)''')
-        c.execute('''CREATE TABLE logic
-             (id integer primary key, jid integer, formula text,
-              types text, good integer)''')
-        c.execute('''CREATE TABLE theorem
-             (id integer primary key, premises text,
-              conclusion integer, result text)''')
+        with conn:
+            conn.execute('''CREATE TABLE japanese
+                 (id integer primary key, japanese text)''')
+            conn.execute('''CREATE TABLE logic
+                 (id integer primary key, jid integer, formula text,
+                  types text, good integer)''')
+            conn.execute('''CREATE TABLE theorem
+                 (id integer primary key, premises text,
+                  conclusion integer, result text)''')
     except Error as e:
         success = e
-    conn.close()
+    _create_indexes(conn)
+    _create_change_log(conn)
     return success
 
 
 def _ex(query_str, arg_tuple):
-    conn = connect(DBPATH)
-    c = conn.cursor()
     success = True
     try:
-        c.execute(query_str, arg_tuple)
-        conn.commit()
+        with _conn() as conn:
+            conn.execute(query_str, arg_tuple)
+    except Error as e:
+        success = e
+    return success
+
+
+def _exmany(query_str, arg_tuples):
+    success = True
+    try:
+        with _conn() as conn:
+            conn.executemany(query_str, arg_tuples)
     except Error as e:
         success = e
-    conn.close()
     return success
 
 
@@ -47,7 +200,7 @@ def register_japanese(japanese):
     _ex('INSERT INTO japanese (japanese) VALUES (?)',
         (japanese,))
     jid = japanese2jid(japanese)
-    rets = [register_formula(jid, f, dls) for f in set(formulas_str)]
+    rets = register_formulas(jid, set(formulas_str), dls)
     if all(rets):
         return True
     else:
@@ -55,27 +208,28 @@ def register_japanese(japanese):
 
 
 def japanese2jid(japanese):
-    conn = connect(DBPATH)
-    c = conn.cursor()
     try:
-        c.execute('SELECT id FROM japanese WHERE japanese = ?',
-                  (japanese,))
+        c = _conn().execute('SELECT id FROM japanese WHERE japanese = ?',
+                            (japanese,))
         jid = c.fetchone()[0]
-        conn.close()
     except Error as e:
-        conn.close()
         return e
     return jid
 
 
-def register_formula(jid, formula, types):
-    success = True
-    assert isinstance(formula, str) and isinstance(types, str)
+def _check_formula(formula):
     # reject formula that cannot be parsed
     try:
         logic_parser.parse(formula)
     except LogicalExpressionException as e:
-        success = e
+        return e
+    return True
+
+
+def register_formula(jid, formula, types):
+    assert isinstance(formula, str) and isinstance(types, str)
+    success = _check_formula(formula)
+    if success is not True:
         return success
     # register formula
     success = _ex('''INSERT INTO logic (jid, formula, types, good)
@@ -84,6 +238,18 @@ def register_formula(jid, formula, types):
     return success
 
 
+def register_formulas(jid, formulas, types):
+    # same as register_formula for each formula, but in a single transaction
+    assert isinstance(types, str)
+    formulas = list(formulas)
+    assert all(isinstance(f, str) for f in formulas)
+    rets = [_check_formula(f) for f in formulas]
+    rows = [(jid, f, types, 1) for f, ret in zip(formulas, rets) if ret is True]
+    success = _exmany('''INSERT INTO logic (jid, formula, types, good)
+                      VALUES (?, ?, ?, ?)''', rows)
+    return [success if ret is True else ret for ret in rets]
+
+
 def register_theorem(premises_id, conclusion_id, result_bool):
     premises_id_text = ' & '.join(map(str, premises_id))
     result_text = 'proved' if result_bool else 'not proved'
@@ -93,49 +259,45 @@ def register_theorem(premises_id, conclusion_id, result_bool):
     return success
 
 
+def register_theorems(rows):
+    # rows of (premises_id, conclusion_id, result_text), in one transaction
+    success = _exmany('''INSERT INTO theorem (premises, conclusion, result)
+                      VALUES (?, ?, ?)''',
+                      [(' & '.join(map(str, premises_id)), conclusion_id,
+                        result_text)
+                       for premises_id, conclusion_id, result_text in rows])
+    return success
+
+
 def update_formula_good(id_, new_good):
-    conn = connect(DBPATH)
-    c = conn.cursor()
-    try:
-        c.execute('UPDATE logic SET good = ? WHERE id = ?',
-                  (new_good, id_))
-        conn.commit()
-        conn.close()
-    except Error as e:
-        conn.close()
-        return e
-    return True
+    return _ex('UPDATE logic SET good = ? WHERE id = ?',
+               (new_good, id_))
 
 
 def fetch_japanese(jid):
-    conn = connect(DBPATH)
-    c = conn.cursor()
     try:
-        c.execute('SELECT japanese FROM japanese WHERE id = ?',
-                  (jid,))
+        c = _conn().execute('SELECT japanese FROM japanese WHERE id = ?',
+                            (jid,))
         japanese = c.fetchone()[0]
-        conn.close()
     except Error as e:
-        conn.close()
         return e
     return japanese
 
 
 def fetch_formula(fid):
-    conn = connect(DBPATH)
-    c = conn.cursor()
     try:
-        c.execute('SELECT formula, types FROM logic WHERE id = ?',
-                  (fid,))
-        formula, types = c.fetchone()
-        conn.close()
+        c = _conn().execute('SELECT formula, types FROM logic WHERE id = ?',
+                            (fid,))
+        row = c.fetchone()
+        if row is None:
+            raise Error(f'no formula with id {fid}')
+        formula, types = row
     except Error as e:
-        conn.close()
         return e, e
     return formula, types
 
 
-def try_prove(premises_id, conclusion_id):
+def _fetch_problem(premises_id, conclusion_id):
     # fetch formulas
     premises, dls = [], []
     for pid in premises_id:
@@ -147,6 +309,12 @@ def try_prove(premises_id, conclusion_id):
     # check SQL error
     error_list = [pre for pre in premises if isinstance(pre, Error)]
     error_list += [conclusion] if isinstance(conclusion, Error) else []
+    return premises, conclusion, dls, error_list
+
+
+def try_prove(premises_id, conclusion_id):
+    premises, conclusion, dls, error_list = _fetch_problem(premises_id,
+                                                           conclusion_id)
     if len(error_list) > 0:
         return error_list
     # try to prove a theorem : pre1 -> ... -> conclusion
@@ -155,15 +323,120 @@ def try_prove(premises_id, conclusion_id):
     return result_bool
 
 
-def _fall(sqquery):
-    conn = connect(DBPATH)
-    c = conn.cursor()
+def all_formula_pairs():
+    # every (premises, conclusion) pair of two distinct good formulas
+    rows = _fall('SELECT id FROM logic WHERE good = 1')
+    if isinstance(rows, Error):
+        return rows
+    fids = [fid for fid, in rows]
+    return [([p], c) for p in fids for c in fids if p != c]
+
+
+# Processes of prove_many. They are spawned rather than forked: a fork of
+# the threaded server could copy locks held by other threads (sqlite3,
+# jigg daemon) and leave the child waiting on them forever.
+_prove_context = multiprocessing.get_context('spawn')
+_prove_pool = None
+_prove_pool_size = None
+# one batch at a time uses the pool
+_prove_pool_lock = threading.Lock()
+
+
+def _get_prove_pool(ncores):
+    # created on the first batch and kept for the next ones,
+    # since spawned processes have to import everything again
+    global _prove_pool, _prove_pool_size
+    if _prove_pool is None or _prove_pool_size != ncores:
+        _terminate_prove_pool()
+        _prove_pool = _prove_context.Pool(processes=ncores)
+        _prove_pool_size = ncores
+    return _prove_pool
+
+
+def _terminate_prove_pool():
+    global _prove_pool, _prove_pool_size
+    if _prove_pool is not None:
+        _prove_pool.terminate()
+        _prove_pool.join()
+    _prove_pool = None
+    _prove_pool_size = None
+
+
+def _prove_result_text(premises, conclusion, dls, timeout):
+    # runs in the processes of prove_many: arguments are plain strings
     try:
-        c.execute(sqquery)
-        ret = c.fetchall()
-        conn.close()
+        result_bool = prove(premises, conclusion, dls, timeout)
+    except TimeoutExpired:
+        return 'timed out'
+    return 'proved' if result_bool else 'not proved'
+
+
+def prove_many(pairs=None, ncores=4, timeout=100):
+    """
+    Tries to prove many (premises_id, conclusion_id) pairs, or every pair
+    of good formulas when pairs is None. Pairs with identical formulas are
+    proved only once, in ncores processes, and all theorem rows are written
+    in a single transaction. Returns a list of
+    (premises_id, conclusion_id, result_text), or an Error.
+    """
+    if pairs is None:
+        pairs = all_formula_pairs()
+        if isinstance(pairs, Error):
+            return pairs
+    # dedupe pairs of ids, then pairs of formulas
+    pairs = list(OrderedDict.fromkeys(
+        (tuple(premises_id), conclusion_id)
+        for premises_id, conclusion_id in pairs))
+    results = [None] * len(pairs)
+    problems = OrderedDict()
+    for i, (premises_id, conclusion_id) in enumerate(pairs):
+        premises, conclusion, dls, error_list = _fetch_problem(premises_id,
+                                                               conclusion_id)
+        if len(error_list) > 0:
+            results[i] = f'error: {error_list[0]}'
+            continue
+        key = (tuple(premises), conclusion, '\n'.join(dls))
+        problems.setdefault(key, []).append(i)
+    if ncores <= 1:
+        verdicts = {key: _prove_result_text(list(key[0]), key[1], [key[2]],
+                                            timeout)
+                    for key in problems}
+    else:
+        verdicts = {}
+        with _prove_pool_lock:
+            pool = _get_prove_pool(ncores)
+            async_results = [(key, pool.apply_async(
+                                  _prove_result_text,
+                                  (list(key[0]), key[1], [key[2]], timeout)))
+                             for key in problems]
+            timed_out = False
+            for key, async_result in async_results:
+                try:
+                    verdicts[key] = async_result.get(timeout + kTimeoutMargin)
+                except TimeoutError:
+                    verdicts[key] = 'timed out'
+                    timed_out = True
+            # workers that are still stuck are killed,
+            # and the next batch starts a new pool
+            if timed_out:
+                _terminate_prove_pool()
+    for key, indices in problems.items():
+        for i in indices:
+            results[i] = verdicts[key]
+    rows = [(list(premises_id), conclusion_id, result_text)
+            for (premises_id, conclusion_id), result_text
+            in zip(pairs, results)]
+    success = register_theorems(
+        [row for row in rows if not row[2].startswith('error')])
+    if success is not True:
+        return success
+    return rows
+
+
+def _fall(sqquery, arg_tuple=()):
+    try:
+        ret = _conn().execute(sqquery, arg_tuple).fetchall()
     except Error as e:
-        conn.close()
         return e
     return ret
 
@@ -179,16 +452,8 @@ def info_logic():
 
 
 def info_formulas_from_jid(jid):
-    conn = connect(DBPATH)
-    c = conn.cursor()
-    try:
-        c.execute('SELECT id, formula, types, good FROM logic WHERE jid = ?',
-                  (jid,))
-        formulas = c.fetchall()
-        conn.close()
-    except Error as e:
-        conn.close()
-        return e
+    formulas = _fall('SELECT id, formula, types, good FROM logic WHERE jid = ?',
+                     (jid,))
     return formulas
 
 
@@ -197,18 +462,85 @@ def info_theorem():
     return theorems
 
 
-def delete(table, id_):
-    conn = connect(DBPATH)
-    c = conn.cursor()
+def current_revision():
     try:
-        c.execute(f'DELETE FROM {table} WHERE id = ? ',
-                  (id_,))
-        conn.commit()
-        conn.close()
+        rev = _conn().execute('SELECT max(rev) FROM changes').fetchone()[0]
     except Error as e:
-        conn.close()
         return e
-    return True
+    return rev or 0
+
+
+def page_table(table, offset=0, limit=100, filters=None, query=None):
+    """
+    Returns (rows, total) for one page of a table, in order of id.
+    filters maps column names to required values, and query is a substring
+    that the text column of the table (japanese, formula or result) must
+    contain. Returns an Error if the query fails.
+    """
+    columns = TABLE_COLUMNS[table]
+    conditions, args = [], []
+    for column, value in (filters or {}).items():
+        if column not in columns:
+            return Error(f'no column {column} in {table}')
+        conditions.append(f'{column} = ?')
+        args.append(value)
+    if query:
+        text_column = {'japanese': 'japanese', 'logic': 'formula',
+                       'theorem': 'result'}[table]
+        conditions.append(f'{text_column} LIKE ?')
+        args.append(f'%{query}%')
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+    limit = max(0, min(limit, kMaxPageSize))
+    total = _fall(f'SELECT count(*) FROM {table}{where}', tuple(args))
+    if isinstance(total, Error):
+        return total
+    rows = _fall(f"SELECT {', '.join(columns)} FROM {table}{where} "
+                 f"ORDER BY id LIMIT ? OFFSET ?",
+                 tuple(args) + (limit, max(0, offset)))
+    if isinstance(rows, Error):
+        return rows
+    return rows, total[0][0]
+
+
+def changes_since(rev):
+    """
+    Returns (current revision, changed rows, deleted ids) of the changes
+    after revision rev. Changed rows and deleted ids are dicts keyed by
+    table name, with the current content of rows inserted or updated.
+    Returns None if some of those changes are no longer in the changes
+    table (see kMaxChanges): the client has to fetch all tables again.
+    """
+    current = current_revision()
+    if isinstance(current, Error):
+        return current
+    oldest = _fall('SELECT min(rev) FROM changes')
+    if isinstance(oldest, Error):
+        return oldest
+    if oldest[0][0] is not None and rev < oldest[0][0] - 1:
+        return None
+    changed, deleted = {}, {}
+    for table, columns in TABLE_COLUMNS.items():
+        ids = _fall('''SELECT DISTINCT row_id FROM changes
+                    WHERE tbl = ? AND rev > ? AND rev <= ?''',
+                    (table, rev, current))
+        if isinstance(ids, Error):
+            return ids
+        rows = _fall(f'''SELECT {', '.join(columns)} FROM {table}
+                     WHERE id IN (SELECT row_id FROM changes
+                     WHERE tbl = ? AND rev > ? AND rev <= ?) ORDER BY id''',
+                     (table, rev, current))
+        if isinstance(rows, Error):
+            return rows
+        changed[table] = rows
+        present = set(row[0] for row in rows)
+        deleted[table] = sorted(row_id for row_id, in ids
+                                if row_id not in present)
+    return current, changed, deleted
+
+
+def delete(table, id_):
+    return _ex(f'DELETE FROM {table} WHERE id = ? ',
+               (id_,))
 
 
 def dumptable(filename):
@@ -230,17 +562,32 @@ def load_alltable(jsonfilename):
     jatable = loaded_json['jatable']
     lotable = loaded_json['lotable']
     thtable = loaded_json['thtable']
-    for _, japanese in jatable:
-        _ex('INSERT INTO japanese (japanese) VALUES (?)',
-            japanese)
+    _exmany('INSERT INTO japanese (japanese) VALUES (?)',
+            [(japanese,) for _, japanese in jatable])
 
-    for _, jid, formula, types, good in lotable:
-        _ex('''INSERT INTO logic (jid, formula, types, good)
+    _exmany('''INSERT INTO logic (jid, formula, types, good)
             VALUES (?, ?, ?, ?)''',
-            (jid, formula, types, good))
+            [(jid, formula, types, good)
+             for _, jid, formula, types, good in lotable])
 
-    for _, premises_id_text, c_id, result_text in thtable:
-        _ex('''INSERT INTO theorem (premises, conclusion, result)
+    _exmany('''INSERT INTO theorem (premises, conclusion, result)
             VALUES (?, ?, ?)''',
-            (premises_id_text, c_id, result_text))
+            [(premises_id_text, c_id, result_text)
+             for _, premises_id_text, c_id, result_text in thtable])
     return
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Try to prove every pair of good formulas in the database.')
+    parser.add_argument('--db', nargs='?', type=str, default=str(DBPATH))
+    parser.add_argument('--ncores', nargs='?', type=int, default="4")
+    parser.add_argument('--timeout', nargs='?', type=int, default="100")
+    args = parser.parse_args()
+    DBPATH = Path(args.db)
+    rows = prove_many(ncores=args.ncores, timeout=args.timeout)
+    if isinstance(rows, Error):
+        raise SystemExit(f'Fail to prove: {rows}')
+    for premises_id, conclusion_id, result_text in rows:
+        print(f"{'&'.join(map(str, premises_id))}->{conclusion_id}: "
+              f"{result_text}")
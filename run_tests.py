@@ -19,14 +19,29 @@ import unittest
 
 from scripts.abduction_tools_test import GetPremisesThatMatchConclusionArgsTestCase
 from scripts.abduction_tools_test import GetTreePredArgsTestCase
+from scripts.abduction_tools_test import FilterWrongAxiomsTestCase
+from scripts.abduction_tools_test import FilterWrongAxiomsCoqtopTestCase
 from scripts.category_test import CategoryTestCase
+from scripts.checkpoint_test import ProofCheckpointTestCase
+from scripts.wordnet_index_test import WordnetIndexTestCase
+from scripts.normalization_test import NormalizationTestCase
+from scripts.resources_test import ResourcesTestCase
+from scripts.coqtop_pool_test import CoqtopPoolTestCase
+from scripts.coqtop_pool_test import CoqtopPoolCoqtopTestCase
 from scripts.ccg2lambda_tools_test import AssignSemanticsToCCGTestCase
 from scripts.ccg2lambda_tools_test import AssignSemanticsToCCGWithFeatsTestCase
 from scripts.ccg2lambda_tools_test import get_attributes_from_ccg_node_recursivelyTestCase
+from scripts.ccg2lambda_tools_test import SubtreeSemanticsCacheTestCase
 from scripts.ccg2lambda_tools_test import TypeRaiseTestCase
+from scripts.etree_utils_test import ProcessXmlStreamTestCase
 from scripts.knowledge_test import LexicalRelationsTestCase
 from scripts.nltk2coq_test import Nltk2coqTestCase
+from scripts.nltk2coq_test import CoqStringCacheTestCase
+from scripts.proof_cache_test import ProofCacheTestCase
+from scripts.semantic_index_test import CompositionMemoTestCase
+from scripts.semantic_index_test import FindNodeByIdTestCase
 from scripts.semantic_index_test import GetSemanticRepresentationTestCase
+from scripts.semantic_index_test import RuleIndexTestCase
 from scripts.semantic_tools_test import resolve_prefix_to_infix_operationsTestCase
 from scripts.semantic_types_test import ArbiAutoTypesTestCase
 from scripts.semantic_types_test import build_arbitrary_dynamic_libraryTestCase
@@ -34,6 +49,11 @@ from scripts.semantic_types_test import build_dynamic_libraryTestCase
 from scripts.semantic_types_test import Coq2NLTKTypesTestCase
 from scripts.semantic_types_test import Coq2NLTKSignaturesTestCase
 from scripts.semantic_types_test import combine_signatures_or_rename_predsTestCase
+from scripts.semantic_types_test import remove_colliding_predicatesTestCase
+from scripts.semantic_types_test import infer_signatureTestCase
+from scripts.semparse_test import SemanticParseSentencesTestCase
+from scripts.theorem_test import FailureLogTestCase
+from scripts.theorem_test import MasterTheoremProveParTestCase
 
 if __name__ == '__main__':
     suite1  = unittest.TestLoader().loadTestsFromTestCase(AssignSemanticsToCCGTestCase)
@@ -53,7 +73,32 @@ if __name__ == '__main__':
     suite15 = unittest.TestLoader().loadTestsFromTestCase(GetPremisesThatMatchConclusionArgsTestCase)
     suite16 = unittest.TestLoader().loadTestsFromTestCase(combine_signatures_or_rename_predsTestCase)
     suite17 = unittest.TestLoader().loadTestsFromTestCase(CategoryTestCase)
+    suite18 = unittest.TestLoader().loadTestsFromTestCase(CoqtopPoolTestCase)
+    suite19 = unittest.TestLoader().loadTestsFromTestCase(ProofCacheTestCase)
+    suite20 = unittest.TestLoader().loadTestsFromTestCase(RuleIndexTestCase)
+    suite21 = unittest.TestLoader().loadTestsFromTestCase(SemanticParseSentencesTestCase)
+    suite22 = unittest.TestLoader().loadTestsFromTestCase(ProcessXmlStreamTestCase)
+    suite23 = unittest.TestLoader().loadTestsFromTestCase(FindNodeByIdTestCase)
+    suite24 = unittest.TestLoader().loadTestsFromTestCase(CompositionMemoTestCase)
+    suite25 = unittest.TestLoader().loadTestsFromTestCase(SubtreeSemanticsCacheTestCase)
+    suite26 = unittest.TestLoader().loadTestsFromTestCase(MasterTheoremProveParTestCase)
+    suite27 = unittest.TestLoader().loadTestsFromTestCase(FailureLogTestCase)
+    suite28 = unittest.TestLoader().loadTestsFromTestCase(ProofCheckpointTestCase)
+    suite29 = unittest.TestLoader().loadTestsFromTestCase(WordnetIndexTestCase)
+    suite30 = unittest.TestLoader().loadTestsFromTestCase(NormalizationTestCase)
+    suite31 = unittest.TestLoader().loadTestsFromTestCase(ResourcesTestCase)
+    suite32 = unittest.TestLoader().loadTestsFromTestCase(CoqStringCacheTestCase)
+    suite33 = unittest.TestLoader().loadTestsFromTestCase(FilterWrongAxiomsTestCase)
+    suite34 = unittest.TestLoader().loadTestsFromTestCase(remove_colliding_predicatesTestCase)
+    suite35 = unittest.TestLoader().loadTestsFromTestCase(FilterWrongAxiomsCoqtopTestCase)
+    suite36 = unittest.TestLoader().loadTestsFromTestCase(CoqtopPoolCoqtopTestCase)
+    suite37 = unittest.TestLoader().loadTestsFromTestCase(infer_signatureTestCase)
     suites  = unittest.TestSuite([suite1, suite2, suite3, suite4, suite5, suite6,
                                   suite7, suite8, suite9, suite10, suite11, suite12,
-                                  suite13, suite14, suite15, suite16, suite17])
+                                  suite13, suite14, suite15, suite16, suite17,
+                                  suite18, suite19, suite20, suite21, suite22, suite23,
+                                  suite24, suite25, suite26, suite27,
+                                  suite28, suite29, suite30, suite31,
+                                  suite32, suite33, suite34, suite35,
+                                  suite36, suite37])
     unittest.TextTestRunner(verbosity=2).run(suites)
@@ -15,13 +15,23 @@
 #  limitations under the License.
 
 from collections import OrderedDict
+import logging
+import re
+import subprocess
 
 from .coq_analyzer import get_predicate_arguments
 from .knowledge import get_lexical_relations_from_preds
+from .theorem import get_theorem_line
 from .theorem import insert_axioms_in_coq_script
 from .theorem import is_theorem_error
 from .theorem import run_coq_script
 
+# Seconds that coqtop may take to check each axiom.
+kAxiomCheckTimeout = 2
+kAxiomSentinelPrefix = 'ccg2lambda_axiom_check_'
+kAxiomCheckMark = 'ccg2lambda_axiom_check_mark'
+kAxiomSentinelRegex = re.compile(kAxiomSentinelPrefix + r'(\d+)\b')
+
 def make_axioms_from_premises_and_conclusion(premises, conclusion, coq_output_lines=None):
     matching_premises = get_premises_that_match_conclusion_args(
         premises, conclusion)
@@ -74,6 +84,25 @@ def try_abductions(theorem):
 
 
 def filter_wrong_axioms(axioms, coq_script):
+    """
+    Returns the axioms that coqtop accepts (e.g. without type mismatches)
+    in the context of coq_script. All axioms are checked in a single coqtop
+    run. If that run does not complete, each axiom is checked separately.
+    """
+    axioms = sorted(axioms)
+    if not axioms:
+        return set()
+    try:
+        axiom_errors = find_axiom_errors(axioms, coq_script)
+    except subprocess.TimeoutExpired:
+        axiom_errors = None
+    if axiom_errors is None:
+        logging.info('Checking {0} axioms one by one'.format(len(axioms)))
+        return filter_wrong_axioms_one_by_one(axioms, coq_script)
+    return set(axiom for axiom, has_error in zip(axioms, axiom_errors)
+               if not has_error)
+
+def filter_wrong_axioms_one_by_one(axioms, coq_script):
     good_axioms = set()
     for axiom in axioms:
         new_coq_script = insert_axioms_in_coq_script(set([axiom]), coq_script)
@@ -84,6 +113,62 @@ def filter_wrong_axioms(axioms, coq_script):
             good_axioms.add(axiom)
     return good_axioms
 
+def make_axiom_check_script(axioms, coq_script):
+    """
+    Returns the part of coq_script before the theorem (coqlib and the
+    dynamic library), followed, for each axiom, by the axiom, its hint and
+    the theorem with its tactics, as in filter_wrong_axioms_one_by_one.
+    After each theorem, the state is reset to a mark set after the library,
+    so that axioms do not see each other. A Locate of a numbered sentinel
+    follows the library, each theorem and each reset, so that the output
+    of each axiom can be told apart.
+    """
+    coq_script_lines = coq_script.split('\n')
+    theorem_line = get_theorem_line(coq_script_lines)
+    check_lines = coq_script_lines[:theorem_line]
+    check_lines.extend([
+        'Definition {0} := True.'.format(kAxiomCheckMark),
+        'Locate {0}0.'.format(kAxiomSentinelPrefix)])
+    for i, axiom in enumerate(axioms, 1):
+        check_lines.append(axiom)
+        check_lines.append('Hint Resolve {0}.'.format(axiom.split()[1]))
+        check_lines.extend(coq_script_lines[theorem_line:])
+        check_lines.extend([
+            'Locate {0}{1}.'.format(kAxiomSentinelPrefix, 2 * i - 1),
+            'Abort All.',
+            'Reset {0}.'.format(kAxiomCheckMark),
+            'Definition {0} := True.'.format(kAxiomCheckMark),
+            'Locate {0}{1}.'.format(kAxiomSentinelPrefix, 2 * i)])
+    return '\n'.join(check_lines)
+
+def find_axiom_errors(axioms, coq_script):
+    """
+    Checks all axioms in a single coqtop run. Returns a list with whether
+    each axiom has an error, or None if the output of coqtop is incomplete.
+    An error in the library counts as an error of every axiom, as when
+    checking them separately.
+    """
+    check_script = make_axiom_check_script(axioms, coq_script)
+    output_lines = run_coq_script(
+        check_script, timeout=kAxiomCheckTimeout * len(axioms))
+    # segment 0 has the output of the library, segment 2i-1 that of axiom i
+    # and segment 2i that of the reset after it.
+    segments = [[] for _ in range(2 * len(axioms) + 1)]
+    num_sentinels = 0
+    current_segment = 0
+    for line in output_lines:
+        match = kAxiomSentinelRegex.search(line)
+        if match and 'Locate' not in line:
+            num_sentinels += 1
+            current_segment = int(match.group(1)) + 1
+        elif current_segment < len(segments):
+            segments[current_segment].append(line)
+    if num_sentinels != len(segments):
+        return None
+    if is_theorem_error(segments[0]):
+        return [True] * len(axioms)
+    return [is_theorem_error(segment) for segment in segments[1::2]]
+
 
 def make_axioms_from_coq_analysis(failure_log):
     axioms = set()
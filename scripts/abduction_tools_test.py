@@ -15,8 +15,12 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+import shutil
+import subprocess
 import unittest
 
+from . import abduction_tools
+from .abduction_tools import filter_wrong_axioms
 from .coq_analyzer import get_tree_pred_args
 from .coq_analyzer import get_premises_that_match_conclusion_args
 from .tree_tools import tree_or_string
@@ -127,9 +131,118 @@ class GetPremisesThatMatchConclusionArgsTestCase(unittest.TestCase):
             premise_lines, conclusion_line)
         self.assertEqual(expected_premises, matching_premises)
 
+def fake_coqtop(coq_script, timeout=100):
+    """
+    Imitates the output of coqtop for scripts made of Parameter, Axiom,
+    Hint, Theorem, Reset and Locate commands: axioms with "bad" in their
+    name give a type error.
+    """
+    output_lines = []
+    for line in coq_script.split('\n'):
+        if line.startswith('Locate '):
+            output_lines.append('Coq < No object of basename ' + line.split()[1].rstrip('.'))
+        elif line.startswith('Axiom ') and 'bad' in line:
+            output_lines.extend([
+                'Coq < Toplevel input, characters 30-34:',
+                '> ' + line,
+                '>                              ^^^^',
+                'Error: The term "x" has type "Event" while it is expected to have type "Entity".'])
+        elif line.startswith('Theorem '):
+            output_lines.append('Coq < t1 is defined')
+    return output_lines
+
+class FilterWrongAxiomsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.run_coq_script = abduction_tools.run_coq_script
+        self.scripts = []
+        def run_coq_script(coq_script, timeout=100):
+            self.scripts.append(coq_script)
+            return fake_coqtop(coq_script, timeout)
+        abduction_tools.run_coq_script = run_coq_script
+        self.coq_script = '\n'.join([
+            'Require Export coqlib.',
+            'Parameter _dog : Entity -> Prop.',
+            'Parameter _animal : Entity -> Prop.',
+            'Theorem t1: forall x, (_dog x) -> (_animal x). nltac. Qed.'])
+        self.axioms = set([
+            'Axiom ax_hyponym_dog_animal : forall x, _dog x -> _animal x.',
+            'Axiom ax_bad_dog_animal : forall x : Event, _dog x -> _animal x.'] +
+            ['Axiom ax_{0} : forall x, _dog x -> _animal x.'.format(i) for i in range(12)])
+
+    def tearDown(self):
+        abduction_tools.run_coq_script = self.run_coq_script
+
+    def test_axioms_checked_in_one_run(self):
+        good_axioms = filter_wrong_axioms(self.axioms, self.coq_script)
+        self.assertEqual(1, len(self.scripts))
+        self.assertEqual(len(self.axioms), self.scripts[0].count('Theorem t1'))
+        self.assertEqual(
+            set(a for a in self.axioms if 'bad' not in a), good_axioms)
+
+    def test_same_axioms_as_one_by_one(self):
+        good_axioms = filter_wrong_axioms(self.axioms, self.coq_script)
+        self.assertEqual(
+            abduction_tools.filter_wrong_axioms_one_by_one(self.axioms, self.coq_script),
+            good_axioms)
+
+    def test_library_error(self):
+        coq_script = self.coq_script.replace(
+            'Parameter _dog', 'Axiom bad_parameter : True.\nParameter _dog')
+        self.assertEqual(set(), filter_wrong_axioms(self.axioms, coq_script))
+
+    def test_timeout_checks_one_by_one(self):
+        def run_coq_script(coq_script, timeout=100):
+            self.scripts.append(coq_script)
+            if abduction_tools.kAxiomCheckMark in coq_script:
+                raise subprocess.TimeoutExpired('coqtop', timeout)
+            return fake_coqtop(coq_script, timeout)
+        abduction_tools.run_coq_script = run_coq_script
+        good_axioms = filter_wrong_axioms(self.axioms, self.coq_script)
+        self.assertEqual(1 + len(self.axioms), len(self.scripts))
+        self.assertEqual(
+            set(a for a in self.axioms if 'bad' not in a), good_axioms)
+
+    def test_no_axioms(self):
+        self.assertEqual(set(), filter_wrong_axioms(set(), self.coq_script))
+        self.assertEqual([], self.scripts)
+
+@unittest.skipIf(shutil.which('coqtop') is None, 'coqtop is not installed')
+class FilterWrongAxiomsCoqtopTestCase(unittest.TestCase):
+    def setUp(self):
+        self.coq_script = '\n'.join([
+            'Parameter Entity : Type.',
+            'Parameter Event : Type.',
+            'Parameter _dog : Entity -> Prop.',
+            'Parameter _animal : Entity -> Prop.',
+            'Theorem t1: forall x, (_dog x) -> (_animal x). intros. auto. Qed.'])
+        # ax_dup is declared twice: only a reset between axioms accepts both.
+        self.axioms = set([
+            'Axiom ax_bad_dog_animal : forall x : Event, _dog x -> _animal x.',
+            'Axiom ax_dup : forall x, _dog x -> _animal x.',
+            'Axiom ax_dup : forall x : Entity, _dog x -> _animal x.',
+            'Axiom ax_dog_dog : forall x, _dog x -> _dog x.'])
+
+    def test_same_axioms_as_one_by_one(self):
+        axiom_errors = abduction_tools.find_axiom_errors(
+            sorted(self.axioms), self.coq_script)
+        self.assertIsNotNone(axiom_errors)
+        good_axioms = filter_wrong_axioms(self.axioms, self.coq_script)
+        self.assertEqual(
+            abduction_tools.filter_wrong_axioms_one_by_one(self.axioms, self.coq_script),
+            good_axioms)
+        self.assertNotIn(
+            'Axiom ax_bad_dog_animal : forall x : Event, _dog x -> _animal x.',
+            good_axioms)
+        self.assertIn('Axiom ax_dup : forall x, _dog x -> _animal x.', good_axioms)
+        self.assertIn(
+            'Axiom ax_dup : forall x : Entity, _dog x -> _animal x.', good_axioms)
+
 if __name__ == '__main__':
     suite1 = unittest.TestLoader().loadTestsFromTestCase(GetTreePredArgsTestCase)
     suite2 = unittest.TestLoader().loadTestsFromTestCase(
         GetPremisesThatMatchConclusionArgsTestCase)
-    suites = unittest.TestSuite([suite1, suite2])
+    suite3 = unittest.TestLoader().loadTestsFromTestCase(FilterWrongAxiomsTestCase)
+    suite4 = unittest.TestLoader().loadTestsFromTestCase(
+        FilterWrongAxiomsCoqtopTestCase)
+    suites = unittest.TestSuite([suite1, suite2, suite3, suite4])
     unittest.TextTestRunner(verbosity=2).run(suites)
@@ -14,33 +14,57 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+from functools import lru_cache
 from nltk import FeatStruct
 import re
 
+kCategoryCacheSize = 10000
+kMatchCacheSize = 100000
+
 class Category(object):
     """ Implements a CCG syntactic category with features. """
 
     def __init__(self, category):
         if isinstance(category, self.__class__):
+            self.category_str = category.category_str
             self.types = category.types
             self.type_features = category.type_features
+            self._types_regex = category._types_regex
         else:
+            self.category_str = category
             self.types = remove_feats_from_category(category)
             self.type_features = get_feats_from_category(category)
+            self._types_regex = None
 
     def __repr__(self):
         return "Types: {0}\tFeats: {1}".format(self.types, self.type_features)
 
+    @property
+    def types_regex(self):
+        """
+        Regular expression that recognizes the types of other categories,
+        where a bar "|" stands for either a forward or a backward slash.
+        It is compiled only once per category.
+        """
+        if self._types_regex is None:
+            self._types_regex = compile_types_regex(self.types)
+        return self._types_regex
+
     def match(self, other):
+        """
+        Whether this (template) category matches the other category.
+        Results are memoized on the pair of category strings.
+        """
+        if not isinstance(other, self.__class__):
+            return False
+        return match_categories(self.category_str, other.category_str)
+
+    def match_uncached(self, other):
         if not isinstance(other, self.__class__):
             return False
         if len(self.type_features) != len(other.type_features):
             return False
-        # TODO: Ideally these substitutions should be precomputed for speed-up.
-        types = re.sub(r'\\', r'\\\\', self.types)
-        types = types.replace('|', '[/\\\]')
-        types = types.replace('(', '\\(').replace(')', '\\)')
-        if not re.fullmatch(types, other.types):
+        if not self.types_regex.fullmatch(other.types):
             return False
         return all([a.subsumes(b)
                     for (a, b) in zip(self.type_features, other.type_features)])
@@ -55,6 +79,25 @@ class Category(object):
     def get_num_args(self):
         return len(self.type_features) - 1
 
+@lru_cache(maxsize=kCategoryCacheSize)
+def get_category(category_str):
+    """
+    Returns an interned Category for `category_str`. Interned categories
+    are shared and should not be modified.
+    """
+    return Category(category_str)
+
+@lru_cache(maxsize=kMatchCacheSize)
+def match_categories(template_category_str, category_str):
+    return get_category(template_category_str).match_uncached(
+        get_category(category_str))
+
+def compile_types_regex(types):
+    types = re.sub(r'\\', r'\\\\', types)
+    types = types.replace('|', r'[/\\]')
+    types = types.replace('(', '\\(').replace(')', '\\)')
+    return re.compile(types)
+
 def get_feats_from_category(category):
     r""" Returns the features of the syntactic category.
     category="S[mod=nm,form=base]" --> feats=['[mod=nm,form=base]']
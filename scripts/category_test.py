@@ -18,6 +18,8 @@
 import unittest
 
 from .category import Category
+from .category import get_category
+from .category import match_categories
 
 class CategoryTestCase(unittest.TestCase):
     def test_category_matches(self):
@@ -104,6 +106,27 @@ class CategoryTestCase(unittest.TestCase):
         cat2 =  Category('(NP/NP)\\NP')
         self.assertTrue(cat1.match(cat2))
 
+    def test_copied_category_matches(self):
+        cat1 =  Category(Category('NP|NP'))
+        cat2 =  Category('NP\\NP')
+        self.assertTrue(cat1.match(cat2))
+
+    def test_interned_category_is_shared(self):
+        cat1 =  get_category('S[mod=nm]/NP')
+        cat2 =  get_category('S[mod=nm]/NP')
+        self.assertIs(cat1, cat2)
+
+    def test_memoized_match_agrees_with_uncached(self):
+        pairs = [('NP|NP', 'NP\\NP'),
+                 ('NP/NP', 'NP/NPZ'),
+                 ('S', 'S[mod=nm]'),
+                 ('S[mod=nm]', 'S'),
+                 ('S[mod=nm]\\NP', 'S[mod=nm,form=base]\\NP[case=ga]')]
+        for template_str, category_str in pairs:
+            expected = Category(template_str).match_uncached(Category(category_str))
+            self.assertEqual(expected, match_categories(template_str, category_str))
+            self.assertEqual(expected, Category(template_str).match(Category(category_str)))
+
 
 if __name__ == '__main__':
     suite1 = unittest.TestLoader().loadTestsFromTestCase(CategoryTestCase)
@@ -24,6 +24,9 @@ from nltk.sem.logic import ConstantExpression
 from .logic_parser import lexpr
 from .normalization import normalize_token
 from .semantic_index import find_node_by_id
+from .semantic_index import get_attributes_from_ccg_node_recursively
+from .semantic_index import CompositionMemo
+from .semantic_index import get_node_semantics
 
 def build_ccg_tree(ccg_xml, root_id=None):
     """
@@ -67,13 +70,75 @@ def normalize_tokens(tokens):
             token.set('surf', surf_normalized)
     return tokens
 
-def assign_semantics_to_ccg(ccg_xml, semantic_index, tree_index=1):
+class SubtreeSemanticsCache(object):
+    """
+    Semantics of the subtrees of the (n-best) CCG trees of one sentence.
+    Subtrees are identified by a signature of their span, category, rule
+    and other attributes (except node IDs) and by the signatures of their
+    children, so that the semantics of a subtree shared by several trees
+    are composed only once. Normalized tokens are also shared.
+    """
+
+    def __init__(self):
+        self.tokens = None
+        self.signature_ids = {}
+        self.node_signatures = {}
+        self.semantics = {}
+
+    def get_tokens(self, ccg_xml):
+        if self.tokens is None:
+            self.tokens = normalize_tokens(copy.deepcopy(ccg_xml.find('.//tokens')))
+        return self.tokens
+
+    def compute_signatures(self, ccg_tree):
+        """
+        Computes signatures of all nodes in `ccg_tree`. It needs to be
+        called before semantic composition adds attributes to the nodes.
+        """
+        self.node_signatures = {}
+        self.compute_signature(ccg_tree)
+
+    def compute_signature(self, ccg_node):
+        children_signatures = tuple(self.compute_signature(c) for c in ccg_node)
+        attributes = tuple(sorted((k, v) for k, v in ccg_node.attrib.items()
+                                  if k not in ['id', 'child']))
+        signature = self.signature_ids.setdefault(
+            (attributes, children_signatures), len(self.signature_ids))
+        self.node_signatures[ccg_node] = signature
+        return signature
+
+    def store(self, ccg_node, exprs):
+        signature = self.node_signatures[ccg_node]
+        self.semantics[signature] = (
+            exprs.get(ccg_node), ccg_node.get('coq_type'))
+
+    def restore(self, ccg_node, exprs, tokens):
+        """
+        Assigns the cached semantics to all nodes of the subtree rooted at
+        `ccg_node`. It returns False if the subtree has not been composed yet.
+        """
+        if self.node_signatures[ccg_node] not in self.semantics:
+            return False
+        for node in ccg_node.iter():
+            expr, coq_type = self.semantics[self.node_signatures[node]]
+            if coq_type is not None:
+                node.set('coq_type', coq_type)
+            exprs[node] = expr
+        get_attributes_from_ccg_node_recursively(ccg_node, tokens)
+        return True
+
+def assign_semantics_to_ccg(ccg_xml, semantic_index, tree_index=1,
+                            subtree_cache=None, memo=None):
     """
     This is the key function. It builds first an XML tree structure with
     the CCG tree, and then assigns semantics (lambda expressions) to each node
     in post-order (first assigns semantics to children, and then to node).
     It returns a CCG lxml tree structure with a new 'sem' field that
     contains the semantics at each node.
+    If given, `subtree_cache` (a SubtreeSemanticsCache) is used to reuse
+    the semantics of subtrees across calls for the same sentence, and
+    `memo` (a CompositionMemo) to share compositions across the sentences
+    of a document.
     """
     # If the use of gold trees is requested, we get the gold tree index
     # from the XML attribute 'gold_tree'. Note that in xpath, lists are
@@ -90,9 +155,17 @@ def assign_semantics_to_ccg(ccg_xml, semantic_index, tree_index=1):
     ccg_flat_tree = copy.deepcopy(ccg_flat_trees[0])
     #   ccg_xml.xpath('./ccg[{0}]'.format(tree_index))[0])
     ccg_tree = build_ccg_tree(ccg_flat_tree)
-    tokens = copy.deepcopy(ccg_xml.find('.//tokens'))
-    tokens = normalize_tokens(tokens)
-    assign_semantics(ccg_tree, semantic_index, tokens)
+    if subtree_cache is None:
+        tokens = copy.deepcopy(ccg_xml.find('.//tokens'))
+        tokens = normalize_tokens(tokens)
+    else:
+        tokens = subtree_cache.get_tokens(ccg_xml)
+        subtree_cache.compute_signatures(ccg_tree)
+    if memo is None:
+        memo = CompositionMemo()
+    exprs = {}
+    assign_semantics(ccg_tree, semantic_index, tokens, exprs, subtree_cache, memo)
+    set_semantics_strings(ccg_tree, exprs)
     return ccg_tree
 
 def is_forward_operation(ccg_tree):
@@ -142,7 +215,8 @@ def type_raise(function, order = 1):
         type_raised_function = type_raiser(function).simplify()
     return type_raised_function
 
-def combine_children_exprs(ccg_tree, tokens, semantic_index):
+def combine_children_exprs(ccg_tree, tokens, semantic_index, exprs=None,
+                           memo=None):
     """
     Perform forward/backward function application/combination.
     """
@@ -159,46 +233,98 @@ def combine_children_exprs(ccg_tree, tokens, semantic_index):
     else:
         coq_types = coq_types_right
     ccg_tree.set('coq_type', coq_types)
-    semantics = semantic_index.get_semantic_representation(ccg_tree, tokens)
+    if memo is None:
+        memo = CompositionMemo()
+    semantics = semantic_index.get_semantic_representation(
+        ccg_tree, tokens, exprs, memo)
     if semantics:
-        ccg_tree.set('sem', str(semantics))
+        set_node_semantics(ccg_tree, semantics, exprs)
         return None
     # Back-off mechanism in case no semantic templates are available:
     if is_forward_operation(ccg_tree):
         function_index, argument_index = 0, 1
     else:
         function_index, argument_index = 1, 0
-    function = lexpr(ccg_tree[function_index].attrib['sem'])
-    argument = lexpr(ccg_tree[argument_index].attrib['sem'])
+    function_node = ccg_tree[function_index]
+    argument_node = ccg_tree[argument_index]
+    arguments = (get_node_semantics(function_node, exprs),
+                 get_node_semantics(argument_node, exprs))
     combination_operation = get_combination_op(ccg_tree)
     if combination_operation == 'function_application':
-        evaluation = function(argument).simplify()
+        evaluation = memo.get_composition(
+            (combination_operation,), arguments,
+            lambda function, argument: function(argument).simplify())
     elif combination_operation == 'function_combination':
         num_arguments = get_num_args(ccg_tree)
-        type_raised_function = type_raise(function, num_arguments)
-        evaluation = type_raised_function(argument).simplify()
+        evaluation = memo.get_composition(
+            (combination_operation, str(num_arguments)), arguments,
+            lambda function, argument: type_raise(function, num_arguments)(
+                argument).simplify())
     else:
         assert False, 'This node should be a function application or combination'\
                       .format(etree.tostring(ccg_tree, pretty_print=True))
-    ccg_tree.set('sem', str(evaluation))
+    set_node_semantics(ccg_tree, evaluation, exprs)
     return None
 
-def assign_semantics(ccg_tree, semantic_index, tokens):
+def set_node_semantics(ccg_tree, semantics, exprs=None):
+    """
+    Keeps the expression of a CCG node in the side table `exprs`, so that
+    parent nodes do not need to parse it, and so that it is printed only once
+    by set_semantics_strings. Without side table, it sets the 'sem' attribute.
+    """
+    if exprs is None:
+        ccg_tree.set('sem', str(semantics))
+    else:
+        exprs[ccg_tree] = semantics
+
+def set_semantics_strings(ccg_tree, exprs):
+    """
+    Sets the 'sem' attribute of the nodes of `ccg_tree` that have an expression
+    in the side table `exprs`. Expressions shared by several nodes (e.g. those
+    found in the composition memo) are printed once.
+    """
+    strings = {}
+    for node in ccg_tree.iter():
+        if node not in exprs:
+            continue
+        expr = exprs[node]
+        if id(expr) not in strings:
+            strings[id(expr)] = str(expr)
+        node.set('sem', strings[id(expr)])
+
+def assign_semantics(ccg_tree, semantic_index, tokens, exprs=None,
+                     subtree_cache=None, memo=None):
     """
     Visit recursively the CCG tree in depth-first order, assigning lambda expressions
     (semantics) to each node.
     """
+    if subtree_cache is not None:
+        if exprs is None:
+            exprs = {}
+        if subtree_cache.restore(ccg_tree, exprs, tokens):
+            return
+        assign_semantics_uncached(
+            ccg_tree, semantic_index, tokens, exprs, subtree_cache, memo)
+        subtree_cache.store(ccg_tree, exprs)
+        return
+    assign_semantics_uncached(ccg_tree, semantic_index, tokens, exprs, None, memo)
+
+def assign_semantics_uncached(ccg_tree, semantic_index, tokens, exprs=None,
+                              subtree_cache=None, memo=None):
     category = ccg_tree.attrib['category']
     if len(ccg_tree) == 0:
-        semantics = semantic_index.get_semantic_representation(ccg_tree, tokens)
-        ccg_tree.set('sem', str(semantics))
+        semantics = semantic_index.get_semantic_representation(
+            ccg_tree, tokens, exprs, memo)
+        set_node_semantics(ccg_tree, semantics, exprs)
         return
     if len(ccg_tree) == 1:
-        assign_semantics(ccg_tree[0], semantic_index, tokens)
-        semantics = semantic_index.get_semantic_representation(ccg_tree, tokens)
-        ccg_tree.set('sem', str(semantics))
+        assign_semantics(
+            ccg_tree[0], semantic_index, tokens, exprs, subtree_cache, memo)
+        semantics = semantic_index.get_semantic_representation(
+            ccg_tree, tokens, exprs, memo)
+        set_node_semantics(ccg_tree, semantics, exprs)
         return
     for child in ccg_tree:
-        assign_semantics(child, semantic_index, tokens)
-    combine_children_exprs(ccg_tree, tokens, semantic_index)
+        assign_semantics(child, semantic_index, tokens, exprs, subtree_cache, memo)
+    combine_children_exprs(ccg_tree, tokens, semantic_index, exprs, memo)
     return
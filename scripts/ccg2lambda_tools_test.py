@@ -21,6 +21,7 @@ from lxml import etree
 from nltk.sem.logic import Expression
 
 from .ccg2lambda_tools import (assign_semantics_to_ccg, type_raise, build_ccg_tree)
+from .ccg2lambda_tools import SubtreeSemanticsCache
 from .logic_parser import lexpr
 from .semantic_index import (SemanticRule, SemanticIndex,
                             get_attributes_from_ccg_node_recursively, find_node_by_id)
@@ -1090,11 +1091,79 @@ class AssignSemanticsToCCGWithFeatsTestCase(unittest.TestCase):
         expected_semantics = lexpr(r'_basepred')
         self.assertEqual(expected_semantics, lexpr(semantics))
 
+class CountingSemanticIndex(SemanticIndex):
+    def __init__(self, rules):
+        super(CountingSemanticIndex, self).__init__(rules)
+        self.num_calls = 0
+
+    def get_semantic_representation(self, ccg_tree, tokens, exprs=None,
+                                    memo=None):
+        self.num_calls += 1
+        return super(CountingSemanticIndex, self).get_semantic_representation(
+            ccg_tree, tokens, exprs, memo)
+
+class SubtreeSemanticsCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.rules = [SemanticRule(r'N', r'\P.P'),
+                      SemanticRule(r'NP/N', r'\P.P'),
+                      SemanticRule(r'NP', r'\F1 F2.(F1 & F2)', {'rule' : '>'}),
+                      SemanticRule(r'NP', r'\F1 F2.(F1 | F2)', {'rule' : '<'})]
+        sentence_str = r"""
+      <sentence id="s1">
+        <tokens>
+          <token base="base1" pos="pos1" surf="surf1" id="t1_1"/>
+          <token base="base2" pos="pos2" surf="surf2" id="t1_2"/>
+          <token base="base3" pos="pos3" surf="surf3" id="t1_3"/>
+        </tokens>
+        <ccg root="sp1-5" id="s1_ccg1">
+          <span terminal="t1_1" category="NP/N" end="2" begin="1" id="sp1-1"/>
+          <span terminal="t1_2" category="N" end="3" begin="2" id="sp1-2"/>
+          <span terminal="t1_3" category="NP" end="4" begin="3" id="sp1-3"/>
+          <span child="sp1-1 sp1-2" rule="&gt;" category="NP" end="3" begin="1" id="sp1-4"/>
+          <span child="sp1-4 sp1-3" rule="&gt;" category="NP" end="4" begin="1" id="sp1-5"/>
+        </ccg>
+        <ccg root="sp2-5" id="s1_ccg2">
+          <span terminal="t1_1" category="NP/N" end="2" begin="1" id="sp2-1"/>
+          <span terminal="t1_2" category="N" end="3" begin="2" id="sp2-2"/>
+          <span terminal="t1_3" category="NP" end="4" begin="3" id="sp2-3"/>
+          <span child="sp2-1 sp2-2" rule="&gt;" category="NP" end="3" begin="1" id="sp2-4"/>
+          <span child="sp2-4 sp2-3" rule="&lt;" category="NP" end="4" begin="1" id="sp2-5"/>
+        </ccg>
+      </sentence>
+    """
+        self.sentence = etree.fromstring(sentence_str)
+
+    def test_shared_subtrees_composed_once(self):
+        semantic_index = CountingSemanticIndex(self.rules)
+        subtree_cache = SubtreeSemanticsCache()
+        ccg_tree1 = assign_semantics_to_ccg(self.sentence, semantic_index, 1, subtree_cache)
+        self.assertEqual(5, semantic_index.num_calls)
+        ccg_tree2 = assign_semantics_to_ccg(self.sentence, semantic_index, 2, subtree_cache)
+        self.assertEqual(6, semantic_index.num_calls)
+        self.assertEqual(lexpr(r'((_base1 & _base2) & _base3)'),
+                         lexpr(ccg_tree1.get('sem')))
+        self.assertEqual(lexpr(r'((_base1 & _base2) | _base3)'),
+                         lexpr(ccg_tree2.get('sem')))
+        self.assertEqual('sp2-4', ccg_tree2[0].get('id'))
+        self.assertEqual('sp2-1', ccg_tree2[0].get('child0_id'))
+
+    def test_same_attributes_as_without_cache(self):
+        semantic_index = SemanticIndex(self.rules)
+        subtree_cache = SubtreeSemanticsCache()
+        for tree_index in [1, 2, 1]:
+            ccg_tree = assign_semantics_to_ccg(
+                self.sentence, semantic_index, tree_index)
+            ccg_tree_cached = assign_semantics_to_ccg(
+                self.sentence, semantic_index, tree_index, subtree_cache)
+            for node, node_cached in zip(ccg_tree.iter(), ccg_tree_cached.iter()):
+                self.assertEqual(dict(node.attrib), dict(node_cached.attrib))
+
 if __name__ == '__main__':
     suite1 = unittest.TestLoader().loadTestsFromTestCase(TypeRaiseTestCase)
     suite2 = unittest.TestLoader().loadTestsFromTestCase(AssignSemanticsToCCGTestCase)
     suite3 = unittest.TestLoader().loadTestsFromTestCase(AssignSemanticsToCCGWithFeatsTestCase)
     suite4 = unittest.TestLoader().loadTestsFromTestCase(
         get_attributes_from_ccg_node_recursivelyTestCase)
-    suites = unittest.TestSuite([suite1, suite2, suite3, suite4])
+    suite5 = unittest.TestLoader().loadTestsFromTestCase(SubtreeSemanticsCacheTestCase)
+    suites = unittest.TestSuite([suite1, suite2, suite3, suite4, suite5])
     unittest.TextTestRunner(verbosity=2).run(suites)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import json
+import logging
+import os
+
+class ProofCheckpoint(object):
+    """
+    Append-only journal of the proof nodes of completed documents, one JSON
+    object per line: {"index": ..., "id": ..., "proof": "<proof ...>"}.
+    The index is the position of the document in the input, and the id its
+    "id" attribute, which must match when the journal is read back.
+    With `resume`, the proofs of an existing journal are loaded and new ones
+    are appended. Otherwise the journal is started anew, which is refused
+    (ValueError) if it already has proofs, unless `overwrite` is given.
+    """
+
+    def __init__(self, path, resume=False, overwrite=False):
+        self.path = path
+        self.proofs = {}
+        if resume and os.path.exists(path):
+            self.load()
+        elif not resume and not overwrite and is_non_empty_file(path):
+            raise ValueError(
+                'Checkpoint {0} already has proofs.'.format(path))
+        self.fout = open(path, 'a' if resume else 'w', encoding='utf-8')
+        if resume and not ends_with_newline(path):
+            self.fout.write('\n')
+
+    def load(self):
+        with open(self.path, 'r', encoding='utf-8') as fin:
+            for line_num, line in enumerate(fin, 1):
+                try:
+                    entry = json.loads(line)
+                    self.proofs[entry['index']] = (entry['id'], entry['proof'])
+                except (ValueError, KeyError, TypeError):
+                    # e.g. the last line of a run that was killed while writing.
+                    logging.warning('Ignoring line {0} of checkpoint {1}'.format(
+                        line_num, self.path))
+
+    def get(self, index, doc_id):
+        """
+        Returns the serialized proof node of a document, or None.
+        """
+        if index not in self.proofs:
+            return None
+        stored_id, proof = self.proofs[index]
+        if stored_id != doc_id:
+            logging.warning(
+                'Checkpoint {0} has document {1} at position {2} instead of {3}. '
+                'Proving it again.'.format(self.path, stored_id, index, doc_id))
+            return None
+        return proof
+
+    def record(self, index, doc_id, proof):
+        if isinstance(proof, bytes):
+            proof = proof.decode('utf-8')
+        self.fout.write(json.dumps(
+            {'index': index, 'id': doc_id, 'proof': proof}, ensure_ascii=False) + '\n')
+        self.fout.flush()
+
+    def close(self):
+        self.fout.close()
+
+def is_non_empty_file(path):
+    return os.path.isfile(path) and os.path.getsize(path) > 0
+
+def ends_with_newline(path):
+    with open(path, 'rb') as fin:
+        fin.seek(0, os.SEEK_END)
+        if fin.tell() == 0:
+            return True
+        fin.seek(-1, os.SEEK_END)
+        return fin.read(1) == b'\n'
@@ -0,0 +1,89 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+import tempfile
+import unittest
+
+from .checkpoint import ProofCheckpoint
+
+class ProofCheckpointTestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_resume_returns_recorded_proofs(self):
+        checkpoint = ProofCheckpoint(self.path)
+        checkpoint.record(0, 'd0', b'<proof status="success"/>')
+        checkpoint.record(1, 'd1', '<proof status="failed"/>')
+        checkpoint.close()
+        checkpoint = ProofCheckpoint(self.path, resume=True)
+        self.assertEqual('<proof status="success"/>', checkpoint.get(0, 'd0'))
+        self.assertEqual('<proof status="failed"/>', checkpoint.get(1, 'd1'))
+        self.assertIsNone(checkpoint.get(2, 'd2'))
+        checkpoint.close()
+
+    def test_without_resume_starts_anew(self):
+        checkpoint = ProofCheckpoint(self.path)
+        checkpoint.record(0, 'd0', '<proof/>')
+        checkpoint.close()
+        checkpoint = ProofCheckpoint(self.path, overwrite=True)
+        self.assertIsNone(checkpoint.get(0, 'd0'))
+        checkpoint.close()
+        with open(self.path) as fin:
+            self.assertEqual('', fin.read())
+
+    def test_existing_checkpoint_is_not_overwritten(self):
+        checkpoint = ProofCheckpoint(self.path)
+        checkpoint.record(0, 'd0', '<proof/>')
+        checkpoint.close()
+        with self.assertRaises(ValueError):
+            ProofCheckpoint(self.path)
+        checkpoint = ProofCheckpoint(self.path, resume=True)
+        self.assertEqual('<proof/>', checkpoint.get(0, 'd0'))
+        checkpoint.close()
+
+    def test_different_document_is_not_resumed(self):
+        checkpoint = ProofCheckpoint(self.path)
+        checkpoint.record(0, 'd0', '<proof/>')
+        checkpoint.close()
+        checkpoint = ProofCheckpoint(self.path, resume=True)
+        self.assertIsNone(checkpoint.get(0, 'other'))
+        checkpoint.close()
+
+    def test_truncated_line_is_ignored(self):
+        checkpoint = ProofCheckpoint(self.path)
+        checkpoint.record(0, 'd0', '<proof/>')
+        checkpoint.close()
+        with open(self.path, 'a') as fout:
+            fout.write('{"index": 1, "id": "d1", "pro')
+        checkpoint = ProofCheckpoint(self.path, resume=True)
+        self.assertIsNone(checkpoint.get(1, 'd1'))
+        checkpoint.record(2, 'd2', '<proof/>')
+        checkpoint.close()
+        checkpoint = ProofCheckpoint(self.path, resume=True)
+        self.assertEqual('<proof/>', checkpoint.get(0, 'd0'))
+        self.assertEqual('<proof/>', checkpoint.get(2, 'd2'))
+        checkpoint.close()
+
+if __name__ == '__main__':
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(ProofCheckpointTestCase)
+    suites = unittest.TestSuite([suite1])
+    unittest.TextTestRunner(verbosity=2).run(suites)
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import itertools
+import logging
+import os
+import queue
+import subprocess
+import threading
+import time
+
+kCoqlibRequire = 'Require Export coqlib.'
+kSandboxMark = 'ccg2lambda_sandbox_mark'
+kSentinelPrefix = 'ccg2lambda_sentinel_'
+kStartupTimeout = 120
+# seconds between checks of the cancellation event while coqtop is running
+kCancelPollInterval = 0.1
+
+class CoqtopWorker(object):
+    """
+    A long-lived coqtop process that loads coqlib once. Each script is run
+    between a sandbox mark and a Reset to that mark, so that definitions of
+    one theorem do not leak into the next one.
+    """
+
+    def __init__(self, coqtop_cmd=('coqtop',)):
+        self.coqtop_cmd = coqtop_cmd
+        self.process = None
+        self.lines = None
+        self.sentinels = itertools.count()
+
+    def start(self):
+        self.process = subprocess.Popen(
+            self.coqtop_cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+            encoding='utf-8',
+            bufsize=1)
+        self.lines = queue.Queue()
+        reader = threading.Thread(
+            target=read_lines, args=(self.process.stdout, self.lines))
+        reader.daemon = True
+        reader.start()
+        self.send_and_read(
+            '{0}\nDefinition {1} := True.'.format(kCoqlibRequire, kSandboxMark),
+            kStartupTimeout)
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def stop(self):
+        if self.process is None:
+            return
+        try:
+            self.process.kill()
+            self.process.wait()
+        except OSError:
+            pass
+        self.process = None
+
+    def run(self, coq_script, timeout=100, cancel=None):
+        """
+        Runs a coq script in the sandbox and returns its output lines.
+        Raises subprocess.TimeoutExpired if coqtop does not finish in time,
+        and CoqtopCrashed if the process dies while running the script.
+        If the threading.Event `cancel` is set while the script runs,
+        coqtop is killed and CoqtopCancelled is raised.
+        """
+        if cancel is not None and cancel.is_set():
+            raise CoqtopCancelled('cancelled before start')
+        if not self.is_alive():
+            self.start()
+        output_lines = self.send_and_read(
+            strip_coqlib_require(coq_script), timeout, cancel)
+        self.send_and_read(
+            'Abort All.\nReset {0}.\nDefinition {0} := True.'.format(kSandboxMark),
+            timeout)
+        return output_lines
+
+    def send_and_read(self, commands, timeout, cancel=None):
+        sentinel = kSentinelPrefix + str(next(self.sentinels))
+        commands = commands.rstrip()
+        if commands and not commands.endswith('.'):
+            commands += '.'
+        try:
+            self.process.stdin.write('{0}\nLocate {1}.\n'.format(commands, sentinel))
+            self.process.stdin.flush()
+        except (OSError, ValueError) as e:
+            self.stop()
+            raise CoqtopCrashed(str(e))
+        deadline = time.time() + timeout
+        output_lines = []
+        while True:
+            remaining = deadline - time.time()
+            if cancel is not None:
+                remaining = min(remaining, kCancelPollInterval)
+            try:
+                line = self.lines.get(timeout=max(remaining, 0))
+            except queue.Empty:
+                if cancel is not None and cancel.is_set():
+                    self.stop()
+                    raise CoqtopCancelled('cancelled while running')
+                if time.time() < deadline:
+                    continue
+                self.stop()
+                raise subprocess.TimeoutExpired(self.coqtop_cmd, timeout)
+            if line is None:
+                self.stop()
+                raise CoqtopCrashed('coqtop exited unexpectedly')
+            if sentinel in line and 'Locate' not in line:
+                return output_lines
+            output_lines.append(line.strip())
+
+class CoqtopCrashed(Exception):
+    pass
+
+class CoqtopCancelled(Exception):
+    pass
+
+class CoqtopPool(object):
+    """
+    Pool of coqtop workers that can be shared among threads of a process.
+    Workers are started lazily and replaced when they time out or crash.
+    """
+
+    def __init__(self, size=1, coqtop_cmd=('coqtop',)):
+        self.size = size
+        self.idle = queue.Queue()
+        for _ in range(size):
+            self.idle.put(CoqtopWorker(coqtop_cmd))
+
+    def run(self, coq_script, timeout=100, cancel=None):
+        worker = self.idle.get()
+        try:
+            return worker.run(coq_script, timeout, cancel)
+        except CoqtopCrashed as e:
+            logging.error(
+                'Error when running the following script:\n{0}\nMessage was: {1}'.format(
+                coq_script, e))
+            return []
+        finally:
+            self.idle.put(worker)
+
+    def close(self):
+        while not self.idle.empty():
+            self.idle.get().stop()
+
+def read_lines(stream, lines):
+    for line in stream:
+        lines.put(line)
+    lines.put(None)
+
+def strip_coqlib_require(coq_script):
+    if coq_script.startswith(kCoqlibRequire):
+        return coq_script[len(kCoqlibRequire):].lstrip('\n')
+    return coq_script
+
+POOL_SIZE = 0
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def set_coqtop_pool_size(size):
+    """
+    Sets the number of persistent coqtop workers per process.
+    A size of 0 disables the pool (a fresh coqtop is launched per script).
+    """
+    global POOL_SIZE
+    POOL_SIZE = size
+
+def get_coqtop_pool():
+    """
+    Returns the coqtop pool of the current process, or None if disabled.
+    Processes forked after the pool was created get their own pool,
+    since coqtop pipes cannot be shared across processes.
+    """
+    global _pool, _pool_pid
+    if POOL_SIZE <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = CoqtopPool(POOL_SIZE)
+            _pool_pid = os.getpid()
+    return _pool
@@ -0,0 +1,145 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+import unittest
+
+from .coqtop_pool import CoqtopCancelled
+from .coqtop_pool import CoqtopPool
+
+# Minimal imitation of coqtop reading from a pipe: it answers "Locate" queries,
+# declares theorems, sleeps on "Sleep." and dies on "Crash.".
+fake_coqtop_source = textwrap.dedent("""\
+    import sys, time
+    for line in sys.stdin:
+        line = line.strip()
+        if line.startswith('Locate '):
+            print('No object of basename ' + line.split()[1].rstrip('.'))
+        elif line.startswith('Theorem '):
+            print(line.split()[1].rstrip(':') + ' is defined')
+        elif line == 'Sleep.':
+            time.sleep(10)
+        elif line == 'Crash.':
+            sys.exit(1)
+        sys.stdout.flush()
+    """)
+
+class CoqtopPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.fake_coqtop = tempfile.mkstemp(suffix='.py')
+        with os.fdopen(fd, 'w') as fout:
+            fout.write(fake_coqtop_source)
+        self.pool = CoqtopPool(1, coqtop_cmd=(sys.executable, self.fake_coqtop))
+
+    def tearDown(self):
+        self.pool.close()
+        os.remove(self.fake_coqtop)
+
+    def test_output_of_script(self):
+        output_lines = self.pool.run('Require Export coqlib.\nTheorem t1: True.')
+        self.assertEqual(['t1 is defined'], output_lines)
+
+    def test_worker_is_reused(self):
+        self.pool.run('Theorem t1: True.')
+        worker = self.pool.idle.queue[0]
+        pid = worker.process.pid
+        self.pool.run('Theorem t2: True.')
+        self.assertEqual(pid, worker.process.pid)
+
+    def test_timeout_restarts_worker(self):
+        with self.assertRaises(subprocess.TimeoutExpired):
+            self.pool.run('Sleep.', timeout=0.5)
+        output_lines = self.pool.run('Theorem t1: True.')
+        self.assertEqual(['t1 is defined'], output_lines)
+
+    def test_crash_restarts_worker(self):
+        output_lines = self.pool.run('Crash.')
+        self.assertEqual([], output_lines)
+        output_lines = self.pool.run('Theorem t1: True.')
+        self.assertEqual(['t1 is defined'], output_lines)
+
+    def test_cancel_kills_running_script(self):
+        cancel = threading.Event()
+        threading.Timer(0.3, cancel.set).start()
+        start = time.time()
+        with self.assertRaises(CoqtopCancelled):
+            self.pool.run('Sleep.', timeout=10, cancel=cancel)
+        self.assertLess(time.time() - start, 5)
+        output_lines = self.pool.run('Theorem t1: True.')
+        self.assertEqual(['t1 is defined'], output_lines)
+
+    def test_cancelled_before_start(self):
+        cancel = threading.Event()
+        cancel.set()
+        with self.assertRaises(CoqtopCancelled):
+            self.pool.run('Theorem t1: True.', cancel=cancel)
+
+def coqtop_messages(output_lines):
+    """
+    Returns the declarations, definitions and errors reported by coqtop,
+    without prompts, banner or blank lines.
+    """
+    messages = []
+    for line in output_lines:
+        line = re.sub(r'^(\S+ < )+', '', line.strip())
+        if re.search(r'is (defined|declared|assumed)|Error', line):
+            messages.append(line)
+    return messages
+
+def run_fresh_coqtop(coq_script):
+    # as theorem.run_coqtop does without a pool: echo script | coqtop
+    output = subprocess.run(
+        ('coqtop',), input=coq_script, stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT, universal_newlines=True, timeout=60).stdout
+    return output.split('\n')
+
+@unittest.skipIf(shutil.which('coqtop') is None, 'coqtop is not installed')
+class CoqtopPoolCoqtopTestCase(unittest.TestCase):
+    def setUp(self):
+        self.pool = CoqtopPool(1)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_same_output_as_fresh_coqtop(self):
+        # The first script leaves a proof open, and the later ones declare
+        # the same names again: they only succeed if each script starts from
+        # the state after coqlib.
+        scripts = [
+            'Parameter P : Prop.\nTheorem t1 : P.\nauto.',
+            'Parameter P : Prop.\nAxiom p : P.\nTheorem t1 : P.\nauto.\nQed.',
+            'Parameter P : Prop.\nTheorem t1 : P.\nauto.\nQed.']
+        for script in scripts:
+            expected = coqtop_messages(run_fresh_coqtop(script))
+            output_lines = self.pool.run(script, timeout=60)
+            self.assertEqual(expected, coqtop_messages(output_lines))
+        self.assertEqual(1, self.pool.idle.qsize())
+        self.assertTrue(self.pool.idle.queue[0].is_alive())
+
+if __name__ == '__main__':
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(CoqtopPoolTestCase)
+    suite2 = unittest.TestLoader().loadTestsFromTestCase(CoqtopPoolCoqtopTestCase)
+    suites = unittest.TestSuite([suite1, suite2])
+    unittest.TextTestRunner(verbosity=2).run(suites)
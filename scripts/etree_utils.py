@@ -34,3 +34,95 @@ def get_node_at_path(tree, path):
             raise(IndexError, 'Attempted to index subtree {0} with path {1}'\
                   .format(tree.get('id'), path))
     return node
+
+kStreamBatchSize = 1000
+
+def process_xml_stream(input_fname, output_fname, tag, process_elements,
+                       batch_size=kStreamBatchSize):
+    """
+    Reads `input_fname` incrementally and writes it into `output_fname`,
+    keeping in memory at most `batch_size` elements with tag `tag`
+    (e.g. 'sentence' or 'document') plus their not yet closed ancestors.
+    `process_elements` is called with a list of such elements (in document
+    order) and may modify them in place before they are written out and
+    released. It returns the number of processed elements.
+    """
+    num_elements = 0
+    with etree.xmlfile(output_fname, encoding='utf-8') as xf:
+        xf.write_declaration()
+        writer = StreamWriter(xf)
+        batch = []
+        open_path = []
+        root = None
+        for event, elem in etree.iterparse(
+                input_fname, events=('start', 'end'), remove_blank_text=True):
+            if event == 'start':
+                if root is None:
+                    root = elem
+                open_path.append(elem)
+                continue
+            open_path.pop()
+            if elem.tag != tag or any(e.tag == tag for e in open_path):
+                continue
+            batch.append(elem)
+            if len(batch) >= batch_size:
+                process_elements(batch)
+                num_elements += len(batch)
+                batch = []
+                writer.flush(open_path, elem)
+        if batch:
+            process_elements(batch)
+            num_elements += len(batch)
+        if writer.contexts:
+            writer.flush(open_path, None)
+        elif root is not None:
+            xf.write(root, pretty_print=True)
+    return num_elements
+
+class StreamWriter(object):
+    """
+    Writes the complete parts of a tree that is being built by iterparse.
+    Elements that are still open (`open_path`) are written as opening tags,
+    and complete elements are written whole and removed from the tree.
+    Since lxml may build the tree ahead of the events that have been
+    consumed, children of the innermost open element are written only up
+    to `last_ended`, the last element whose end event was consumed.
+    """
+
+    def __init__(self, xf):
+        self.xf = xf
+        self.contexts = []
+
+    def flush(self, open_path, last_ended):
+        num_common = 0
+        for (elem, _), open_elem in zip(self.contexts, open_path):
+            if elem is not open_elem:
+                break
+            num_common += 1
+        # Elements whose opening tag was written but that are now complete.
+        while len(self.contexts) > num_common:
+            elem, context = self.contexts.pop()
+            self.write_children(elem)
+            context.__exit__(None, None, None)
+            if elem.getparent() is not None:
+                elem.getparent().remove(elem)
+        for depth, elem in enumerate(open_path):
+            if depth >= len(self.contexts):
+                context = self.xf.element(elem.tag, dict(elem.attrib))
+                context.__enter__()
+                if elem.text:
+                    self.xf.write(elem.text)
+                self.contexts.append((elem, context))
+            if depth + 1 < len(open_path):
+                self.write_children(elem, stop_before=open_path[depth + 1])
+            else:
+                self.write_children(elem, stop_after=last_ended)
+
+    def write_children(self, elem, stop_before=None, stop_after=None):
+        for child in list(elem):
+            if child is stop_before:
+                break
+            self.xf.write(child, pretty_print=True)
+            elem.remove(child)
+            if child is stop_after:
+                break
@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+import tempfile
+import unittest
+
+from lxml import etree
+
+from .etree_utils import process_xml_stream
+
+corpus_str = r"""<?xml version='1.0' encoding='utf-8'?>
+<root>
+  <meta id="m1"/>
+  <document id="d1">
+    <sentences>
+      <sentence id="s1"><tokens/></sentence>
+      <sentence id="s2"/>
+    </sentences>
+    <note/>
+  </document>
+  <document id="d2">
+    <sentences>
+      <sentence id="s3"/>
+    </sentences>
+  </document>
+</root>
+"""
+
+def mark_elements(elements):
+    for element in elements:
+        etree.SubElement(element, 'processed', {'of': element.get('id')})
+
+class ProcessXmlStreamTestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.input_fname = tempfile.mkstemp(suffix='.xml')
+        with os.fdopen(fd, 'w') as fout:
+            fout.write(corpus_str)
+        fd, self.output_fname = tempfile.mkstemp(suffix='.xml')
+        os.close(fd)
+        parser = etree.XMLParser(remove_blank_text=True)
+        self.expected = etree.fromstring(corpus_str.encode('utf-8'), parser)
+
+    def tearDown(self):
+        os.remove(self.input_fname)
+        os.remove(self.output_fname)
+
+    def assert_stream_output(self, tag, batch_size):
+        num_elements = process_xml_stream(
+            self.input_fname, self.output_fname, tag, mark_elements, batch_size)
+        mark_elements(self.expected.findall('.//' + tag))
+        parser = etree.XMLParser(remove_blank_text=True)
+        output = etree.parse(self.output_fname, parser).getroot()
+        self.assertEqual(len(self.expected.findall('.//' + tag)), num_elements)
+        self.assertEqual(etree.tostring(self.expected), etree.tostring(output))
+
+    def test_sentences_one_by_one(self):
+        self.assert_stream_output('sentence', 1)
+
+    def test_sentences_in_batches(self):
+        self.assert_stream_output('sentence', 2)
+
+    def test_documents_in_one_batch(self):
+        self.assert_stream_output('document', 100)
+
+if __name__ == '__main__':
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(ProcessXmlStreamTestCase)
+    suites = unittest.TestSuite([suite1])
+    unittest.TextTestRunner(verbosity=2).run(suites)
@@ -0,0 +1,111 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from __future__ import print_function
+
+import argparse
+from collections import OrderedDict
+import logging
+from lxml import etree
+import os
+import sys
+
+from .coq_analyzer import analyze_coq_output
+from .coqtop_pool import set_coqtop_pool_size
+from .proof_cache import set_proof_cache
+from .resources import set_resources
+from .theorem import is_theorem_defined
+from .theorem import kFailureLogModes
+from .theorem import make_debug_script
+from .theorem import make_failure_log_node
+from .theorem import run_coq_script
+
+def main(args = None):
+    DESCRIPTION=('Add failure logs to the theorems of an XML file produced by '
+                 'prove.py (e.g. with --failure_logs none), running coqtop '
+                 'with debug tactics on the stored coq scripts.')
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+    parser.add_argument("proof", help="XML input filename with proof information")
+    parser.add_argument("output", help="XML output filename")
+    parser.add_argument("--failure_logs", nargs='?', type=str, default="all",
+        choices=kFailureLogModes,
+        help="Theorems that get a failure log: none, failed (unproved theorems) "
+             "or all.")
+    parser.add_argument("--timeout", nargs='?', type=int, default="100",
+        help="Maximum running time for each theorem.")
+    parser.add_argument("--coq_workers", nargs='?', type=int, default="0",
+        help="Number of persistent coqtop processes (default: 0, launch a new "
+             "coqtop for every theorem).")
+    parser.add_argument("--coqlib", nargs='?', type=str, default="coqlib.v",
+        help="Coq library whose Parameters are reserved predicates. Its compiled "
+             "coqlib.vo is the one that coqtop loads from the working directory.")
+    parser.add_argument("--tactics", nargs='?', type=str, default="tactics_coq.txt",
+        help="File with the tactics used to prove theorems.")
+    parser.add_argument("--replacement", nargs='?', type=str, default="replacement.txt",
+        help="File with the characters to replace in Coq scripts.")
+    parser.add_argument("--proof_cache", nargs='?', type=str, default="",
+        help="SQLite file where coqtop results are cached across runs "
+             "(default: no cache).")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    if not os.path.exists(args.proof):
+        print('File does not exist: {0}'.format(args.proof), file=sys.stderr)
+        parser.print_help(file=sys.stderr)
+        sys.exit(1)
+
+    set_resources(args.coqlib, args.tactics, args.replacement)
+    set_coqtop_pool_size(args.coq_workers)
+    set_proof_cache(args.proof_cache)
+
+    parser = etree.XMLParser(remove_blank_text=True)
+    root = etree.parse(args.proof, parser)
+    regenerate_failure_logs(root, args.failure_logs, args.timeout)
+    root.write(args.output, xml_declaration=True, encoding='utf-8',
+               pretty_print=True)
+
+def regenerate_failure_logs(root, mode='all', timeout=100):
+    """
+    Replaces the failure logs of all theorem nodes under root
+    (see theorem.set_failure_logs for the meaning of `mode`).
+    """
+    for t_node in root.xpath('.//theorem[coq_script]'):
+        failure_log = None
+        proved = t_node.get('inference_result', 'unknown') != 'unknown'
+        if mode == 'all' or (mode == 'failed' and not proved):
+            failure_log = get_debug_failure_log(
+                t_node.findtext('coq_script'), timeout)
+        f_node = make_failure_log_node(failure_log)
+        old_f_node = t_node.find('failure_log')
+        if old_f_node is None:
+            t_node.append(f_node)
+        else:
+            t_node.replace(old_f_node, f_node)
+    return root
+
+def get_debug_failure_log(coq_script, timeout=100):
+    """
+    Same failure log as Theorem.prove_debug, from a stored coq script.
+    """
+    output_lines = run_coq_script(make_debug_script(coq_script), timeout)
+    if is_theorem_defined(output_lines):
+        return OrderedDict()
+    return analyze_coq_output(output_lines)
+
+if __name__ == '__main__':
+    main()
@@ -14,9 +14,14 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+from functools import lru_cache
 import json
 from nltk.corpus import wordnet as wn
 
+from .wordnet_index import get_word_features
+
+kRelationCacheSize = 100000
+
 # Obtain lemmas of synonyms.
 def obtain_synonyms(word):
     return set([lemma for synonym in wn.synsets(word) \
@@ -261,39 +266,50 @@ def get_verbocean_relations(verb1, verb2):
 #   linguistic_relationship('woman', 'women') returns ['inflection'] as expected,
 #   until we implement the 'plural' relationship.
 def linguistic_relationship(word1, word2):
+    return list(get_linguistic_relations(word1, word2))
+
+# Same as linguistic_relationship, but returns a tuple that is cached.
+# The relations are the same as those given by is_synonym, is_hypernym, etc.,
+# computed from the WordNet features of each word (see wordnet_index.py),
+# which are read from the WordNet index if there is one.
+@lru_cache(maxsize=kRelationCacheSize)
+def get_linguistic_relations(word1, word2):
     (word1, word2) = (word1.strip('"'), word2.strip('"'))
     if word1 == word2:
-        return ['copy']
-    base_word1 = wn.morphy(word1)
-    base_word2 = wn.morphy(word2)
+        return ('copy',)
+    features_word1 = get_word_features(word1)
+    base_word1 = features_word1.morphy
+    base_word2 = get_word_features(word2).morphy
     if base_word1 == None:
         base_word1 = word1.lower()
     if base_word2 == None:
         base_word2 = word2.lower()
     ling_relations = []
     if word1 != word2 and base_word1 == base_word2:
-        return ['inflection']
-    if is_synonym(base_word1, base_word2):
+        return ('inflection',)
+    base1 = get_word_features(base_word1)
+    base2 = get_word_features(base_word2)
+    if base1.synsets & base2.synsets:
         ling_relations.append('synonym')
-    if is_hypernym(base_word1, base_word2):
+    if base2.hypernyms & base1.synsets:
         ling_relations.append('hyponym')
-    if is_hyponym(base_word1, base_word2):
+    if base1.hypernyms & base2.synsets:
         ling_relations.append('hypernym')
-    if is_similar(base_word1, base_word2):
+    if base1.similar & base2.synsets:
         ling_relations.append('similar')
-    if is_holonym(base_word1, base_word2):
+    if base2.holonyms & base1.synsets:
         ling_relations.append('holonym')
-    if is_meronym(base_word1, base_word2):
+    if base1.holonyms & base2.synsets:
         ling_relations.append('meronym')
-    if is_antonym(base_word1, base_word2):
+    if base1.antonyms & base2.synsets:
         ling_relations.append('antonym')
-    if is_entailed(base_word1, base_word2):
+    if base2.entailments & base1.synsets:
         ling_relations.append('entailed')
-    if is_derivation(word1, word2):
+    if word2 in features_word1.derivations:
         ling_relations.append('derivation')
     # Typical types of verbocean relations are "happens-before" or "stronger-than"
     ling_relations.extend(get_verbocean_relations(base_word1, base_word2))
-    return ling_relations
+    return tuple(ling_relations)
 
 def get_wordnet_cascade(ling_relations):
   """
@@ -14,11 +14,30 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 import logging
+import threading
 
 from nltk.sem.logic import LogicParser
 from nltk.sem.logic import LogicalExpressionException
 
-logic_parser = LogicParser(type_check=False)
+class ThreadLocalLogicParser(object):
+    """
+    NLTK's LogicParser keeps the state of the current parse in the instance,
+    so that it cannot be shared among threads. This wrapper keeps one
+    parser per thread.
+    """
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.local = threading.local()
+
+    def parse(self, data, signature=None):
+        parser = getattr(self.local, 'parser', None)
+        if parser is None:
+            parser = LogicParser(**self.kwargs)
+            self.local.parser = parser
+        return parser.parse(data, signature)
+
+logic_parser = ThreadLocalLogicParser(type_check=False)
 def lexpr(formula_str):
     try:
         expr = logic_parser.parse(formula_str)
@@ -22,45 +22,72 @@ def normalize_interpretation(expression):
     norm_interp_str = coq_string_expr(expression)
     return norm_interp_str
 
+class CoqStringCache(object):
+    """
+    Coq strings of the premises and conclusions of a theorem and of its
+    variations, so that each expression is rendered once for all the coq
+    scripts and formulae built from it. Negations reuse the string of the
+    negated expression.
+    """
+
+    def __init__(self):
+        self.strings = {}
+
+    def get(self, expression):
+        entry = self.strings.get(id(expression))
+        if entry is not None and entry[0] is expression:
+            return entry[1]
+        if isinstance(expression, NegatedExpression):
+            expr_coq_str = Tokens.OPEN + 'not ' + self.get(expression.term) + Tokens.CLOSE
+        else:
+            expr_coq_str = normalize_interpretation(expression)
+        # Keeping the expression makes sure that its id is not reused.
+        self.strings[id(expression)] = (expression, expr_coq_str)
+        return expr_coq_str
+
 def coq_string_expr(expression):
     if isinstance(expression, str):
         expression = lexpr(expression)
-    expr_coq_str = ''
+    out = []
+    write_expr(expression, out)
+    return ''.join(out)
+
+coqstr = coq_string_expr
+
+# The functions below write the coq string of an expression as a list
+# of pieces in `out`, which are joined once at the end.
+def write_expr(expression, out):
     if isinstance(expression, ApplicationExpression):
-        expr_coq_str = coq_string_application_expr(expression)
+        write_application_expr(expression, out)
     elif isinstance(expression, AbstractVariableExpression):
-        expr_coq_str = coq_string_abstract_variable_expr(expression)
+        write_abstract_variable_expr(expression, out)
     elif isinstance(expression, LambdaExpression):
-        expr_coq_str = coq_string_lambda_expr(expression)
+        write_lambda_expr(expression, out)
     elif isinstance(expression, QuantifiedExpression):
-        expr_coq_str = coq_string_quantified_expr(expression)
+        write_quantified_expr(expression, out)
     elif isinstance(expression, AndExpression):
-        expr_coq_str = coq_string_and_expr(expression)
+        write_boolean_expr('and ', expression, out)
     elif isinstance(expression, OrExpression):
-        expr_coq_str = coq_string_or_expr(expression)
+        write_boolean_expr('or ', expression, out)
     elif isinstance(expression, NegatedExpression):
-        expr_coq_str = coq_string_not_expr(expression)
+        out.append(Tokens.OPEN + 'not ')
+        write_expr(expression.term, out)
+        out.append(Tokens.CLOSE)
     elif isinstance(expression, BinaryExpression):
-        expr_coq_str = coq_string_binary_expr(expression)
-    elif isinstance(expression, Variable):
-        expr_coq_str = '%s' % expression
+        write_binary_expr(expression, out)
     else:
-        expr_coq_str = str(expression)
-    return expr_coq_str
-
-coqstr = coq_string_expr
+        # Variables and other objects.
+        out.append(str(expression))
 
-def coq_string_application_expr(expression):
+def write_application_expr(expression, out):
     # uncurry the arguments and find the base function
     if expression.is_atom():
         function, args = expression.uncurry()
-        arg_str = ' '.join("%s" % coqstr(arg) for arg in args)
     else:
         #Leave arguments curried
         function = expression.function
-        arg_str = "%s" % coqstr(expression.argument)
+        args = [expression.argument]
 
-    function_str = "%s" % coqstr(function)
     parenthesize_function = False
     if isinstance(function, LambdaExpression):
         if isinstance(function.term, ApplicationExpression):
@@ -72,40 +99,39 @@ def coq_string_application_expr(expression):
     elif isinstance(function, ApplicationExpression):
         parenthesize_function = True
 
+    out.append(Tokens.OPEN)
     if parenthesize_function:
-        function_str = Tokens.OPEN + function_str + Tokens.CLOSE
-
-    return Tokens.OPEN + function_str + ' ' + arg_str + Tokens.CLOSE
+        out.append(Tokens.OPEN)
+        write_expr(function, out)
+        out.append(Tokens.CLOSE)
+    else:
+        write_expr(function, out)
+    for arg in args:
+        out.append(' ')
+        write_expr(arg, out)
+    out.append(Tokens.CLOSE)
 
 reserved_predicates = \
   {'AND' : 'and', 'OR' : 'or', 'neg' : 'not', 'EMPTY' : '', 'TrueP' : 'True'}
-def coq_string_abstract_variable_expr(expression):
+def write_abstract_variable_expr(expression, out):
     expr_str = str(expression.variable)
-    if expr_str in reserved_predicates:
-        expr_str = reserved_predicates[expr_str]
-    if not isinstance(expression, FunctionVariableExpression):
-        if expr_str == '':
-            expr_str = "%s" % expr_str
-        else:
-            expr_str = "%s" % expr_str
-    else:
-        expr_str = "%s" % expr_str
-    return expr_str
+    out.append(reserved_predicates.get(expr_str, expr_str))
 
-def coq_string_lambda_expr(expression):
+def write_lambda_expr(expression, out):
     variables = [expression.variable]
     term = expression.term
     while term.__class__ == expression.__class__:
         variables.append(term.variable)
         term = term.term
-    return Tokens.OPEN + 'fun ' + ' '.join("%s" % coqstr(v) for v in variables) + \
-           ' => ' + "%s" % coqstr(term) + Tokens.CLOSE
+    out.append(Tokens.OPEN + 'fun ' + ' '.join(str(v) for v in variables) + ' => ')
+    write_expr(term, out)
+    out.append(Tokens.CLOSE)
 
 nltk2coq_quantifier = {'exists' : 'exists',
                        'exist' : 'exists',
                        'all' : 'forall',
                        'forall' : 'forall'}
-def coq_string_quantified_expr(expression):
+def write_quantified_expr(expression, out):
     variables = [expression.variable]
     term = expression.term
     while term.__class__ == expression.__class__:
@@ -115,30 +141,22 @@ def coq_string_quantified_expr(expression):
     # Rename quantifiers, according to coq notation. Such renaming dictionary
     # is defined above as "nltk2coq_quantifier". If a rename convention is not
     # available, use the same as in NLTK.
-    if nltk_quantifier in nltk2coq_quantifier:
-        coq_quantifier = nltk2coq_quantifier[expression.getQuantifier()]
-    else:
-        coq_quantifier = nltk_quantifier
-    return Tokens.OPEN + coq_quantifier + ' ' \
-           + ' '.join("%s" % coqstr(v) for v in variables) + \
-           ', ' + "%s" % coqstr(term) + Tokens.CLOSE
-
-def coq_string_and_expr(expression):
-    first = coqstr(expression.first)
-    second = coqstr(expression.second)
-    return Tokens.OPEN + 'and ' + first + ' ' + second + Tokens.CLOSE
-
-def coq_string_or_expr(expression):
-    first = coqstr(expression.first)
-    second = coqstr(expression.second)
-    return Tokens.OPEN + 'or ' + first + ' ' + second + Tokens.CLOSE
-
-def coq_string_not_expr(expression):
-    term_str = coqstr(expression.term)
-    return Tokens.OPEN + 'not ' + term_str + Tokens.CLOSE
-
-def coq_string_binary_expr(expression):
-    first = coqstr(expression.first)
-    second = coqstr(expression.second)
-    return Tokens.OPEN + first + ' ' + expression.getOp() \
-            + ' ' + second + Tokens.CLOSE
+    coq_quantifier = nltk2coq_quantifier.get(nltk_quantifier, nltk_quantifier)
+    out.append(Tokens.OPEN + coq_quantifier + ' ' \
+               + ' '.join(str(v) for v in variables) + ', ')
+    write_expr(term, out)
+    out.append(Tokens.CLOSE)
+
+def write_boolean_expr(coq_operator, expression, out):
+    out.append(Tokens.OPEN + coq_operator)
+    write_expr(expression.first, out)
+    out.append(' ')
+    write_expr(expression.second, out)
+    out.append(Tokens.CLOSE)
+
+def write_binary_expr(expression, out):
+    out.append(Tokens.OPEN)
+    write_expr(expression.first, out)
+    out.append(' ' + expression.getOp() + ' ')
+    write_expr(expression.second, out)
+    out.append(Tokens.CLOSE)
@@ -18,6 +18,7 @@
 import unittest
 
 from .logic_parser import lexpr
+from .nltk2coq import CoqStringCache
 from .nltk2coq import normalize_interpretation
 
 class Nltk2coqTestCase(unittest.TestCase):
@@ -177,7 +178,25 @@ class Nltk2coqTestCase(unittest.TestCase):
         expected_coq_expr = '(forall x y, True)'
         self.assertEqual(expected_coq_expr, coq_expr)
 
+class CoqStringCacheTestCase(unittest.TestCase):
+    def test_same_strings(self):
+        coq_strings = CoqStringCache()
+        nltk_expr = lexpr(r'exists x.(_dog(x) & -_cat(x))')
+        self.assertEqual(normalize_interpretation(nltk_expr), coq_strings.get(nltk_expr))
+        self.assertEqual(normalize_interpretation(-nltk_expr), coq_strings.get(-nltk_expr))
+        self.assertEqual('(not (not (_run e)))', coq_strings.get(--lexpr(r'_run(e)')))
+
+    def test_expressions_are_rendered_once(self):
+        coq_strings = CoqStringCache()
+        nltk_expr = lexpr(r'_dog(x)')
+        coq_expr = coq_strings.get(nltk_expr)
+        nltk_expr.function.variable = lexpr(r'_cat').variable
+        self.assertIs(coq_expr, coq_strings.get(nltk_expr))
+        self.assertEqual('(not (_dog x))', coq_strings.get(-nltk_expr))
+        self.assertEqual('(_cat x)', coq_strings.get(lexpr(r'_cat(x)')))
+
 if __name__ == '__main__':
     suite1  = unittest.TestLoader().loadTestsFromTestCase(Nltk2coqTestCase)
-    suites  = unittest.TestSuite([suite1])
+    suite2  = unittest.TestLoader().loadTestsFromTestCase(CoqStringCacheTestCase)
+    suites  = unittest.TestSuite([suite1, suite2])
     unittest.TextTestRunner(verbosity=2).run(suites)
@@ -15,7 +15,33 @@
 #  limitations under the License.
 
 import re
-import codecs
+
+from .resources import get_resources
+
+# Symbols replaced by normalize_token anywhere in a token.
+kNormalizationTable = str.maketrans({
+    '.': '_DOT',
+    ',': '_COMMA',
+    '(': '_LEFTB',
+    ')': '_RIGHTB',
+    '!': '_EXCLAMATION',
+    '-': '_dash_'})
+# Symbols replaced by normalize_token only when they are the whole token.
+kTokenSymbols = {'-': '_HYPHEN', '&': '_AMPERSAND'}
+kTokenSymbolRegex = re.compile(r'^[-&]$')
+
+# Pairs applied in order by denormalize_token. The replacements are the
+# literal strings that re.sub used to produce from r'\.', r'^-$', etc.
+kDenormalizations = (
+    ('_DOT', '\\.'),
+    ('_COMMA', ','),
+    ('_LEFTB', '\\('),
+    ('_RIGHTB', '\\)'),
+    ('_HYPHEN', '^-$'),
+    ('_AMPERSAND', '^&$'),
+    ('_EXCLAMATION', '!'),
+    ('_dash_', '-'))
+kTypeSuffixRegex = re.compile(r'_[a-z][0-9]$')
 
 def normalize_token(token):
     """
@@ -24,15 +50,10 @@ def normalize_token(token):
     To avoid collisions with reserved words, we prefix each token
     with an underscore '_'.
     """
-    normalized = token
-    normalized = re.sub(r'\.', '_DOT', normalized)
-    normalized = re.sub(r',', '_COMMA', normalized)
-    normalized = re.sub(r'\(', '_LEFTB', normalized)
-    normalized = re.sub(r'\)', '_RIGHTB', normalized)
-    normalized = re.sub(r'^-$', '_HYPHEN', normalized)
-    normalized = re.sub(r'^&$', '_AMPERSAND', normalized)
-    normalized = re.sub(r'!', '_EXCLAMATION', normalized)
-    normalized = re.sub(r'-', '_dash_', normalized)
+    if kTokenSymbolRegex.match(token):
+        normalized = kTokenSymbols[token[0]] + token[1:]
+    else:
+        normalized = token.translate(kNormalizationTable)
     if not normalized.startswith('_'):
         normalized = '_' + normalized
     return normalized
@@ -42,23 +63,16 @@ def denormalize_token(token):
     Unconvert symbols. This is the reverse operation as above.
     """
     denormalized = token
-    denormalized = re.sub('_DOT', r'\.', denormalized)
-    denormalized = re.sub('_COMMA', r',', denormalized)
-    denormalized = re.sub('_LEFTB', r'\(', denormalized)
-    denormalized = re.sub('_RIGHTB', r'\)', denormalized)
-    denormalized = re.sub('_HYPHEN', r'^-$', denormalized)
-    denormalized = re.sub('_AMPERSAND', r'^&$', denormalized)
-    denormalized = re.sub('_EXCLAMATION', r'!', denormalized)
-    denormalized = re.sub('_dash_', r'-', denormalized)
+    for normalized, symbol in kDenormalizations:
+        denormalized = denormalized.replace(normalized, symbol)
     # Remove possible suffix that was introduced to avoid type clashes.
-    denormalized = re.sub(r'_[a-z][0-9]$', '', denormalized)
+    denormalized = kTypeSuffixRegex.sub('', denormalized)
     denormalized = denormalized.lstrip('_')
     return denormalized
 
-def substitute_invalid_chars(script, replacement_filename):
-    with codecs.open(replacement_filename, 'r', 'utf-8') as finput:
-        repl = dict(line.strip().split() for line in finput)
-        for invalid_char, valid_char in repl.items():
-            script = script.replace(invalid_char, valid_char)
-    return script
-
+def substitute_invalid_chars(script, replacement_filename=None):
+    """
+    Applies the replacements of a file (by default, replacement.txt
+    of the current resources; see resources.py).
+    """
+    return get_resources().get_replacement_table(replacement_filename).substitute(script)
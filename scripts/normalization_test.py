@@ -0,0 +1,72 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+import tempfile
+import unittest
+
+from .normalization import denormalize_token
+from .normalization import normalize_token
+from .normalization import substitute_invalid_chars
+
+class NormalizationTestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.txt')
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def write_replacements(self, text):
+        with open(self.path, 'w', encoding='utf-8') as fout:
+            fout.write(text)
+        # Make sure that the modification time changes.
+        os.utime(self.path, ns=(0, os.stat(self.path).st_mtime_ns + 10 ** 9))
+
+    def test_normalize_token(self):
+        self.assertEqual('_a_DOTb_COMMA_LEFTB_RIGHTB_EXCLAMATION_dash_',
+                         normalize_token('a.b,()!-'))
+        self.assertEqual('_HYPHEN', normalize_token('-'))
+        self.assertEqual('_AMPERSAND', normalize_token('&'))
+        self.assertEqual('_a&b', normalize_token('a&b'))
+        self.assertEqual('_dash__dash_', normalize_token('--'))
+        self.assertEqual('_dog', normalize_token('_dog'))
+
+    def test_denormalize_token(self):
+        self.assertEqual('a\\.b,\\(\\)!-', denormalize_token('_a_DOTb_COMMA_LEFTB_RIGHTB_EXCLAMATION_dash_'))
+        self.assertEqual('^-$', denormalize_token('_HYPHEN'))
+        self.assertEqual('dog', denormalize_token('_dog_e1'))
+        self.assertEqual('dash\\.', denormalize_token('_dash_DOT'))
+
+    def test_substitute_single_chars(self):
+        self.write_replacements(u'！ excl\n$ dollar\n')
+        self.assertEqual('(_a excl dollar)', substitute_invalid_chars('(_a ！ $)', self.path))
+
+    def test_substitute_in_order(self):
+        self.write_replacements(u'ab c\nc d\n')
+        self.assertEqual('ddd', substitute_invalid_chars('abcd', self.path))
+
+    def test_replacement_file_is_reloaded(self):
+        self.write_replacements(u'a b\n')
+        self.assertEqual('b', substitute_invalid_chars('a', self.path))
+        self.write_replacements(u'a c\n')
+        self.assertEqual('c', substitute_invalid_chars('a', self.path))
+
+if __name__ == '__main__':
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(NormalizationTestCase)
+    suites = unittest.TestSuite([suite1])
+    unittest.TextTestRunner(verbosity=2).run(suites)
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import hashlib
+import json
+import logging
+from multiprocessing.util import Finalize
+import os
+import sqlite3
+import threading
+import time
+
+from .resources import get_resources
+from .tactics import get_tactics
+
+# Lookups between writes of the in-memory counters and access times.
+kFlushInterval = 100
+# Fraction of max_entries that the cache may exceed before evicting.
+kEvictionSlack = 0.1
+
+class ProofCache(object):
+    """
+    On-disk cache of coqtop runs, keyed by a hash of the final coq script,
+    the tactics and a fingerprint of coqlib. Entries store the verdict,
+    the output lines and the time that coqtop took. When coqlib.v or
+    tactics_coq.txt change, all entries are dropped, also when the change
+    happens while the cache is in use (resources are reloaded when their
+    files change). A fixed `fingerprint` can be given instead. Least
+    recently used entries are evicted when there are more than `max_entries`.
+    Lookups only read the database: hit and miss counters and access times
+    are kept in memory and written every `kFlushInterval` lookups and when
+    the cache is closed (or its process exits).
+    """
+
+    def __init__(self, path, max_entries=100000, fingerprint=None):
+        self.path = path
+        self.max_entries = max_entries
+        # Eviction runs when there are this many entries over max_entries.
+        self.eviction_slack = int(max_entries * kEvictionSlack)
+        self.hits = 0
+        self.misses = 0
+        self.unflushed_hits = 0
+        self.unflushed_misses = 0
+        self.last_accesses = {}
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS proofs
+            (key text primary key, verdict integer, output_lines text,
+             elapsed real, last_access real)''')
+        self.conn.execute('''CREATE INDEX IF NOT EXISTS proofs_last_access
+            ON proofs (last_access)''')
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS meta
+            (name text primary key, value text)''')
+        self.fixed_fingerprint = fingerprint
+        if fingerprint is None:
+            fingerprint = get_coqlib_fingerprint()
+        self.fingerprint = fingerprint
+        self.invalidate_if_changed()
+        self.num_entries = self.conn.execute(
+            'SELECT count(*) FROM proofs').fetchone()[0]
+        self.finalizer = Finalize(None, self.flush, exitpriority=10)
+
+    def invalidate_if_changed(self):
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT value FROM meta WHERE name = 'fingerprint'").fetchone()
+            if row is not None and row[0] == self.fingerprint:
+                return
+            self.conn.execute('DELETE FROM proofs')
+            self.num_entries = 0
+            self.last_accesses = {}
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (name, value) VALUES ('fingerprint', ?)",
+                (self.fingerprint,))
+            for counter in ['hits', 'misses']:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO meta (name, value) VALUES (?, '0')",
+                    (counter,))
+
+    def update_fingerprint(self):
+        """
+        Drops all entries if coqlib.v or the tactics changed since the last
+        lookup, unless the fingerprint is fixed.
+        """
+        if self.fixed_fingerprint is not None:
+            return
+        fingerprint = get_coqlib_fingerprint()
+        if fingerprint != self.fingerprint:
+            self.fingerprint = fingerprint
+            self.invalidate_if_changed()
+
+    def make_key(self, coq_script):
+        self.update_fingerprint()
+        key_str = '\n'.join([self.fingerprint, get_tactics(), coq_script])
+        return hashlib.sha1(key_str.encode('utf-8')).hexdigest()
+
+    def get(self, coq_script):
+        """
+        Returns the cached output lines of `coq_script`, or None.
+        """
+        key = self.make_key(coq_script)
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT output_lines FROM proofs WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                self.unflushed_misses += 1
+            else:
+                self.hits += 1
+                self.unflushed_hits += 1
+                self.last_accesses[key] = time.time()
+            if self.unflushed_hits + self.unflushed_misses >= kFlushInterval:
+                self.flush_unlocked()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def put(self, coq_script, output_lines, verdict, elapsed):
+        key = self.make_key(coq_script)
+        with self.lock, self.conn:
+            self.conn.execute(
+                '''INSERT OR REPLACE INTO proofs
+                   (key, verdict, output_lines, elapsed, last_access)
+                   VALUES (?, ?, ?, ?, ?)''',
+                (key, int(verdict), json.dumps(output_lines), elapsed, time.time()))
+            self.last_accesses.pop(key, None)
+            # Replaced keys are also counted, so the count is recomputed on eviction.
+            self.num_entries += 1
+            if self.num_entries > self.max_entries + self.eviction_slack:
+                self.evict()
+
+    def evict(self):
+        """
+        Deletes the least recently used entries over max_entries.
+        It must be called with the lock held, within a transaction.
+        """
+        self.write_last_accesses()
+        self.conn.execute(
+            '''DELETE FROM proofs WHERE key IN
+               (SELECT key FROM proofs ORDER BY last_access DESC
+                LIMIT -1 OFFSET ?)''',
+            (self.max_entries,))
+        self.num_entries = self.conn.execute(
+            'SELECT count(*) FROM proofs').fetchone()[0]
+
+    def write_last_accesses(self):
+        self.conn.executemany(
+            'UPDATE proofs SET last_access = ? WHERE key = ?',
+            [(last_access, key) for key, last_access in self.last_accesses.items()])
+        self.last_accesses = {}
+
+    def flush(self):
+        """
+        Writes the counters and access times kept in memory.
+        """
+        with self.lock:
+            self.flush_unlocked()
+
+    def flush_unlocked(self):
+        if self.conn is None:
+            return
+        try:
+            with self.conn:
+                for counter, value in [('hits', self.unflushed_hits),
+                                       ('misses', self.unflushed_misses)]:
+                    if value:
+                        self.conn.execute(
+                            'UPDATE meta SET value = value + ? WHERE name = ?',
+                            (value, counter))
+                self.write_last_accesses()
+        except sqlite3.Error as e:
+            # Only statistics and the eviction order are lost.
+            logging.warning('Could not update proof cache {0}: {1}'.format(self.path, e))
+            self.last_accesses = {}
+        self.unflushed_hits = 0
+        self.unflushed_misses = 0
+
+    def stats(self):
+        """
+        Returns hit and miss counters of this process and of all processes
+        that used the cache since the last invalidation, and the number of entries.
+        Counters of other processes are included once they have been flushed.
+        """
+        with self.lock:
+            totals = dict(self.conn.execute(
+                "SELECT name, value FROM meta WHERE name IN ('hits', 'misses')"))
+            num_entries = self.conn.execute('SELECT count(*) FROM proofs').fetchone()[0]
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'total_hits': int(totals.get('hits', 0)) + self.unflushed_hits,
+                    'total_misses': int(totals.get('misses', 0)) + self.unflushed_misses,
+                    'entries': num_entries}
+
+    def close(self):
+        self.finalizer()
+        with self.lock:
+            if self.conn is None:
+                return
+            self.conn.close()
+            self.conn = None
+
+def get_coqlib_fingerprint():
+    """
+    Returns a fingerprint of the coqlib.v and tactics currently loaded.
+    """
+    resources = get_resources()
+    fingerprint = '\0'.join(
+        [resources.get_coqlib_digest(), resources.get_tactics()])
+    return hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()
+
+CACHE_PATH = ''
+CACHE_SIZE = 100000
+_cache = None
+_cache_pid = None
+_cache_lock = threading.Lock()
+
+def set_proof_cache(path, max_entries=100000):
+    """
+    Sets the file of the proof cache. An empty path disables the cache.
+    """
+    global CACHE_PATH, CACHE_SIZE
+    CACHE_PATH = path
+    CACHE_SIZE = max_entries
+
+def get_proof_cache():
+    """
+    Returns the proof cache of the current process, or None if disabled.
+    """
+    global _cache, _cache_pid
+    if not CACHE_PATH:
+        return None
+    with _cache_lock:
+        if _cache is None or _cache_pid != os.getpid():
+            _cache = ProofCache(CACHE_PATH, CACHE_SIZE)
+            _cache_pid = os.getpid()
+    return _cache
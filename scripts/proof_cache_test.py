@@ -0,0 +1,128 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from .proof_cache import ProofCache
+from . import resources as resources_module
+from .resources import set_resources
+
+class ProofCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'proofs.sqlite')
+        self.caches = []
+
+    def tearDown(self):
+        for cache in self.caches:
+            cache.close()
+        shutil.rmtree(self.tmpdir)
+
+    def make_cache(self, **kwargs):
+        cache = ProofCache(self.path, **kwargs)
+        self.caches.append(cache)
+        return cache
+
+    def test_miss_then_hit(self):
+        cache = self.make_cache(fingerprint='lib1')
+        self.assertIsNone(cache.get('Theorem t1: True. trivial. Qed.'))
+        cache.put('Theorem t1: True. trivial. Qed.', ['t1 is defined'], True, 0.1)
+        self.assertEqual(['t1 is defined'], cache.get('Theorem t1: True. trivial. Qed.'))
+        stats = cache.stats()
+        self.assertEqual(1, stats['hits'])
+        self.assertEqual(1, stats['misses'])
+        self.assertEqual(1, stats['entries'])
+
+    def test_persistent_across_instances(self):
+        cache = self.make_cache(fingerprint='lib1')
+        cache.put('script', ['line'], False, 0.1)
+        cache.close()
+        cache = self.make_cache(fingerprint='lib1')
+        self.assertEqual(['line'], cache.get('script'))
+
+    def test_coqlib_change_invalidates(self):
+        cache = self.make_cache(fingerprint='lib1')
+        cache.put('script', ['line'], False, 0.1)
+        cache.close()
+        cache = self.make_cache(fingerprint='lib2')
+        self.assertIsNone(cache.get('script'))
+        self.assertEqual(0, cache.stats()['entries'])
+
+    def test_least_recently_used_evicted(self):
+        cache = self.make_cache(max_entries=2, fingerprint='lib1')
+        cache.put('script1', ['line1'], False, 0.1)
+        cache.put('script2', ['line2'], False, 0.1)
+        cache.get('script1')
+        cache.put('script3', ['line3'], False, 0.1)
+        self.assertEqual(['line1'], cache.get('script1'))
+        self.assertIsNone(cache.get('script2'))
+        self.assertEqual(['line3'], cache.get('script3'))
+
+    def test_counters_written_on_flush(self):
+        cache = self.make_cache(fingerprint='lib1')
+        cache.put('script', ['line'], False, 0.1)
+        cache.get('script')
+        cache.get('other script')
+        conn = sqlite3.connect(self.path)
+        read_counters = lambda: dict(conn.execute(
+            "SELECT name, value FROM meta WHERE name IN ('hits', 'misses')"))
+        self.assertEqual({'hits': '0', 'misses': '0'}, read_counters())
+        self.assertEqual(1, cache.stats()['total_hits'])
+        cache.close()
+        self.assertEqual({'hits': 1, 'misses': 1},
+                         {k: int(v) for k, v in read_counters().items()})
+        conn.close()
+
+    def test_eviction_waits_for_slack(self):
+        cache = self.make_cache(max_entries=10, fingerprint='lib1')
+        for i in range(11):
+            cache.put('script{0}'.format(i), ['line'], False, 0.1)
+        self.assertEqual(11, cache.stats()['entries'])
+        cache.get('script0')
+        cache.put('script11', ['line'], False, 0.1)
+        self.assertEqual(10, cache.stats()['entries'])
+        self.assertEqual(['line'], cache.get('script0'))
+        self.assertIsNone(cache.get('script1'))
+
+    def test_coqlib_reload_invalidates(self):
+        coqlib_path = os.path.join(self.tmpdir, 'coqlib.v')
+        tactics_path = os.path.join(self.tmpdir, 'tactics_coq.txt')
+        with open(coqlib_path, 'w') as fout:
+            fout.write('Parameter _p : Entity -> Prop.\n')
+        resources = resources_module.get_resources()
+        set_resources(coqlib_path, tactics_path)
+        try:
+            cache = self.make_cache()
+            cache.put('script', ['line'], True, 0.1)
+            self.assertEqual(['line'], cache.get('script'))
+            with open(coqlib_path, 'w') as fout:
+                fout.write('Parameter _q : Entity -> Prop.\n')
+            # Make sure that the modification time changes.
+            os.utime(coqlib_path, ns=(0, os.stat(coqlib_path).st_mtime_ns + 10 ** 9))
+            self.assertIsNone(cache.get('script'))
+            self.assertEqual(0, cache.stats()['entries'])
+        finally:
+            resources_module._resources = resources
+
+if __name__ == '__main__':
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(ProofCacheTestCase)
+    suites = unittest.TestSuite([suite1])
+    unittest.TextTestRunner(verbosity=2).run(suites)
@@ -29,21 +29,42 @@ from subprocess import TimeoutExpired
 import sys
 import textwrap
 
+from .checkpoint import ProofCheckpoint
+from .coqtop_pool import set_coqtop_pool_size
+from .etree_utils import kStreamBatchSize
+from .etree_utils import process_xml_stream
+from .proof_cache import get_proof_cache
+from .proof_cache import set_proof_cache
+from .resources import get_resources
+from .resources import set_resources
 from .semantic_tools import prove_doc
 from .semparse import serialize_tree
+from .theorem import kFailureLogModes
+from .theorem import set_failure_logs
+from .utils import ProgressReporter
 from .utils import time_count
+from .wordnet_index import set_wordnet_index
 from .visualization_tools import convert_root_to_mathml
 
 ARGS=None
 DOCS=None
+PROGRESS=None
+# worker processes shared by all the batches of --stream mode
+POOL=None
+CHECKPOINT=None
+# position in the input of the first document of DOCS (in --stream mode)
+DOCS_OFFSET=0
 ABDUCTION=None
 kMaxTasksPerChild=None
+kChunkSize = 1
+kProgressInterval = 60
 lock = Lock()
 
 def main(args = None):
     global ARGS
     global DOCS
     global ABDUCTION
+    global CHECKPOINT
     DESCRIPTION=textwrap.dedent("""\
             The input file sem should contain the parsed sentences. All CCG trees correspond
             to the premises, except the last one, which is the hypothesis.
@@ -71,6 +92,52 @@ def main(args = None):
         help="Maximum running time for each possible theorem.")
     parser.add_argument("--ncores", nargs='?', type=int, default="1",
         help="Number of cores for multiprocessing.")
+    parser.add_argument("--chunksize", nargs='?', type=int, default=str(kChunkSize),
+        help="Number of documents sent at once to each process with --ncores.")
+    parser.add_argument("--progress", nargs='?', type=int, default=str(kProgressInterval),
+        help="Seconds between progress reports on stderr (0 to disable).")
+    parser.add_argument("--coq_workers", nargs='?', type=int, default="0",
+        help="Number of persistent coqtop processes per core, which load coqlib "
+             "only once (default: 0, launch a new coqtop for every theorem). With "
+             "more than 1, candidate theorems and their negations are proved in "
+             "parallel.")
+    parser.add_argument("--coqlib", nargs='?', type=str, default="coqlib.v",
+        help="Coq library whose Parameters are reserved predicates. Its compiled "
+             "coqlib.vo is the one that coqtop loads from the working directory.")
+    parser.add_argument("--tactics", nargs='?', type=str, default="tactics_coq.txt",
+        help="File with the tactics used to prove theorems.")
+    parser.add_argument("--replacement", nargs='?', type=str, default="replacement.txt",
+        help="File with the characters to replace in Coq scripts.")
+    parser.add_argument("--proof_cache", nargs='?', type=str, default="",
+        help="SQLite file where coqtop results are cached across runs "
+             "(default: no cache).")
+    parser.add_argument("--proof_cache_size", nargs='?', type=int, default="100000",
+        help="Maximum number of cached coqtop results.")
+    parser.add_argument("--wordnet_index", nargs='?', type=str, default="",
+        help="SQLite file built by scripts/wordnet_index.py with the WordNet "
+             "relations of all lemmas (default: query WordNet directly).")
+    parser.add_argument("--failure_logs", nargs='?', type=str, default="all",
+        choices=kFailureLogModes,
+        help="Theorems that get a failure log in the output: none, failed "
+             "(unproved theorems, from the output of the proof attempt) or all "
+             "(every theorem, running coqtop again with debug tactics). "
+             "Logs can be added later with scripts/failure_logs.py.")
+    parser.add_argument("--checkpoint", nargs='?', type=str, default="",
+        help="File where the proof of each document is appended as soon as it "
+             "is completed (default: no checkpoint).")
+    parser.add_argument("--resume", action="store_true", default=False,
+        help="Do not prove again the documents found in --checkpoint.")
+    parser.add_argument("--overwrite_checkpoint", action="store_true",
+        default=False,
+        help="Start --checkpoint anew even if it already has proofs "
+             "(by default, an existing checkpoint is only used with --resume).")
+    parser.add_argument("--stream", action="store_true", default=False,
+        help="Read and write documents incrementally so that memory usage does "
+             "not grow with the input size. It requires --proof and cannot be "
+             "used with --graph_out.")
+    parser.add_argument("--stream_batch_size", nargs='?', type=int,
+        default=str(kStreamBatchSize),
+        help="Number of documents kept in memory in --stream mode.")
     ARGS = parser.parse_args()
 
     logging.basicConfig(level=logging.WARNING)
@@ -79,7 +146,32 @@ def main(args = None):
         print('File does not exist: {0}'.format(ARGS.sem), file=sys.stderr)
         parser.print_help(file=sys.stderr)
         sys.exit(1)
+    if ARGS.stream and (not ARGS.proof or ARGS.graph_out):
+        print('--stream requires --proof and cannot be used with --graph_out',
+              file=sys.stderr)
+        sys.exit(1)
     
+    set_resources(ARGS.coqlib, ARGS.tactics, ARGS.replacement)
+    set_coqtop_pool_size(ARGS.coq_workers)
+    set_proof_cache(ARGS.proof_cache, ARGS.proof_cache_size)
+    cache = get_proof_cache()
+    cache_stats = cache.stats() if cache is not None else None
+    set_failure_logs(ARGS.failure_logs)
+    set_wordnet_index(ARGS.wordnet_index)
+    # Loaded before forking, so that worker processes share them.
+    get_resources().preload()
+    if ARGS.resume and not ARGS.checkpoint:
+        print('--resume requires --checkpoint', file=sys.stderr)
+        sys.exit(1)
+    if ARGS.checkpoint:
+        try:
+            CHECKPOINT = ProofCheckpoint(
+                ARGS.checkpoint, ARGS.resume, ARGS.overwrite_checkpoint)
+        except ValueError as e:
+            print('{0} Use --resume to continue it, or --overwrite_checkpoint '
+                  'to start it anew.'.format(e), file=sys.stderr)
+            sys.exit(1)
+
     if ARGS.abduction == "spsa":
         from .abduction_spsa import AxiomsWordnet
         ABDUCTION = AxiomsWordnet()
@@ -87,25 +179,42 @@ def main(args = None):
         from .abduction_naive import AxiomsWordnet
         ABDUCTION = AxiomsWordnet()
 
-    parser = etree.XMLParser(remove_blank_text=True)
-    root = etree.parse(ARGS.sem, parser)
+    if ARGS.stream:
+        prove_docs_stream(ARGS.sem, ARGS.proof, ARGS.stream_batch_size)
+    else:
+        parser = etree.XMLParser(remove_blank_text=True)
+        root = etree.parse(ARGS.sem, parser)
 
-    DOCS = root.findall('.//document')
-    document_inds = range(len(DOCS))
-    proof_nodes = prove_docs(document_inds, ARGS.ncores)
-    assert len(proof_nodes) == len(DOCS), \
-        'Num. elements mismatch: {0} vs {1}'.format(len(proof_nodes), len(DOCS))
-    for doc, proof_node in zip(DOCS, proof_nodes):
-        doc.append(proof_node)
+        DOCS = root.findall('.//document')
+        document_inds = range(len(DOCS))
+        num_proofs = prove_docs(document_inds, ARGS.ncores)
+        assert num_proofs == len(DOCS), \
+            'Num. elements mismatch: {0} vs {1}'.format(num_proofs, len(DOCS))
+
+        if ARGS.proof:
+            serialize_tree_to_file(root, ARGS.proof)
 
-    if ARGS.proof:
-        serialize_tree_to_file(root, ARGS.proof)
+    if CHECKPOINT is not None:
+        CHECKPOINT.close()
+
+    if cache is not None:
+        print_cache_stats(cache_stats, cache.stats())
 
     if ARGS.graph_out:
         html_str = convert_root_to_mathml(root, ARGS.gold_trees)
         with codecs.open(ARGS.graph_out, 'w', 'utf-8') as fout:
             fout.write(html_str)
 
+def print_cache_stats(start_stats, end_stats):
+    """
+    Prints the hits and misses of the proof cache during this run, in all
+    processes (as written to the cache by each of them when they finish).
+    """
+    hits = end_stats['total_hits'] - start_stats['total_hits']
+    misses = end_stats['total_misses'] - start_stats['total_misses']
+    print('Proof cache: {0} hits, {1} misses, {2} entries'.format(
+        hits, misses, end_stats['entries']), file=sys.stderr)
+
 @time_count
 def serialize_tree_to_file(tree_xml, fname):
     root_xml_str = serialize_tree(tree_xml)
@@ -115,35 +224,161 @@ def serialize_tree_to_file(tree_xml, fname):
 
 @time_count
 def prove_docs(document_inds, ncores=1):
+    """
+    Appends a proof node to each document of DOCS as soon as it is proved.
+    Returns the number of proved documents.
+    """
+    global PROGRESS
+    PROGRESS = ProgressReporter(len(document_inds), ARGS.progress)
+    num_proofs = 0
+    for document_ind, proof_node in iter_proofs(document_inds, ncores):
+        DOCS[document_ind].append(etree.fromstring(proof_node))
+        num_proofs += 1
+    print('', file=sys.stdout)
+    if ARGS.progress > 0:
+        PROGRESS.report()
+    return num_proofs
+
+def prove_docs_batch(document_inds, ncores=1):
+    proof_nodes = {}
+    for document_ind, proof_node in iter_proofs(document_inds, ncores):
+        proof_nodes[document_ind] = etree.fromstring(proof_node)
+    return [proof_nodes[i] for i in document_inds]
+
+def iter_proofs(document_inds, ncores=1):
+    """
+    Yields pairs (document index, serialized proof node) as proofs finish,
+    and counts them in PROGRESS. Proofs are recorded in CHECKPOINT, and
+    documents that it already holds are not proved again.
+    """
+    pending_inds = []
+    for document_ind in document_inds:
+        proof_node = get_checkpoint_proof(document_ind)
+        if proof_node is None:
+            pending_inds.append(document_ind)
+            continue
+        print_proof_label(DOCS[document_ind], etree.fromstring(proof_node))
+        if PROGRESS is not None:
+            PROGRESS.update()
+        yield document_ind, proof_node
     if ncores <= 1:
-        proof_nodes = prove_docs_seq(document_inds)
+        proofs = prove_docs_seq(pending_inds)
     else:
-        proof_nodes = prove_docs_par(document_inds, ncores)
+        proofs = prove_docs_par(pending_inds, ncores, ARGS.chunksize)
+    for document_ind, proof_node in proofs:
+        if CHECKPOINT is not None:
+            CHECKPOINT.record(DOCS_OFFSET + document_ind,
+                              get_doc_id(DOCS[document_ind]), proof_node)
+        if PROGRESS is not None:
+            PROGRESS.update()
+        yield document_ind, proof_node
+
+def get_checkpoint_proof(document_ind):
+    if CHECKPOINT is None:
+        return None
+    return CHECKPOINT.get(DOCS_OFFSET + document_ind, get_doc_id(DOCS[document_ind]))
+
+def get_doc_id(doc):
+    return doc.get('id', doc.get('pair_id', ''))
+
+@time_count
+def prove_docs_stream(input_fname, output_fname, batch_size=kStreamBatchSize):
+    """
+    Proves the documents of `input_fname` in batches of `batch_size`. With
+    several cores, the same worker processes prove all batches: they are
+    forked before the documents are read, so documents are sent to them.
+    """
+    global PROGRESS, POOL
+    PROGRESS = ProgressReporter(None, ARGS.progress)
+    if ARGS.ncores > 1:
+        POOL = Pool(processes=ARGS.ncores, maxtasksperchild=kMaxTasksPerChild)
+    completed = False
+    try:
+        num_docs = process_xml_stream(
+            input_fname, output_fname, 'document', add_proofs_to_docs, batch_size)
+        completed = True
+    finally:
+        if POOL is not None:
+            if completed:
+                POOL.close()
+            else:
+                POOL.terminate()
+            POOL.join()
+            POOL = None
     print('', file=sys.stdout)
-    proof_nodes = [etree.fromstring(p) for p in proof_nodes]
-    return proof_nodes
+    if ARGS.progress > 0:
+        PROGRESS.report()
+    logging.info('Proved {0} documents in stream mode.'.format(num_docs))
+
+def add_proofs_to_docs(docs):
+    """
+    Appends proof nodes to a batch of documents of the input stream.
+    Documents are made visible to (forked) worker processes through DOCS.
+    """
+    global DOCS, DOCS_OFFSET
+    DOCS = docs
+    proof_nodes = prove_docs_batch(range(len(docs)), ARGS.ncores)
+    for doc, proof_node in zip(docs, proof_nodes):
+        doc.append(proof_node)
+    DOCS_OFFSET += len(docs)
 
-def prove_docs_par(document_inds, ncores=3):
+def prove_docs_par(document_inds, ncores=3, chunksize=kChunkSize):
+    """
+    Yields (document index, proof node) in order of completion. Documents
+    that are expected to take longer are sent first and in small chunks,
+    so that slow proofs do not leave the other processes idle at the end.
+    In --stream mode, documents are sent to the workers of POOL.
+    """
+    document_inds = sorted(
+        document_inds, key=lambda i: estimate_proof_cost(DOCS[i]), reverse=True)
+    if POOL is not None:
+        tasks = [(document_ind, etree.tostring(DOCS[document_ind], with_tail=False))
+                 for document_ind in document_inds]
+        yield from POOL.imap_unordered(
+            prove_doc_str_with_ind, tasks, max(1, chunksize))
+        return
     pool = Pool(processes=ncores, maxtasksperchild=kMaxTasksPerChild)
-    proof_nodes = pool.map(prove_doc_ind, document_inds)
-    pool.close()
-    pool.join()
-    return proof_nodes
+    completed = False
+    try:
+        for result in pool.imap_unordered(
+                prove_doc_ind_with_ind, document_inds, max(1, chunksize)):
+            yield result
+        completed = True
+    finally:
+        if completed:
+            pool.close()
+        else:
+            pool.terminate()
+        pool.join()
 
 def prove_docs_seq(document_inds):
-    proof_nodes = []
     for document_ind in document_inds:
-        proof_node = prove_doc_ind(document_ind)
-        proof_nodes.append(proof_node)
-    return proof_nodes
+        yield prove_doc_ind_with_ind(document_ind)
+
+def estimate_proof_cost(doc):
+    """
+    Rough cost of proving a document: the size of the formulas of all its
+    candidate semantics, which grows with the number of theorems to try.
+    """
+    sems = doc.xpath('./sentences/sentence/semantics/span[1]/@sem')
+    return sum(len(sem) for sem in sems)
+
+def prove_doc_ind_with_ind(document_ind):
+    return document_ind, prove_doc_ind(document_ind)
+
+def prove_doc_str_with_ind(task):
+    document_ind, doc_str = task
+    return document_ind, prove_doc_node(etree.fromstring(doc_str))
 
 def prove_doc_ind(document_ind):
     """
     Perform RTE inference for the document ID document_ind.
     It returns an XML node with proof information.
     """
+    return prove_doc_node(DOCS[document_ind])
+
+def prove_doc_node(doc):
     global lock
-    doc = DOCS[document_ind]
     proof_node = etree.Element('proof')
     inference_result = 'unknown'
     try:
@@ -165,6 +400,10 @@ def prove_doc_ind(document_ind):
         lock.release()
         proof_node.set('status', 'failed')
         proof_node.set('inference_result', 'unknown')
+    print_proof_label(doc, proof_node)
+    return etree.tostring(proof_node)
+
+def print_proof_label(doc, proof_node):
     if ARGS.print == 'status':
         label = proof_node.get('status')
     else:
@@ -178,7 +417,6 @@ def prove_doc_ind(document_ind):
         print(label[0], end='', file=sys.stdout)
     lock.release()
     sys.stdout.flush()
-    return etree.tostring(proof_node)
 
 if __name__ == '__main__':
     main()
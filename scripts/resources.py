@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import codecs
+import hashlib
+import os
+import re
+import threading
+
+kDefaultTactics = 'Set Firstorder Depth 1. nltac. Set Firstorder Depth 6. nltac. Qed'
+
+class ResourceFile(object):
+    """
+    Contents of a file as parsed by `read(path)`. The file is read the first
+    time that the contents are needed, and again only when its modification
+    time or size changes. If the file does not exist, `default` is used.
+    Relative paths are relative to the working directory at reading time.
+    """
+
+    def __init__(self, path, read, default=None):
+        self.path = path
+        self.read = read
+        self.default = default
+        self.version = None
+        self.contents = default
+        self.lock = threading.Lock()
+
+    def get(self):
+        try:
+            stat = os.stat(self.path)
+            version = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            version = None
+        if version != self.version:
+            with self.lock:
+                if version != self.version:
+                    self.contents = self.default if version is None else self.read(self.path)
+                    self.version = version
+        return self.contents
+
+def read_reserved_predicates(coqlib_path):
+    """
+    Returns the predicates defined as "Parameter" in coqlib.v.
+    """
+    with codecs.open(coqlib_path, 'r', 'utf-8') as finput:
+        return frozenset(line.split()[1] for line in finput
+                         if line.startswith('Parameter '))
+
+def read_digest(path):
+    with open(path, 'rb') as fin:
+        return hashlib.sha1(fin.read()).hexdigest()
+
+def read_tactics(tactics_path):
+    try:
+        with open(tactics_path) as fin:
+            return fin.read().strip()
+    except:
+        return kDefaultTactics
+
+class ReplacementTable(object):
+    """
+    Substitutions of a replacement file (one "invalid valid" pair per line),
+    applied in the order of the file. When the invalid strings are single
+    characters that do not appear in any valid string, as in replacement.txt,
+    the order does not matter and all substitutions are done in a single
+    pass with one regular expression.
+    """
+
+    def __init__(self, repl):
+        self.repl = repl
+        self.regex = None
+        if repl and all(len(invalid) == 1 and not any(invalid in valid for valid in repl.values())
+                        for invalid in repl):
+            self.regex = re.compile('|'.join(map(re.escape, repl)))
+
+    def substitute(self, script):
+        if self.regex is not None:
+            return self.regex.sub(lambda match: self.repl[match.group(0)], script)
+        for invalid_char, valid_char in self.repl.items():
+            script = script.replace(invalid_char, valid_char)
+        return script
+
+def read_replacement_table(replacement_path):
+    with codecs.open(replacement_path, 'r', 'utf-8') as finput:
+        repl = dict(line.strip().split() for line in finput)
+    return ReplacementTable(repl)
+
+class Resources(object):
+    """
+    Files that the prover needs for every theorem: coqlib.v (for its
+    reserved predicates), tactics_coq.txt and replacement.txt. They are
+    loaded lazily and reloaded when they change. Processes forked after
+    `preload` share the loaded contents.
+    """
+
+    def __init__(self, coqlib_path='coqlib.v', tactics_path='tactics_coq.txt',
+                 replacement_path='replacement.txt'):
+        self.coqlib_path = coqlib_path
+        self.tactics_path = tactics_path
+        self.replacement_path = replacement_path
+        self.reserved_predicates = ResourceFile(coqlib_path, read_reserved_predicates)
+        self.coqlib_digest = ResourceFile(coqlib_path, read_digest, '')
+        self.tactics = ResourceFile(tactics_path, read_tactics, kDefaultTactics)
+        self.replacement_tables = {}
+        self.lock = threading.Lock()
+
+    def get_reserved_predicates(self):
+        """
+        Returns the predicates of coqlib.v, which must not be renamed or
+        redefined. A missing coqlib.v is an error: without it, reserved
+        predicates would silently be treated as ordinary ones.
+        """
+        reserved_predicates = self.reserved_predicates.get()
+        if reserved_predicates is None:
+            raise FileNotFoundError('Coq library not found: {0}'.format(self.coqlib_path))
+        return reserved_predicates
+
+    def get_coqlib_digest(self):
+        """
+        Returns a digest of the contents of coqlib.v ('' if it does not exist).
+        """
+        return self.coqlib_digest.get()
+
+    def get_tactics(self):
+        return self.tactics.get()
+
+    def get_replacement_table(self, replacement_path=None):
+        """
+        Returns the ReplacementTable of the given file
+        (by default, that of these resources).
+        """
+        if replacement_path is None:
+            replacement_path = self.replacement_path
+        replacements = self.replacement_tables.get(replacement_path)
+        if replacements is None:
+            with self.lock:
+                replacements = self.replacement_tables.setdefault(
+                    replacement_path, ResourceFile(replacement_path, read_replacement_table))
+        table = replacements.get()
+        if table is None:
+            raise FileNotFoundError('Replacement file not found: {0}'.format(replacement_path))
+        return table
+
+    def preload(self):
+        self.get_reserved_predicates()
+        self.get_coqlib_digest()
+        self.get_tactics()
+        if os.path.exists(self.replacement_path):
+            self.get_replacement_table()
+
+_resources = Resources()
+
+def set_resources(coqlib_path='coqlib.v', tactics_path='tactics_coq.txt',
+                  replacement_path='replacement.txt'):
+    """
+    Sets the files used by get_resources.
+    """
+    global _resources
+    _resources = Resources(coqlib_path, tactics_path, replacement_path)
+    return _resources
+
+def get_resources():
+    return _resources
@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from .resources import kDefaultTactics
+from .resources import Resources
+
+class ResourcesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.coqlib_path = os.path.join(self.tmpdir, 'coqlib.v')
+        self.tactics_path = os.path.join(self.tmpdir, 'tactics_coq.txt')
+        self.replacement_path = os.path.join(self.tmpdir, 'replacement.txt')
+        self.resources = Resources(
+            self.coqlib_path, self.tactics_path, self.replacement_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_file(self, path, text):
+        with open(path, 'w', encoding='utf-8') as fout:
+            fout.write(text)
+        # Make sure that the modification time changes.
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10 ** 9))
+
+    def test_reserved_predicates(self):
+        self.write_file(self.coqlib_path,
+            'Require Export Coq.Logic.Classical.\n'
+            'Parameter Subj : Event -> Entity.\n'
+            'Parameter _that : Prop -> Prop.\n'
+            'Axiom ax1 : forall x, True.\n')
+        self.assertEqual(frozenset(['Subj', '_that']),
+                         self.resources.get_reserved_predicates())
+
+    def test_missing_files(self):
+        with self.assertRaises(FileNotFoundError):
+            self.resources.get_reserved_predicates()
+        self.assertEqual(kDefaultTactics, self.resources.get_tactics())
+        with self.assertRaises(FileNotFoundError):
+            self.resources.get_replacement_table()
+
+    def test_files_are_reloaded_when_changed(self):
+        self.write_file(self.tactics_path, 'nltac. Qed\n')
+        self.assertEqual('nltac. Qed', self.resources.get_tactics())
+        self.write_file(self.tactics_path, 'firstorder. Qed\n')
+        self.assertEqual('firstorder. Qed', self.resources.get_tactics())
+        os.remove(self.tactics_path)
+        self.assertEqual(kDefaultTactics, self.resources.get_tactics())
+
+    def test_files_are_read_once(self):
+        self.write_file(self.replacement_path, u'！ excl\n')
+        table = self.resources.get_replacement_table()
+        self.assertEqual('_a excl', table.substitute('_a ！'))
+        self.assertIs(table, self.resources.get_replacement_table())
+
+if __name__ == '__main__':
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(ResourcesTestCase)
+    suites = unittest.TestSuite([suite1])
+    unittest.TextTestRunner(verbosity=2).run(suites)
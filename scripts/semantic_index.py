@@ -15,11 +15,16 @@
 #  limitations under the License.
 
 import codecs
+from collections import defaultdict
+from collections import OrderedDict
+import heapq
 from lxml import etree
 import simplejson
+import threading
 import yaml
 
-from .category import Category
+from .category import get_category
+from .category import remove_feats_from_category
 from .etree_utils import get_node_at_path
 from .logic_parser import lexpr
 from .normalization import normalize_token
@@ -35,19 +40,39 @@ class SemanticIndex(object):
         else:
             self.rules = []
 
+    @property
+    def rules(self):
+        return self._rules
+
+    @rules.setter
+    def rules(self, rules):
+        self._rules = rules
+        self.rule_index = RuleIndex(rules)
+
     def get_relevant_rules(self, rule_pattern):
         """
         Given a rule pattern (that is, a SemanticRule with several features
         specified, but no semantics associated), it searches for relevant
         rules with the same features but with associated semantics.
+        Relevant rules are returned in the same order as in the templates.
         """
         relevant_rules = []
-        for rule in self.rules:
+        for rule in self.rule_index.get_candidates(rule_pattern):
             if rule.match(rule_pattern):
                 relevant_rules.append(rule)
         return relevant_rules
 
-    def get_semantic_representation(self, ccg_tree, tokens):
+    def get_semantic_representation(self, ccg_tree, tokens, exprs=None,
+                                    memo=None):
+        """
+        Returns the semantics (an NLTK Expression) of `ccg_tree`, given that
+        its children already have semantics. If given, `exprs` is a dictionary
+        from CCG nodes to their semantic expressions, used to avoid parsing
+        the 'sem' attribute of children, and `memo` is the CompositionMemo
+        of the document.
+        """
+        if memo is None:
+            memo = CompositionMemo()
         rule_pattern = make_rule_pattern_from_ccg_node(ccg_tree, tokens)
         # Obtain the semantic template.
         relevant_rules = self.get_relevant_rules(rule_pattern)
@@ -55,10 +80,12 @@ class SemanticIndex(object):
             return None
         elif not relevant_rules:
             semantic_template = build_default_template(rule_pattern, ccg_tree)
+            template_str = str(semantic_template)
             semantic_rule = None
         else:
             semantic_rule = relevant_rules.pop()
             semantic_template = semantic_rule.semantics
+            template_str = semantic_rule.semantics_str
         # Apply template to relevant (current, child or children) CCG node(s).
         if len(ccg_tree) == 0:
             base = rule_pattern.attributes.get('base')
@@ -68,8 +95,9 @@ class SemanticIndex(object):
               .format(etree.tostring(ccg_tree, pretty_print=True),
                       rule_pattern.attributes)
             predicate_string = base if base != '*' else surf
-            predicate = lexpr(predicate_string)
-            semantics = semantic_template(predicate).simplify()
+            semantics = memo.get_composition(
+                (template_str, predicate_string), (),
+                lambda: semantic_template(lexpr(predicate_string)).simplify())
             # Assign coq types.
             if semantic_rule != None and 'coq_type' in semantic_rule.attributes:
                 coq_types = semantic_rule.attributes['coq_type']
@@ -78,18 +106,22 @@ class SemanticIndex(object):
             else:
                 ccg_tree.set('coq_type', "")
         elif len(ccg_tree) == 1:
-            predicate = lexpr(ccg_tree[0].get('sem'))
-            semantics = semantic_template(predicate).simplify()
+            semantics = memo.get_composition(
+                (template_str,), (get_node_semantics(ccg_tree[0], exprs),),
+                lambda child_semantics: semantic_template(
+                    child_semantics).simplify())
             # Assign coq types.
             ccg_tree.set('coq_type', ccg_tree[0].attrib.get('coq_type', ""))
         else:
             var_paths = semantic_rule.attributes.get('var_paths', [[0], [1]])
-            semantics = semantic_template
+            child_nodes = [get_node_at_path(ccg_tree, path) for path in var_paths]
+            semantics = memo.get_composition(
+                (template_str,),
+                tuple(get_node_semantics(c, exprs) for c in child_nodes),
+                lambda *children_semantics: apply_and_simplify(
+                    semantic_template, children_semantics))
             coq_types_list = []
-            for path in var_paths:
-                child_node = get_node_at_path(ccg_tree, path)
-                child_semantics = lexpr(child_node.get('sem'))
-                semantics = semantics(child_semantics).simplify()
+            for child_node in child_nodes:
                 child_coq_types = child_node.get('coq_type', None)
                 if child_coq_types is not None and child_coq_types != "":
                     coq_types_list.append(child_coq_types)
@@ -97,6 +129,147 @@ class SemanticIndex(object):
                 ccg_tree.set('coq_type', ' ||| '.join(coq_types_list))
         return semantics
 
+# Maximum number of compositions memoized for one document.
+kCompositionMemoSize = 100000
+
+class CompositionMemo(object):
+    """
+    LRU memo of the (simplified) expressions produced by semantic
+    compositions, shared by the sentences and n-best trees of one document.
+    A composition is identified by the string of its template (or operation)
+    and by its argument expressions, compared by identity: equal subtrees
+    obtain the very same expression from the memo, so that their parents
+    are found in the memo too, while expressions that only print alike are
+    never confused. Arguments are kept with the result, so that their ids
+    are not reused while the entry is in the memo.
+    """
+
+    def __init__(self, max_size=kCompositionMemoSize):
+        self.max_size = max_size
+        self.compositions = OrderedDict()
+
+    def get_composition(self, key, arguments, compose):
+        """
+        Returns the expression that `compose(*arguments)` produces, where
+        `key` is a tuple of strings that identifies the composition.
+        """
+        key = key + tuple(id(argument) for argument in arguments)
+        composition = self.compositions.get(key)
+        if composition is not None:
+            self.compositions.move_to_end(key)
+            return composition[0]
+        semantics = compose(*arguments)
+        self.compositions[key] = (semantics, arguments)
+        while len(self.compositions) > self.max_size:
+            self.compositions.popitem(last=False)
+        return semantics
+
+def apply_and_simplify(function, arguments):
+    for argument in arguments:
+        function = function(argument).simplify()
+    return function
+
+def get_node_semantics(ccg_node, exprs=None):
+    """
+    Returns the semantic expression of a CCG node, from the side table
+    `exprs` if available, or otherwise by parsing its 'sem' attribute.
+    """
+    if exprs is not None and ccg_node in exprs:
+        return exprs[ccg_node]
+    return lexpr(ccg_node.get('sem'))
+
+# Characters that make a template category behave as a regular expression
+# in Category.match (e.g. the category "." matches any one-symbol category).
+kRegexChars = set('.^$*+?{}[]')
+# Attributes used to split rules of the same category into finer buckets.
+kDiscriminatingAttributes = ['surf', 'base', 'rule', 'pos']
+
+class RuleIndex(object):
+    """
+    Discrimination index of semantic rules, built once when rules are loaded.
+    Rules are bucketed by terminal vs. non-terminal, by their category
+    (without features, and where slashes and bars are equivalent), and by
+    the value of one of the discriminating attributes that they require.
+    get_candidates returns a superset of the rules that match a pattern,
+    in file order, so that the full SemanticRule.match decides the rest.
+    """
+
+    def __init__(self, rules):
+        self.buckets = defaultdict(lambda: defaultdict(list))
+        self.regex_rules = defaultdict(list)
+        for position, rule in enumerate(rules):
+            required = get_required_attributes(rule)
+            entry = (position, rule, required)
+            is_terminal = rule.is_terminal_rule()
+            types = rule.category.types
+            if any(c in kRegexChars for c in types):
+                self.regex_rules[is_terminal].append(entry)
+                continue
+            bucket = self.buckets[(is_terminal, get_category_key(types))]
+            bucket[get_discriminating_key(required)].append(entry)
+
+    def get_candidates(self, rule_pattern):
+        is_terminal = rule_pattern.is_terminal_rule()
+        bucket = self.buckets.get(
+            (is_terminal, get_category_key(rule_pattern.category.types)), {})
+        attributes = rule_pattern.attributes
+        entries_lists = [bucket.get(None, []), self.regex_rules.get(is_terminal, [])]
+        for attribute_name in kDiscriminatingAttributes:
+            value = attributes.get(attribute_name)
+            if isinstance(value, str):
+                entries_lists.append(bucket.get((attribute_name, value.lower()), []))
+        entries_lists = [e for e in entries_lists if e]
+        if len(entries_lists) == 1:
+            entries = entries_lists[0]
+        else:
+            entries = heapq.merge(*entries_lists, key=lambda e: e[0])
+        return [rule for _, rule, required in entries \
+                if required_attributes_match(required, attributes)]
+
+def get_category_key(types):
+    return types.replace('\\', '|').replace('/', '|')
+
+def get_required_attributes(rule):
+    """
+    Returns the attributes that a CCG node must have for `rule` to match,
+    as a list of triplets (attribute name, is category, expected key).
+    Attributes that are not plain strings are left to SemanticRule.match.
+    """
+    required = []
+    for attribute_name, value in rule.attributes.items():
+        if attribute_name == 'var_paths' or 'coq_type' in attribute_name \
+           or '_any_' in attribute_name or not isinstance(value, str):
+            continue
+        if 'category' in attribute_name:
+            types = remove_feats_from_category(value)
+            if not any(c in kRegexChars for c in types):
+                required.append((attribute_name, True, get_category_key(types)))
+        else:
+            required.append((attribute_name, False, value.lower()))
+    return required
+
+def get_discriminating_key(required):
+    for attribute_name in kDiscriminatingAttributes:
+        for name, is_category, key in required:
+            if name == attribute_name:
+                return (name, key)
+    return None
+
+def required_attributes_match(required, attributes):
+    for attribute_name, is_category, key in required:
+        value = attributes.get(attribute_name)
+        if value is None:
+            return False
+        if not isinstance(value, str):
+            continue
+        if is_category:
+            value = get_category_key(remove_feats_from_category(value))
+        else:
+            value = value.lower()
+        if value != key:
+            return False
+    return True
+
 def get_attributes_from_ccg_node_recursively(ccg_tree, tokens):
     """
     Copies attributes from children node into the current node,
@@ -127,11 +300,48 @@ def make_rule_pattern_from_ccg_node(ccg_tree, tokens):
     rule_pattern = SemanticRule(category, semantics, attributes)
     return rule_pattern
 
+# Number of XML trees (e.g. <ccg> or <tokens> elements) whose id index is kept.
+kIdIndexCacheSize = 8
+_id_indices = OrderedDict()
+_id_indices_lock = threading.Lock()
+
 def find_node_by_id(node_id, xml_tree):
-    nodes = xml_tree.xpath('.//descendant-or-self::*[@id="%s"]' % node_id)
-    if not nodes:
+    """
+    Returns the first node (in document order) of `xml_tree` (or `xml_tree`
+    itself) whose id is `node_id`. An id->node index is built once for
+    the most recently used trees, so that repeated lookups are constant time.
+    The index is rebuilt if the tree changed since it was built.
+    """
+    node = get_id_index(xml_tree).get(node_id)
+    if node is None or not is_indexed_node_valid(node, node_id, xml_tree):
+        node = get_id_index(xml_tree, rebuild=True).get(node_id)
+    if node is None:
         raise(ValueError('It should have found a span for id {0}'.format(node_id)))
-    return nodes[0]
+    return node
+
+def get_id_index(xml_tree, rebuild=False):
+    with _id_indices_lock:
+        id_index = _id_indices.get(xml_tree)
+        if id_index is not None and not rebuild:
+            _id_indices.move_to_end(xml_tree)
+            return id_index
+        id_index = {}
+        for node in xml_tree.iter():
+            node_id = node.get('id')
+            if node_id is not None and node_id not in id_index:
+                id_index[node_id] = node
+        _id_indices[xml_tree] = id_index
+        _id_indices.move_to_end(xml_tree)
+        while len(_id_indices) > kIdIndexCacheSize:
+            _id_indices.popitem(last=False)
+        return id_index
+
+def is_indexed_node_valid(node, node_id, xml_tree):
+    if node.get('id') != node_id:
+        return False
+    while node is not None and node is not xml_tree:
+        node = node.getparent()
+    return node is xml_tree
 
 def load_semantic_rules(fn):
     semantic_rules = []
@@ -158,7 +368,7 @@ def build_default_template(rule_pattern, ccg_tree):
     if len(ccg_tree) == 0:
         num_arguments = category.get_num_args()
     elif len(ccg_tree) == 1:
-        category2 = Category(ccg_tree.get('category'))
+        category2 = get_category(ccg_tree.get('category'))
         num_arguments = category.get_num_args() - category2.get_num_args()
     variable_names = ['x' + str(i) for i in range(num_arguments)]
     if not variable_names:
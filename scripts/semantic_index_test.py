@@ -22,9 +22,14 @@ import nltk
 from nltk.sem.logic import LogicalExpressionException
 
 from .ccg2lambda_tools import assign_semantics_to_ccg
+from .ccg2lambda_tools import build_ccg_tree
+from .ccg2lambda_tools import normalize_tokens
 from .logic_parser import lexpr
+from .semantic_index import CompositionMemo
 from .semantic_index import SemanticIndex
 from .semantic_index import SemanticRule
+from .semantic_index import find_node_by_id
+from .semantic_index import make_rule_pattern_from_ccg_node
 
 # TODO: ensure that 'var_paths' is not matching attributes in CCG XML trees.
 class GetSemanticRepresentationTestCase(unittest.TestCase):
@@ -187,7 +192,156 @@ class GetSemanticRepresentationTestCase(unittest.TestCase):
         expected_semantics = lexpr(r'(_base1 -> _base2)')
         self.assertEqual(expected_semantics, semantics)
 
+class RuleIndexTestCase(unittest.TestCase):
+    def assert_same_rules_as_linear_scan(self, semantic_index, rule_pattern):
+        expected_rules = [r for r in semantic_index.rules if r.match(rule_pattern)]
+        relevant_rules = semantic_index.get_relevant_rules(rule_pattern)
+        self.assertEqual(expected_rules, relevant_rules)
+
+    def test_regex_category_and_file_order(self):
+        semantic_index = SemanticIndex(None)
+        semantic_rules = [SemanticRule(r'N', r'\P.P', {}),
+                          SemanticRule(r'.', r'\P.P', {}),
+                          SemanticRule(r'N', r'\P.P', {'surf' : 'surf1'}),
+                          SemanticRule(r'N', r'\P.P', {'surf' : 'surf2'}),
+                          SemanticRule(r'N', r'\P.P', {'pos' : 'POS1'})]
+        semantic_index.rules = semantic_rules
+        rule_pattern = SemanticRule(r'N', None, {'surf' : 'surf1', 'pos' : 'pos1'})
+        relevant_rules = semantic_index.get_relevant_rules(rule_pattern)
+        self.assertEqual([semantic_rules[i] for i in [0, 2, 4]], relevant_rules)
+        rule_pattern = SemanticRule(r'.', None, {'surf' : '.'})
+        relevant_rules = semantic_index.get_relevant_rules(rule_pattern)
+        self.assertEqual([semantic_rules[1]], relevant_rules)
+
+    def test_child_category(self):
+        semantic_index = SemanticIndex(None)
+        semantic_rules = [SemanticRule(r'NP', r'\F1 F2.(F1 & F2)',
+                                       {'rule' : '>', 'child0_category' : 'NP|NP'}),
+                          SemanticRule(r'NP', r'\F1 F2.(F1 & F2)',
+                                       {'rule' : '>', 'child0_category' : 'N'})]
+        semantic_index.rules = semantic_rules
+        rule_pattern = SemanticRule(r'NP', None,
+            {'rule' : '>', 'child0_category' : 'NP\\NP[case=nc]', 'child1' : 'x'})
+        relevant_rules = semantic_index.get_relevant_rules(rule_pattern)
+        self.assertEqual([semantic_rules[0]], relevant_rules)
+
+    def test_same_rules_as_linear_scan_on_templates(self):
+        doc = etree.parse('testcase/jsem_001_generalized_quantifier.txt.xml')
+        for templates in ['ja/semantic_templates_ja_emnlp2016.yaml',
+                          'ja/semantic_templates_ja_event.yaml']:
+            semantic_index = SemanticIndex(templates)
+            for sentence in doc.xpath('//sentence'):
+                tokens = normalize_tokens(sentence.find('.//tokens'))
+                for ccg in sentence.xpath('./ccg'):
+                    ccg_tree = build_ccg_tree(ccg)
+                    for node in ccg_tree.iter():
+                        rule_pattern = make_rule_pattern_from_ccg_node(node, tokens)
+                        self.assert_same_rules_as_linear_scan(semantic_index, rule_pattern)
+
+class FindNodeByIdTestCase(unittest.TestCase):
+    def setUp(self):
+        ccg_str = r"""
+        <ccg root="sp1-3" id="ccg1">
+          <span terminal="t1_1" category="N" end="2" begin="1" id="sp1-1"/>
+          <span terminal="t1_2" category="N" end="3" begin="2" id="sp1-2"/>
+          <span child="sp1-1 sp1-2" rule="lex" category="NP" end="3" begin="1" id="sp1-3"/>
+          <span terminal="t1_3" category="N" end="4" begin="3" id="sp1-1"/>
+        </ccg>
+        """
+        self.ccg = etree.fromstring(ccg_str)
+
+    def test_first_node_in_document_order(self):
+        self.assertIs(self.ccg[0], find_node_by_id('sp1-1', self.ccg))
+        self.assertIs(self.ccg[2], find_node_by_id('sp1-3', self.ccg))
+        self.assertIs(self.ccg, find_node_by_id('ccg1', self.ccg))
+
+    def test_missing_id_raises(self):
+        with self.assertRaises(ValueError):
+            find_node_by_id('sp1-9', self.ccg)
+
+    def test_modified_tree(self):
+        find_node_by_id('sp1-2', self.ccg)
+        self.ccg.remove(self.ccg[1])
+        with self.assertRaises(ValueError):
+            find_node_by_id('sp1-2', self.ccg)
+        self.ccg[0].set('id', 'sp1-5')
+        self.assertIs(self.ccg[0], find_node_by_id('sp1-5', self.ccg))
+        self.assertIs(self.ccg[2], find_node_by_id('sp1-1', self.ccg))
+
+class CountingCompositionMemo(CompositionMemo):
+    def __init__(self):
+        super(CountingCompositionMemo, self).__init__()
+        self.compositions_missed = []
+
+    def get_composition(self, key, arguments, compose):
+        def compose_counted(*arguments):
+            self.compositions_missed.append(key)
+            return compose(*arguments)
+        return super(CountingCompositionMemo, self).get_composition(
+            key, arguments, compose_counted)
+
+class CompositionMemoTestCase(unittest.TestCase):
+    def test_composition_is_memoized(self):
+        memo = CountingCompositionMemo()
+        argument = lexpr('john')
+        compose = lambda a: lexpr(r'\x.P(x)')(a).simplify()
+        semantics1 = memo.get_composition((r'\x.P(x)',), (argument,), compose)
+        semantics2 = memo.get_composition((r'\x.P(x)',), (argument,), compose)
+        self.assertEqual(lexpr('P(john)'), semantics1)
+        self.assertIs(semantics1, semantics2)
+        self.assertEqual(1, len(memo.compositions_missed))
+
+    def test_arguments_compared_by_identity(self):
+        memo = CountingCompositionMemo()
+        compose = lambda a: lexpr(r'\F.F(john)')(a).simplify()
+        semantics1 = memo.get_composition(
+            (r'\F.F(john)',), (lexpr(r'\x.P(x)'),), compose)
+        semantics2 = memo.get_composition(
+            (r'\F.F(john)',), (lexpr(r'\y.P(y)'),), compose)
+        self.assertEqual(semantics1, semantics2)
+        self.assertIsNot(semantics1, semantics2)
+        self.assertEqual(2, len(memo.compositions_missed))
+
+    def test_nbest_trees_share_compositions(self):
+        sentence_str = r"""
+      <sentence id="s1">
+        <tokens>
+          <token base="base1" pos="pos1" surf="surf1" id="t1_1"/>
+          <token base="base2" pos="pos2" surf="surf2" id="t1_2"/>
+        </tokens>
+        <ccg root="sp1-3" id="ccg1">
+          <span terminal="t1_1" category="NP" end="2" begin="1" id="sp1-1"/>
+          <span terminal="t1_2" category="S\NP" end="3" begin="2" id="sp1-2"/>
+          <span child="sp1-1 sp1-2" rule="&lt;" category="S" end="3" begin="1" id="sp1-3"/>
+        </ccg>
+        <ccg root="sp2-3" id="ccg2">
+          <span terminal="t1_1" category="NP" end="2" begin="1" id="sp2-1"/>
+          <span terminal="t1_2" category="S\NP" end="3" begin="2" id="sp2-2"/>
+          <span child="sp2-1 sp2-2" rule="&lt;" category="S" end="3" begin="1" id="sp2-3"/>
+        </ccg>
+      </sentence>
+    """
+        sentence = etree.fromstring(sentence_str)
+        semantic_index = SemanticIndex(None)
+        semantic_index.rules = [SemanticRule(r'NP', r'\P.P', {}),
+                                SemanticRule(r'S\NP', r'\P x.P(x)', {}),
+                                SemanticRule(r'S', r'\L R.R(L)', {'rule' : '<'})]
+        memo = CountingCompositionMemo()
+        ccg_tree1 = assign_semantics_to_ccg(sentence, semantic_index, 1, None, memo)
+        self.assertEqual(3, len(memo.compositions_missed))
+        ccg_tree2 = assign_semantics_to_ccg(sentence, semantic_index, 2, None, memo)
+        self.assertEqual(3, len(memo.compositions_missed))
+        self.assertEqual(ccg_tree1.xpath('.//@sem'), ccg_tree2.xpath('.//@sem'))
+        self.assertEqual(lexpr('_base2(_base1)'), lexpr(ccg_tree2.get('sem')))
+        # Other documents do not share the compositions of this one.
+        other_memo = CountingCompositionMemo()
+        assign_semantics_to_ccg(sentence, semantic_index, 2, None, other_memo)
+        self.assertEqual(3, len(other_memo.compositions_missed))
+
 if __name__ == '__main__':
     suite1  = unittest.TestLoader().loadTestsFromTestCase(GetSemanticRepresentationTestCase)
-    suites  = unittest.TestSuite([suite1])
+    suite2  = unittest.TestLoader().loadTestsFromTestCase(RuleIndexTestCase)
+    suite3  = unittest.TestLoader().loadTestsFromTestCase(FindNodeByIdTestCase)
+    suite4  = unittest.TestLoader().loadTestsFromTestCase(CompositionMemoTestCase)
+    suites  = unittest.TestSuite([suite1, suite2, suite3, suite4])
     unittest.TextTestRunner(verbosity=2).run(suites)
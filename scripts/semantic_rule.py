@@ -20,13 +20,15 @@ import re
 from nltk.sem.logic import Expression
 
 from .category import Category
+from .category import get_category
+from .category import match_categories
 from .logic_parser import lexpr
 from .normalization import normalize_token
 
 class SemanticRule(object):
     def __init__(self, category, semantics, attributes = {}):
         if not isinstance(category, Category):
-            self.category = Category(category)
+            self.category = get_category(category)
         else:
             self.category = category
         if semantics and not isinstance(semantics, Expression):
@@ -39,6 +41,25 @@ class SemanticRule(object):
         if 'base' in self.attributes:
           self.attributes['base'] = normalize_token(self.attributes['base'])
 
+    @property
+    def semantics(self):
+        return self._semantics
+
+    @semantics.setter
+    def semantics(self, semantics):
+        self._semantics = semantics
+        self._semantics_str = None
+
+    @property
+    def semantics_str(self):
+        """
+        String of the semantics, computed once per rule since it is part
+        of the key of memoized compositions.
+        """
+        if self._semantics_str is None:
+            self._semantics_str = str(self._semantics)
+        return self._semantics_str
+
     def match(self, other):
         # Check class membership and special attribute matches.
         if not isinstance(other, self.__class__) \
@@ -92,10 +113,8 @@ def attributes_match(attribute_name, src_attr_value, trg_attr_value):
     # Case: src_attr_value is not None and trg_attr_value is not None
     if not 'category' in attribute_name:
         return src_attr_value.lower() == trg_attr_value.lower()
-    # Comparing categories needs feature unification:
-    src_category = Category(src_attr_value)
-    trg_category = Category(trg_attr_value)
-    return src_category.match(trg_category)
+    # Comparing categories needs feature unification (memoized):
+    return match_categories(src_attr_value, trg_attr_value)
 
 def any_attribute_matches(attribute_name, src_attributes, trg_attributes):
     wildcard_names = re.findall(r'_any_(.*)', attribute_name)
@@ -107,9 +126,7 @@ def any_attribute_matches(attribute_name, src_attributes, trg_attributes):
                        if key.endswith(wildcard_name)]
     for trg_attr_value in trg_attr_values:
         if wildcard_name == 'category':
-            src_category = Category(src_attr_value)
-            trg_category = Category(trg_attr_value)
-            if src_category.match(trg_category):
+            if match_categories(src_attr_value, trg_attr_value):
                 return True
         else:
             if src_attr_value.lower() == trg_attr_value.lower():
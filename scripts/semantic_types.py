@@ -14,7 +14,6 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
-import codecs
 from collections import defaultdict
 from copy import deepcopy
 import functools
@@ -27,32 +26,35 @@ from nltk.sem.logic import ENTITY_TYPE
 from nltk.sem.logic import TRUTH_TYPE
 from nltk.sem.logic import EVENT_TYPE
 from nltk.sem.logic import ANY_TYPE
+from nltk.sem.logic import AnyType
 from nltk.sem.logic import AbstractVariableExpression
 from nltk.sem.logic import ComplexType
 from nltk.sem.logic import ConstantExpression
 from nltk.sem.logic import NegatedExpression
 from nltk.sem.logic import BinaryExpression
 from nltk.sem.logic import ApplicationExpression
+from nltk.sem.logic import BooleanExpression
+from nltk.sem.logic import EqualityExpression
+from nltk.sem.logic import IndividualVariableExpression
+from nltk.sem.logic import QuantifiedExpression
 from nltk.sem.logic import VariableBinderExpression
 from nltk.sem.logic import InconsistentTypeHierarchyException
+from nltk.sem.logic import TypeException
 from nltk.sem.logic import Variable
+from nltk.sem.logic import VariableExpression
 from nltk.sem.logic import typecheck
 
 from .knowledge import get_tokens_from_xml_node
 from .logic_parser import lexpr
 from .normalization import normalize_token, substitute_invalid_chars
+from .resources import get_resources
 from .tree_tools import tree_or_string
 
-COQLIB_PATH='coqlib.v'
-def get_reserved_preds_from_coq_static_lib(coq_static_lib_path):
-    finput = codecs.open(coq_static_lib_path, 'r', 'utf-8')
-    type_definitions = \
-        [line.strip() for line in finput if line.startswith('Parameter ')]
-    finput.close()
-    reserved_predicates = \
-        [type_definition.split()[1] for type_definition in type_definitions]
-    return reserved_predicates
-RESERVED_PREDS=get_reserved_preds_from_coq_static_lib(COQLIB_PATH)
+kTypeCacheSize = 10000
+# Maximum number of collisions that remove_colliding_predicates resolves.
+kMaxTypecheckRounds = 100
+# Predicates renamed by make_new_pred_name, e.g. _run_e2.
+kRenamedPredRegex = re.compile(r'\S+_[a-z][0-9]')
 
 def linearize_type(pred_type):
     linearized_type = []
@@ -92,29 +94,51 @@ def resolve_types_in_signature(signature):
     signature = {k : v for k, v in signature.items() if v is not None}
     for predicate, pred_type in signature.items():
         pred_type_str = str(pred_type)
-        pred_type_str_resolved = re.sub(r'\?', r't', pred_type_str)
-        signature[predicate] = read_type(pred_type_str_resolved)
+        if '?' in pred_type_str:
+            signature[predicate] = read_type(pred_type_str.replace('?', 't'))
     return signature
 
 def remove_colliding_predicates(signature, expr):
+    """
+    Removes from `signature` the predicates whose types collide with their
+    use in `expr`, and returns the signature inferred by typechecking `expr`.
+    NLTK's typecheck reports one collision at a time, so it is repeated
+    after each removal, and once more at the end.
+    The typecheck of NLTK starts from the types that constants got in the
+    previous typecheck. When a typecheck leaves them unchanged, the next one
+    would repeat it exactly and it is not run: the final typecheck after a
+    successful one (the usual case, without collisions), and the remaining
+    rounds after a collision that removed nothing from the signature.
+    """
+    constants = get_constant_expressions(expr)
+    constant_types = get_types(constants)
     resolution_success = False
     i = 0
     while (not resolution_success):
+        removed = False
         try:
-            expr.typecheck(signature)
+            typecheck_signature = expr.typecheck(signature)
             resolution_success = True
         except InconsistentTypeHierarchyException as e:
             e_str = str(e)
             # The exception message is of the form:
             # The variable ''s' was found in ... (referring to variable 's).
             variable_name = re.findall(r"'(\S+?)'", e_str)[0]
+            removed = variable_name in signature
             signature.pop(variable_name, None)
             if variable_name == 'TrueP':
                 break
         except AttributeError as e:
             break
+        new_constant_types = get_types(constants)
+        if same_types(new_constant_types, constant_types):
+            if resolution_success:
+                return typecheck_signature
+            if not removed:
+                i = kMaxTypecheckRounds
+        constant_types = new_constant_types
         i += 1
-        if i > 100:
+        if i > kMaxTypecheckRounds:
             logging.info('There is probably a problem in the typecheck resolution of ' \
                     'expression {0} with signature {1}'.format(str(expr), signature))
             break
@@ -129,6 +153,55 @@ def remove_colliding_predicates(signature, expr):
             'expression {0} with signature {1}'.format(str(expr), signature))
     return signature
 
+def get_constant_expressions(expr):
+    """
+    Returns the list of ConstantExpression nodes of expr (with repetitions,
+    in no particular order), or None if expr has nodes of unknown classes.
+    """
+    constants = []
+    stack = [expr]
+    while stack:
+        expr = stack.pop()
+        if isinstance(expr, ConstantExpression):
+            constants.append(expr)
+        elif isinstance(expr, AbstractVariableExpression):
+            pass
+        elif isinstance(expr, ApplicationExpression):
+            stack.extend([expr.function, expr.argument])
+        elif isinstance(expr, BinaryExpression):
+            stack.extend([expr.first, expr.second])
+        elif isinstance(expr, NegatedExpression):
+            stack.append(expr.term)
+        elif isinstance(expr, VariableBinderExpression):
+            stack.append(expr.term)
+        else:
+            return None
+    return constants
+
+def get_types(exprs):
+    if exprs is None:
+        return None
+    return [expr.type for expr in exprs]
+
+def same_types(types1, types2):
+    """
+    Whether two lists of types are structurally equal. Type.__eq__ is not
+    strict enough (e.g. <?,?> equals ?), and str() is slower.
+    """
+    if types1 is None or types2 is None or len(types1) != len(types2):
+        return False
+    return all(same_type(t1, t2) for t1, t2 in zip(types1, types2))
+
+def same_type(type1, type2):
+    if type1 is type2:
+        return True
+    if type(type1) is not type(type2):
+        return False
+    if isinstance(type1, ComplexType) and not isinstance(type1, AnyType):
+        return same_type(type1.first, type2.first) and \
+               same_type(type1.second, type2.second)
+    return True
+
 def combine_signatures(signatures):
     """
     Combinator function necessary for .visit method.
@@ -183,7 +256,7 @@ def resolve_types_rec(expr, signature=None):
     return signature
 
 def make_new_pred_name(pred, pred_type):
-    if pred in RESERVED_PREDS:
+    if pred in get_resources().get_reserved_predicates():
         return pred
     type_len = type_length(pred_type)
     if type_len > 2:
@@ -242,6 +315,133 @@ def replace_function_names(expr, resolution_guide, active=None):
             'Expression not recognized: {0}, type: {1}'.format(expr, type(expr)))
     return expr
 
+def infer_formula_types(expr, seen_constants):
+    """
+    Infers in a single pass the types of the constants and variables of
+    expr, applying the rules of NLTK's typecheck: the types of all uses of
+    a constant are resolved with each other. Returns a dictionary from
+    names to types, or None if there is a type conflict, or if expr has
+    constructions where NLTK's result depends on the order in which it
+    visits the formula: lambdas, function variables, arguments that are not
+    variables or constants, and constants that were typechecked before or
+    that appear in several formulas (`seen_constants` has the ids of those
+    already visited).
+    """
+    types = {}
+    stack = [(expr, ANY_TYPE)]
+    while stack:
+        expr, other_type = stack.pop()
+        if isinstance(expr, ConstantExpression):
+            if 'type' in expr.__dict__ or id(expr) in seen_constants:
+                return None
+            seen_constants.add(id(expr))
+            # entity type by default, for individuals
+            resolution = ENTITY_TYPE if other_type == ANY_TYPE else other_type
+            name = expr.variable.name
+            if name in types:
+                resolution = types[name].resolve(resolution)
+                if not resolution:
+                    return None
+            types[name] = resolution
+        elif isinstance(expr, IndividualVariableExpression):
+            if not other_type.matches(ENTITY_TYPE):
+                return None
+            types.setdefault(expr.variable.name, expr.type)
+        elif isinstance(expr, ApplicationExpression):
+            argument = expr.argument
+            if not isinstance(argument, (ConstantExpression,
+                                         IndividualVariableExpression)):
+                return None
+            stack.append((argument, ANY_TYPE))
+            stack.append((expr.function, ComplexType(argument.type, other_type)))
+        elif isinstance(expr, EqualityExpression):
+            if not other_type.matches(TRUTH_TYPE):
+                return None
+            stack.append((expr.first, ENTITY_TYPE))
+            stack.append((expr.second, ENTITY_TYPE))
+        elif isinstance(expr, BooleanExpression):
+            if not other_type.matches(TRUTH_TYPE):
+                return None
+            stack.append((expr.first, TRUTH_TYPE))
+            stack.append((expr.second, TRUTH_TYPE))
+        elif isinstance(expr, (NegatedExpression, QuantifiedExpression)):
+            if not other_type.matches(TRUTH_TYPE):
+                return None
+            stack.append((expr.term, TRUTH_TYPE))
+        else:
+            return None
+    return types
+
+def infer_signature(exprs, preferred_sigs):
+    """
+    Returns the signature that combine_signatures_or_rename_preds finds
+    for `exprs`, inferring the types of each formula only once, or None if
+    predicates have to be renamed or removed because of type conflicts.
+    The steps of combine_signatures_or_rename_preds are followed on the
+    inferred types: the renaming check, type_check_safe, the combination
+    with the preferred signatures and remove_colliding_predicates.
+    Without conflicts, each of NLTK's typechecks of a formula finds the
+    same types, so that inferring them once is enough.
+    """
+    seen_constants = set()
+    formula_types = []
+    for expr in exprs:
+        types = infer_formula_types(expr, seen_constants)
+        if types is None:
+            return None
+        formula_types.append(types)
+    pred_types = {}
+    for types, preferred_sig in zip(formula_types, preferred_sigs):
+        for pred, pred_type in types.items():
+            pred_type_str = str(pred_type)
+            if pred in preferred_sig:
+                pred_type_str = str(preferred_sig[pred])
+            if pred_types.setdefault(pred, pred_type_str) != pred_type_str:
+                return None
+    inferred_signature = {}
+    for types in formula_types:
+        for pred, pred_type in types.items():
+            if pred not in inferred_signature or \
+               type_length(pred_type) > type_length(inferred_signature[pred]):
+                inferred_signature[pred] = pred_type
+    signature = combine_signatures(preferred_sigs + [inferred_signature])
+    signature = remove_reserved_predicates(signature)
+    signature = resolve_types_in_signature(signature)
+    for types in formula_types:
+        signature = resolve_signature_with_types(signature, types)
+        if signature is None:
+            return None
+    return resolve_types_in_signature(signature)
+
+def resolve_signature_with_types(signature, types):
+    """
+    Resolves the types of `signature` with the types inferred for a formula,
+    as expr.typecheck(signature) does. Returns None on a collision.
+    """
+    resolved_signature = {}
+    for name, name_type in signature.items():
+        if get_variable_class(name) is IndividualVariableExpression:
+            # individual variables are entities, whatever the signature says.
+            if not name_type.matches(ENTITY_TYPE):
+                return None
+            name_type = ENTITY_TYPE
+        resolved_signature[name] = name_type
+    for name, name_type in types.items():
+        if name not in resolved_signature:
+            resolved_signature[name] = name_type
+        elif get_variable_class(name) is ConstantExpression:
+            name_type = resolved_signature[name].resolve(name_type)
+            if not name_type:
+                return None
+            resolved_signature[name] = name_type
+    return resolved_signature
+
+# The class of expression that NLTK builds for a name, e.g. a constant for
+# '_dog', an individual variable for 'x' or an event variable for 'e'.
+@functools.lru_cache(maxsize=kTypeCacheSize)
+def get_variable_class(name):
+    return type(VariableExpression(Variable(name)))
+
 def combine_signatures_or_rename_preds(exprs, preferred_sigs=None):
     """
     `signatures` is a list of dictionaries. Each dictionary has key-value
@@ -257,6 +457,11 @@ def combine_signatures_or_rename_preds(exprs, preferred_sigs=None):
         preferred_sigs = [{}] * len(exprs)
     elif isinstance(preferred_sigs, dict):
         preferred_sigs = [preferred_sigs]
+    signature = infer_signature(exprs, preferred_sigs)
+    if signature is not None:
+        return signature, list(exprs)
+    # Predicates with conflicting types are renamed or removed following
+    # the order in which NLTK's typecheck finds the conflicts.
     signatures = [resolve_types_rec(expr) for expr in exprs]
     signature = defaultdict(list)
     for s, preferred_sig in zip(signatures, preferred_sigs):
@@ -274,12 +479,20 @@ def combine_signatures_or_rename_preds(exprs, preferred_sigs=None):
                 if (pred, new_pred_name) not in resolution_guide[ex]:
                     resolution_guide[ex].append((pred, new_pred_name))
 
-    resolution_guide_local = deepcopy(resolution_guide)
-    new_exprs = []
-    for expr in exprs:
-        if not isinstance(expr, ConstantExpression):
-            expr = replace_function_names(expr, resolution_guide_local)
-        new_exprs.append(expr)
+    if resolution_guide:
+        resolution_guide_local = deepcopy(resolution_guide)
+        new_exprs = []
+        for expr in exprs:
+            if not isinstance(expr, ConstantExpression):
+                expr = replace_function_names(expr, resolution_guide_local)
+            new_exprs.append(expr)
+    else:
+        # Nothing to rename. replace_function_names would only rebuild
+        # the expressions, hashing every subexpression on the way.
+        new_exprs = list(exprs)
+    # The types are inferred again even if no predicate was renamed:
+    # NLTK's typecheck keeps the types of constants between calls, so that
+    # the types found by remove_colliding_predicates depend on this pass.
     signature = type_check_safe(new_exprs)
     signature = combine_signatures(preferred_sigs + [signature])
 
@@ -323,13 +536,13 @@ def remove_reserved_predicates(signature):
             del signature[reserved_predicate]
     return signature
 
-def get_dynamic_library_from_doc(doc, semantics_nodes):
+def get_dynamic_library_from_doc(doc, semantics_nodes, required_predicates=None):
     # Each type is of the form "predicate : basic_type -> ... -> basic_type."
     types_sets = []
     for semantics_node in semantics_nodes:
       types = set(semantics_node.xpath('./span/@type'))
       types_sets.append(types)
-    types_sets = [[substitute_invalid_chars(t, 'replacement.txt') for t in types] for types in types_sets]
+    types_sets = [[substitute_invalid_chars(t) for t in types] for types in types_sets]
     coq_libs = [['Parameter {0}.'.format(t) for t in types] for types in types_sets]
     nltk_sigs_arbi = [convert_coq_signatures_to_nltk(coq_lib) for coq_lib in coq_libs]
     nltk_sig_arbi = combine_signatures(nltk_sigs_arbi)
@@ -343,7 +556,8 @@ def get_dynamic_library_from_doc(doc, semantics_nodes):
     dynamic_library = merge_dynamic_libraries(
         nltk_sig_arbi,
         nltk_sig_auto,
-        doc=doc)
+        doc=doc,
+        required_predicates=required_predicates)
     dynamic_library_str = '\n'.join(sorted(dynamic_library))
     return dynamic_library_str, formulas
 
@@ -403,6 +617,12 @@ def convert_coq_to_nltk_type(coq_type):
       {'_love' : read_type('<e, <e, t>>')}
     """
     assert isinstance(coq_type, str)
+    surface, nltk_type = convert_coq_to_nltk_type_cached(coq_type)
+    return {surface : nltk_type}
+
+# The same type specifications are converted for every theorem of a document.
+@functools.lru_cache(maxsize=kTypeCacheSize)
+def convert_coq_to_nltk_type_cached(coq_type):
     coq_type_list = coq_type.split()
     assert len(coq_type_list) >= 4, 'Wrong coq_type format: %s' % coq_type
     parameter, surface, colon = coq_type_list[:3]
@@ -427,7 +647,7 @@ def convert_coq_to_nltk_type(coq_type):
         ' ', ',')
     if len(type_sig) == 1:
         nltk_type_str = nltk_type_str.strip('<>')
-    return {surface : read_type(nltk_type_str)}
+    return surface, read_type(nltk_type_str)
 
 def remove_labels_and_unaries(tree):
     assert isinstance(tree, Tree)
@@ -505,19 +725,26 @@ def get_predicate_type_from_library(predicate, lib):
     assert isinstance(lib, dict)
     return lib.get(predicate, None)
 
-def merge_dynamic_libraries(sig_arbi, sig_auto, doc):
-    # reserved_predicates = get_reserved_preds_from_coq_static_lib(coq_static_lib_path)
+def get_required_predicates(doc):
+    """
+    Returns the set of predicates of the tokens of a document, which are
+    the only predicates (apart from renamed ones) kept in its library.
+    """
     # Get base forms, unless the base form is '*', in which case get surf form.
     base_forms = get_tokens_from_xml_node(doc)
-    base_forms = [substitute_invalid_chars(t, 'replacement.txt') for t in base_forms]
-    required_predicates = set(normalize_token(t) for t in base_forms)
+    base_forms = [substitute_invalid_chars(t) for t in base_forms]
+    return set(normalize_token(t) for t in base_forms)
+
+def merge_dynamic_libraries(sig_arbi, sig_auto, doc, required_predicates=None):
+    if required_predicates is None:
+        required_predicates = get_required_predicates(doc)
     sig_merged = sig_auto
     sig_merged.update(sig_arbi) # overwrites automatically inferred types.
     # Remove predicates that are reserved or not required (e.g. variables).
     preds_to_remove = set()
-    preds_to_remove.update(RESERVED_PREDS)
+    preds_to_remove.update(get_resources().get_reserved_predicates())
     for pred in sig_merged:
-        if pred not in required_predicates and not re.match(r'\S+_[a-z][0-9]', pred):
+        if pred not in required_predicates and not kRenamedPredRegex.match(pred):
             preds_to_remove.add(pred)
     for pred in preds_to_remove:
         if pred in sig_merged:
@@ -24,6 +24,7 @@ from .ccg2lambda_tools import assign_semantics_to_ccg
 from .logic_parser import lexpr
 from .semantic_index import SemanticIndex
 from .semantic_index import SemanticRule
+from . import semantic_types as semantic_types_module
 from .semantic_types import build_dynamic_library
 from .semantic_types import build_library_entry
 from .semantic_types import combine_signatures_or_rename_preds
@@ -31,8 +32,11 @@ from .semantic_types import convert_coq_signatures_to_nltk
 from .semantic_types import convert_coq_to_nltk_type
 from .semantic_types import get_coq_types
 from .semantic_types import get_dynamic_library_from_doc
+from .semantic_types import get_required_predicates
+from .semantic_types import infer_signature
 from .semantic_types import merge_dynamic_libraries
 from .semantic_types import read_type
+from .semantic_types import remove_colliding_predicates
 from .semparse import filter_attributes
 from .theorem import get_formulas_from_doc
 
@@ -112,6 +116,18 @@ class combine_signatures_or_rename_predsTestCase(unittest.TestCase):
                               "Parameter _pred_same_v2 : Event -> Prop."]
         self.assertEqual(expected_coq_types, coq_types,
             msg="\n{0}\nvs\n{1}".format(expected_coq_types, coq_types))
+        required_predicates = get_required_predicates(doc)
+        self.assertEqual(set(['_pred_same']), required_predicates)
+        lib_str, _ = get_dynamic_library_from_doc(doc, sem_nodes, required_predicates)
+        self.assertEqual(dynamic_library_str, lib_str)
+
+    def test_same_pred_same_type_keeps_exprs(self):
+        exprs = [lexpr(r'pred1(x) & pred2(x,y)'), lexpr(r'pred1(y) & pred2(y,x)')]
+        expected_exprs = [lexpr(r'pred1(x) & pred2(x,y)'), lexpr(r'pred1(y) & pred2(y,x)')]
+        sig, new_exprs = combine_signatures_or_rename_preds(exprs)
+        self.assertEqual(expected_exprs, new_exprs)
+        self.assertEqual('<e,t>', str(sig['pred1']))
+        self.assertEqual('<e,<e,t>>', str(sig['pred2']))
 
 # TODO: also test for types that are Propositions 't'.
 
@@ -655,6 +671,91 @@ class build_dynamic_libraryTestCase(unittest.TestCase):
             self.assertIn(item, expected_dynamic_library)
         self.assertEqual(len(expected_dynamic_library), len(dynamic_library))
 
+class remove_colliding_predicatesTestCase(unittest.TestCase):
+    def count_typechecks(self, expr):
+        calls = []
+        typecheck = expr.typecheck
+        def typecheck_counted(signature=None):
+            calls.append(signature)
+            return typecheck(signature)
+        expr.typecheck = typecheck_counted
+        return calls
+
+    def test_no_collision_single_typecheck(self):
+        expr = lexpr('(_dog(x) & _cat(x))')
+        expr.typecheck()
+        calls = self.count_typechecks(expr)
+        signature = remove_colliding_predicates({'_dog': read_type('<e,t>')}, expr)
+        self.assertEqual(1, len(calls))
+        self.assertEqual({'_dog': '<e,t>', '_cat': '<e,t>', 'x': 'e'},
+                         {k: str(v) for k, v in signature.items()})
+
+    def test_colliding_predicate_removed(self):
+        expr = lexpr('(_dog(x) & _cat(x))')
+        expr.typecheck()
+        calls = self.count_typechecks(expr)
+        signature = {'_dog': read_type('<v,t>'), '_cat': read_type('<e,t>')}
+        signature = remove_colliding_predicates(signature, expr)
+        self.assertEqual(2, len(calls))
+        self.assertEqual({'_dog': '<e,t>', '_cat': '<e,t>', 'x': 'e'},
+                         {k: str(v) for k, v in signature.items()})
+
+class infer_signatureTestCase(unittest.TestCase):
+    def build_dynamic_library_typecheck(self, exprs, preferred_signature=None):
+        # the same, without the single-pass inference.
+        infer_signature = semantic_types_module.infer_signature
+        semantic_types_module.infer_signature = lambda exprs, sigs: None
+        try:
+            return build_dynamic_library(exprs, preferred_signature)
+        finally:
+            semantic_types_module.infer_signature = infer_signature
+
+    def assert_same_library(self, exprs_str, preferred_signature=None):
+        signature, exprs = build_dynamic_library(
+            [lexpr(e) for e in exprs_str], preferred_signature)
+        expected_signature, expected_exprs = self.build_dynamic_library_typecheck(
+            [lexpr(e) for e in exprs_str], preferred_signature)
+        self.assertEqual({k: str(v) for k, v in expected_signature.items()},
+                         {k: str(v) for k, v in signature.items()})
+        self.assertEqual([str(e) for e in expected_exprs], [str(e) for e in exprs])
+
+    def test_signature_without_conflicts(self):
+        exprs = [lexpr('exists x e.(_dog(x) & _run(e) & (Subj(e) = x) & TrueP)'),
+                 lexpr('exists x.(_animal(x) & _dog(_john) & -_big(x, _john))')]
+        signature = infer_signature(exprs, [{}] * 2)
+        self.assertEqual(
+            {'_dog': '<e,t>', '_run': '<v,t>', 'Subj': '<v,e>', 'x': 'e',
+             'e': 'v', '_animal': '<e,t>', '_john': 'e', '_big': '<e,<e,t>>',
+             'TrueP': 't'},
+            {k: str(v) for k, v in signature.items()})
+        self.assert_same_library([str(e) for e in exprs])
+
+    def test_same_library_as_typecheck(self):
+        self.assert_same_library(['_dog(x)', '(_dog(x) = y)'])
+        self.assert_same_library(['_dog(x)', '_cat(x)'],
+                                 convert_coq_signatures_to_nltk(
+                                     ['Parameter _dog : Entity -> Prop.']))
+        self.assert_same_library(['_dog(x)', '_cat(x)'],
+                                 convert_coq_signatures_to_nltk(
+                                     ['Parameter _dog : Prop.']))
+        self.assert_same_library(['_dog(x) & _dog(x, y)'])
+        self.assert_same_library(['_q(_p(x)) & (_p(x) = y)', '_q(z)'])
+
+    def test_conflicts_left_to_typecheck(self):
+        self.assertIsNone(infer_signature([lexpr('_dog(x) & _dog(x, y)')], [{}]))
+        self.assertIsNone(infer_signature([lexpr('_dog(x)'), lexpr('_dog(x, y)')],
+                                          [{}] * 2))
+        self.assertIsNone(infer_signature([lexpr('-_dog(x)')],
+                                          [{'_dog': read_type('<e,<e,t>>')}]))
+
+    def test_order_dependent_types_left_to_typecheck(self):
+        # NLTK reads the type of _p(x) before the equality resolves it.
+        self.assertIsNone(infer_signature([lexpr('_q(_p(x)) & (_p(x) = y)')], [{}]))
+        self.assertIsNone(infer_signature([lexpr(r'\x._dog(x)')], [{}]))
+        expr = lexpr('_dog(x)')
+        expr.typecheck()
+        self.assertIsNone(infer_signature([expr], [{}]))
+
 if __name__ == '__main__':
     suite1  = unittest.TestLoader().loadTestsFromTestCase(combine_signatures_or_rename_predsTestCase)
     suite2  = unittest.TestLoader().loadTestsFromTestCase(build_arbitrary_dynamic_libraryTestCase)
@@ -662,5 +763,8 @@ if __name__ == '__main__':
     suite4  = unittest.TestLoader().loadTestsFromTestCase(Coq2NLTKTypesTestCase)
     suite5  = unittest.TestLoader().loadTestsFromTestCase(Coq2NLTKSignaturesTestCase)
     suite6  = unittest.TestLoader().loadTestsFromTestCase(ArbiAutoTypesTestCase)
-    suites  = unittest.TestSuite([suite1, suite2, suite3, suite4, suite5, suite6])
+    suite7  = unittest.TestLoader().loadTestsFromTestCase(remove_colliding_predicatesTestCase)
+    suite8  = unittest.TestLoader().loadTestsFromTestCase(infer_signatureTestCase)
+    suites  = unittest.TestSuite([suite1, suite2, suite3, suite4, suite5, suite6, suite7,
+                                  suite8])
     unittest.TextTestRunner(verbosity=2).run(suites)
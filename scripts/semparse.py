@@ -29,8 +29,17 @@ import textwrap
 from nltk.sem.logic import LogicalExpressionException
 
 from .ccg2lambda_tools import assign_semantics_to_ccg
+from .ccg2lambda_tools import SubtreeSemanticsCache
+from .etree_utils import kStreamBatchSize
+from .etree_utils import process_xml_stream
+from .semantic_index import CompositionMemo
 from .semantic_index import SemanticIndex
 
+ARGS=None
+SENTENCES=None
+SEMANTIC_INDEX=None
+COMPOSITION_MEMO=None
+kChunkSize=16
 
 def main(args = None):
     global ARGS
@@ -57,6 +66,16 @@ def main(args = None):
     parser.add_argument("sem")
     parser.add_argument("--gold_trees", action="store_true", default=True)
     parser.add_argument("--nbest", nargs='?', type=int, default="0")
+    parser.add_argument("--ncores", nargs='?', type=int, default="1",
+        help="Number of cores for multiprocessing.")
+    parser.add_argument("--chunksize", nargs='?', type=int, default=str(kChunkSize),
+        help="Number of sentences sent at once to each process.")
+    parser.add_argument("--stream", action="store_true", default=False,
+        help="Read and write sentences incrementally so that memory usage "
+             "does not grow with the input size.")
+    parser.add_argument("--stream_batch_size", nargs='?', type=int,
+        default=str(kStreamBatchSize),
+        help="Number of sentences kept in memory in --stream mode.")
     ARGS = parser.parse_args()
 
     if not os.path.exists(ARGS.templates):
@@ -70,47 +89,122 @@ def main(args = None):
 
     semantic_index = SemanticIndex(ARGS.templates)
 
+    if ARGS.stream:
+        semantic_parse_stream(
+            ARGS.ccg, ARGS.sem, semantic_index, ARGS.stream_batch_size,
+            ncores=ARGS.ncores, nbest=ARGS.nbest, chunksize=ARGS.chunksize)
+        return
+
     parser = etree.XMLParser(remove_blank_text=True)
     root = etree.parse(ARGS.ccg, parser)
 
     sentences = root.findall('.//sentence')
     # print('Found {0} sentences'.format(len(sentences)))
     # from pudb import set_trace; set_trace()
-    sentence_inds = range(len(sentences))
-    sem_nodes_lists = semantic_parse_sentences(sentence_inds,
-                                               sentences, semantic_index)
-    assert len(sem_nodes_lists) == len(sentences), \
-        'Element mismatch: {0} vs {1}'.format(len(sem_nodes_lists), len(sentences))
     logging.info('Adding XML semantic nodes to sentences...')
-    for sentence, sem_nodes in zip(sentences, sem_nodes_lists):
-        sentence.extend(sem_nodes)
+    add_semantics_to_sentences(
+        sentences, semantic_index,
+        ncores=ARGS.ncores, nbest=ARGS.nbest, chunksize=ARGS.chunksize)
     logging.info('Finished adding XML semantic nodes to sentences.')
 
     root_xml_str = serialize_tree(root)
     with codecs.open(ARGS.sem, 'wb') as fout:
         fout.write(root_xml_str)
 
-def semantic_parse_sentences(sentence_inds,
-                             sentences, semantic_index):
-    sem_nodes_lists = semantic_parse_sentences_seq(sentence_inds,
-                                                   sentences, semantic_index)
+def semantic_parse_stream(input_fname, output_fname, semantic_index,
+                          batch_size=kStreamBatchSize, **kwargs):
+    """
+    Semantically parses the sentences of `input_fname` in batches of
+    `batch_size`, writing them into `output_fname` as they are completed.
+    All batches share the composition memo of the document.
+    """
+    memo = CompositionMemo()
+    num_sentences = process_xml_stream(input_fname, output_fname, 'sentence',
+        lambda sentences: add_semantics_to_sentences(
+            sentences, semantic_index, memo=memo, **kwargs),
+        batch_size)
+    logging.info('Semantically parsed {0} sentences in stream mode.'.format(
+        num_sentences))
+
+def add_semantics_to_sentences(sentences, semantic_index,
+                               ncores=1, nbest=0, chunksize=kChunkSize,
+                               memo=None):
+    sentence_inds = range(len(sentences))
+    sem_nodes_lists = semantic_parse_sentences(
+        sentence_inds, sentences, semantic_index,
+        ncores=ncores, nbest=nbest, chunksize=chunksize, memo=memo)
+    assert len(sem_nodes_lists) == len(sentences), \
+        'Element mismatch: {0} vs {1}'.format(len(sem_nodes_lists), len(sentences))
+    for sentence, sem_nodes in zip(sentences, sem_nodes_lists):
+        sentence.extend(sem_nodes)
+
+def semantic_parse_sentences(sentence_inds, sentences, semantic_index,
+                             ncores=1, nbest=0, chunksize=kChunkSize, memo=None):
+    """
+    Returns a list (in the order of `sentence_inds`) of lists of
+    semantics nodes. With ncores > 1, sentences are distributed over
+    worker processes that inherit `sentences` and `semantic_index`
+    when forked, so that the semantic index is built only once.
+    Sentences share the composition memo `memo` (a new one if None);
+    each worker process has its own copy.
+    """
+    if memo is None:
+        memo = CompositionMemo()
+    if ncores <= 1:
+        sem_nodes_lists = semantic_parse_sentences_seq(
+            sentence_inds, sentences, semantic_index, nbest, memo)
+    else:
+        sem_nodes_lists = semantic_parse_sentences_par(
+            sentence_inds, sentences, semantic_index, ncores, nbest, chunksize,
+            memo)
     sem_nodes_lists = [
         [etree.fromstring(s) for s in sem_nodes] for sem_nodes in sem_nodes_lists]
     return sem_nodes_lists
 
-def semantic_parse_sentences_seq(sentence_inds, sentences, semantic_index):
+def semantic_parse_sentences_par(sentence_inds, sentences, semantic_index,
+                                 ncores=3, nbest=0, chunksize=kChunkSize,
+                                 memo=None):
+    global SENTENCES
+    global SEMANTIC_INDEX
+    global COMPOSITION_MEMO
+    SENTENCES = sentences
+    SEMANTIC_INDEX = semantic_index
+    COMPOSITION_MEMO = memo
+    pool = Pool(processes=ncores)
+    try:
+        # imap returns results in input order while workers proceed
+        # independently over chunks of sentences.
+        sem_nodes_lists = list(pool.imap(
+            semantic_parse_sentence_ind,
+            [(sentence_ind, nbest) for sentence_ind in sentence_inds],
+            chunksize=max(chunksize, 1)))
+    finally:
+        pool.close()
+        pool.join()
+    return sem_nodes_lists
+
+def semantic_parse_sentence_ind(task):
+    sentence_ind, nbest = task
+    return semantic_parse_sentence(
+        SENTENCES[sentence_ind], SEMANTIC_INDEX, nbest, COMPOSITION_MEMO)
+
+def semantic_parse_sentences_seq(sentence_inds, sentences, semantic_index,
+                                 nbest=0, memo=None):
     sem_nodes = []
     for sentence_ind in sentence_inds:
         sem_node = semantic_parse_sentence(sentences[sentence_ind],
-                                           semantic_index)
+                                           semantic_index, nbest, memo)
         sem_nodes.append(sem_node)
     return sem_nodes
 
-def semantic_parse_sentence(sentence, semantic_index, nbest=0):
+def semantic_parse_sentence(sentence, semantic_index, nbest=0, memo=None):
     """
     `sentence` is an lxml tree with tokens and ccg nodes.
-    It returns an lxml semantics node.
+    It returns an lxml semantics node. Its n-best trees share the
+    composition memo `memo` (a new one if None).
     """
+    if memo is None:
+        memo = CompositionMemo()
     sem_nodes = []
     # TODO: try to prevent semantic parsing for fragmented CCG trees.
     # Otherwise, produce fragmented semantics.
@@ -121,11 +215,13 @@ def semantic_parse_sentence(sentence, semantic_index, nbest=0):
 
     if nbest != 1:
         tree_indices = get_tree_indices(sentence, nbest)
+    # N-best trees share most of their subtrees, whose semantics are composed once.
+    subtree_cache = SubtreeSemanticsCache() if len(tree_indices) > 1 else None
     for tree_index in tree_indices:
         sem_node = etree.Element('semantics')
         try:
             sem_tree = assign_semantics_to_ccg(
-                sentence, semantic_index, tree_index)
+                sentence, semantic_index, tree_index, subtree_cache, memo)
             filter_attributes(sem_tree)
             sem_node.extend(sem_tree.xpath('.//descendant-or-self::span'))
             sem_node.set('status', 'success')
@@ -0,0 +1,70 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import unittest
+
+from lxml import etree
+
+from .semantic_index import SemanticIndex
+from .semantic_index import SemanticRule
+from .semparse import semantic_parse_sentences
+
+def make_sentence(sentence_id, base, num_trees=1):
+    ccg_strs = ''.join(r"""
+        <ccg root="sp{0}-{1}" id="ccg{0}-{1}">
+          <span terminal="t{0}_1" category="N" end="2" begin="1" id="sp{0}-{1}"/>
+        </ccg>""".format(sentence_id, i) for i in range(num_trees))
+    sentence_str = r"""
+      <sentence id="s{0}">
+        <tokens>
+          <token base="{1}" pos="pos1" surf="{1}" id="t{0}_1"/>
+        </tokens>{2}
+      </sentence>
+    """.format(sentence_id, base, ccg_strs)
+    return etree.fromstring(sentence_str)
+
+class SemanticParseSentencesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.semantic_index = SemanticIndex(None)
+        self.semantic_index.rules = [SemanticRule(r'N', r'\P.P', {})]
+
+    def test_parallel_output_in_input_order(self):
+        sentences = [make_sentence(i, 'base' + str(i)) for i in range(20)]
+        sentence_inds = list(range(len(sentences)))
+        sem_nodes_seq = semantic_parse_sentences(
+            sentence_inds, sentences, self.semantic_index)
+        sem_nodes_par = semantic_parse_sentences(
+            sentence_inds, sentences, self.semantic_index, ncores=3, chunksize=2)
+        self.assertEqual(
+            [[etree.tostring(n) for n in nodes] for nodes in sem_nodes_seq],
+            [[etree.tostring(n) for n in nodes] for nodes in sem_nodes_par])
+        sems = [nodes[0].xpath('./span/@sem')[0] for nodes in sem_nodes_par]
+        self.assertEqual(['_base' + str(i) for i in range(20)], sems)
+
+    def test_nbest_is_honored(self):
+        sentences = [make_sentence(1, 'base1', num_trees=3)]
+        sem_nodes_all = semantic_parse_sentences(
+            [0], sentences, self.semantic_index, nbest=0)
+        sem_nodes_two = semantic_parse_sentences(
+            [0], sentences, self.semantic_index, ncores=2, nbest=2)
+        self.assertEqual(3, len(sem_nodes_all[0]))
+        self.assertEqual(2, len(sem_nodes_two[0]))
+
+if __name__ == '__main__':
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(SemanticParseSentencesTestCase)
+    suites = unittest.TestSuite([suite1])
+    unittest.TextTestRunner(verbosity=2).run(suites)
@@ -14,12 +14,8 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+from .resources import get_resources
+
 def get_tactics():
-    tactics = 'Set Firstorder Depth 1. nltac. Set Firstorder Depth 6. nltac. Qed'
-    try:
-        with open('tactics_coq.txt') as fin:
-            tactics = fin.read().strip()
-    except:
-        pass
-    return tactics
+    return get_resources().get_tactics()
 
@@ -17,17 +17,39 @@
 
 import codecs
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import itertools
 import logging
 from lxml import etree
 import subprocess
+import threading
+import time
 
 from .coq_analyzer import analyze_coq_output
+from .coqtop_pool import get_coqtop_pool
+from .nltk2coq import CoqStringCache
 from .nltk2coq import normalize_interpretation
+from .proof_cache import get_proof_cache
 from .semantic_types import get_dynamic_library_from_doc
+from .semantic_types import get_required_predicates
 from .tactics import get_tactics
 from .normalization import substitute_invalid_chars
 
+kDebugTactics = 'repeat nltac_base. try substitution. Qed'
+kFailureLogModes = ['none', 'failed', 'all']
+FAILURE_LOGS = 'all'
+
+def set_failure_logs(mode):
+    """
+    Sets which theorems get a failure log when they are written as XML:
+    'none', 'failed' (only theorems that were not proved, analyzing the
+    coqtop output of the proof attempt) or 'all' (every theorem, running
+    coqtop again with debug tactics).
+    """
+    global FAILURE_LOGS
+    assert mode in kFailureLogModes, mode
+    FAILURE_LOGS = mode
+
 class Theorem(object):
     """
     Manage a theorem and its variations.
@@ -45,8 +67,11 @@ class Theorem(object):
         self.variations = []
         self.doc = None
         self.failure_log = None
+        self.output_lines = None
         self.timeout = 100
         self.labels = []
+        # Shared with the variations of this theorem.
+        self.coq_strings = CoqStringCache()
 
     def __repr__(self):
         return self.coq_script
@@ -85,6 +110,7 @@ class Theorem(object):
             self.dynamic_library_str, is_negated=is_negated)
         theorem.doc = self.doc
         theorem.timeout = self.timeout
+        theorem.coq_strings = self.coq_strings
         self.variations.append(theorem)
         return theorem
 
@@ -117,10 +143,9 @@ class Theorem(object):
             self.premises,
             self.conclusion,
             self.dynamic_library_str,
-            axioms=axioms)
-        current_tactics = get_tactics()
-        debug_tactics = 'repeat nltac_base. try substitution. Qed'
-        coq_script = coq_script.replace(current_tactics, debug_tactics)
+            axioms=axioms,
+            coq_strings=self.coq_strings)
+        coq_script = make_debug_script(coq_script)
         output_lines = run_coq_script(coq_script, self.timeout)
 
         if is_theorem_defined(output_lines):
@@ -133,22 +158,44 @@ class Theorem(object):
         failure_log = analyze_coq_output(output_lines)
         return False, failure_log
 
-    def prove_simple(self):
+    def get_failure_log(self, mode=None):
+        """
+        Returns the failure log of this theorem according to `mode`
+        (see set_failure_logs), or None if it should not have one.
+        """
+        mode = FAILURE_LOGS if mode is None else mode
+        if mode == 'none':
+            return None
+        if self.failure_log is not None:
+            return self.failure_log
+        if mode == 'failed':
+            if self.inference_result is True:
+                return None
+            if self.output_lines is not None:
+                return analyze_coq_output(self.output_lines)
+        _, failure_log = self.prove_debug()
+        return failure_log
+
+    def prove_simple(self, run_script=None):
         # from pudb import set_trace; set_trace()
+        if run_script is None:
+            run_script = run_coq_script
         self.coq_script = make_coq_script(
             self.premises,
             self.conclusion,
             self.dynamic_library_str,
-            self.axioms)
-        self.inference_result = prove_script(self.coq_script, self.timeout)
+            self.axioms,
+            self.coq_strings)
+        self.output_lines = run_script(self.coq_script, self.timeout)
+        self.inference_result = is_theorem_defined(self.output_lines)
         return
 
-    def prove(self, abduction=None):
-        self.prove_simple()
+    def prove(self, abduction=None, run_script=None):
+        self.prove_simple(run_script)
         self.variations.append(self)
         if self.inference_result is False:
             neg_theorem = self.negate()
-            neg_theorem.prove_simple()
+            neg_theorem.prove_simple(run_script)
         if abduction and self.result == 'unknown' and self.doc is not None:
             abduction.attempt(self)
         return
@@ -178,30 +225,34 @@ class Theorem(object):
         d_node.text = self.dynamic_library_str
         ts_node.append(d_node)
         # Add direct and reverse theorem.
+        # The premises and the conclusion are rendered only once.
+        negated_conclusion = negate_conclusion(self.conclusion)
         direct_node = etree.Element('direct_definition')
-        direct_node.text = make_coq_formulae(self.premises, self.conclusion)
+        direct_node.text = make_coq_formulae(
+            self.premises, self.conclusion, coq_strings=self.coq_strings)
         ts_node.append(direct_node)
 
         reverse_node = etree.Element('reverse_definition')
         reverse_node.text = make_coq_formulae(
-            self.premises, self.conclusion, reverse=True)
+            self.premises, self.conclusion, reverse=True,
+            coq_strings=self.coq_strings)
         ts_node.append(reverse_node)
 
         direct_node_neg = etree.Element('direct_definition_neg')
         direct_node_neg.text = make_coq_formulae(
-            self.premises, negate_conclusion(self.conclusion))
+            self.premises, negated_conclusion, coq_strings=self.coq_strings)
         ts_node.append(direct_node_neg)
 
         reverse_node_neg = etree.Element('reverse_definition_neg')
         reverse_node_neg.text = make_coq_formulae(
-            self.premises, negate_conclusion(self.conclusion), reverse=True)
+            self.premises, negated_conclusion, reverse=True,
+            coq_strings=self.coq_strings)
         ts_node.append(reverse_node_neg)
         # Add theorem(s) node.
         for theorem in self.variations:
             t_node = etree.Element('theorem')
             ts_node.append(t_node)
-            if theorem.failure_log is None:
-                _, failure_log = theorem.prove_debug()
+            failure_log = theorem.get_failure_log()
             t_node.set('inference_result', theorem.result_simple)
             t_node.set('is_negated', str(theorem.is_negated))
             s_node = etree.Element('coq_script')
@@ -277,32 +328,43 @@ def get_formulas_from_doc(doc):
     formulas = [f for f in formulas if f is not None]
     return formulas
 
-def make_coq_formulae(premise_interpretations, conclusion, reverse=False):
+def make_coq_formulae(premise_interpretations, conclusion, reverse=False,
+                      coq_strings=None):
+    """
+    With a CoqStringCache `coq_strings`, expressions that were already
+    rendered are not rendered again.
+    """
+    render = normalize_interpretation if coq_strings is None else coq_strings.get
     interpretations = premise_interpretations + [conclusion]
-    interpretations = [normalize_interpretation(interp) for interp in interpretations]
+    interpretations = [render(interp) for interp in interpretations]
     if reverse:
         interpretations.reverse()
     coq_formulae = ' -> '.join(interpretations)
     return coq_formulae
 
-def make_coq_script(premise_interpretations, conclusion, dynamic_library = '', axioms=None):
+def make_coq_script(premise_interpretations, conclusion, dynamic_library = '', axioms=None,
+                    coq_strings=None):
     # Transform these interpretations into coq format:
     #   interpretation1 -> interpretation2 -> ... -> conclusion
-    coq_formulae = make_coq_formulae(premise_interpretations, conclusion)
+    coq_formulae = make_coq_formulae(premise_interpretations, conclusion,
+                                     coq_strings=coq_strings)
     # Input these formulae to coq and retrieve the results.
     tactics = get_tactics()
     coq_script = "Require Export coqlib.\n{0}\nTheorem t1: {1}. {2}.".format(
         dynamic_library, coq_formulae, tactics)
     if axioms is not None and len(axioms) > 0:
         coq_script = insert_axioms_in_coq_script(axioms, coq_script)
-    coq_script = substitute_invalid_chars(coq_script, 'replacement.txt')
+    coq_script = substitute_invalid_chars(coq_script)
     return coq_script
 
-def prove_script(coq_script, timeout=100):
-    output_lines = run_coq_script(coq_script, timeout)
+def make_debug_script(coq_script):
+    return coq_script.replace(get_tactics(), kDebugTactics)
+
+def prove_script(coq_script, timeout=100, cancel=None):
+    output_lines = run_coq_script(coq_script, timeout, cancel)
     return is_theorem_defined(output_lines)
 
-def run_coq_script(coq_script, timeout=100):
+def run_coq_script(coq_script, timeout=100, cancel=None):
     """
     Receives coq script of the form:
       Require Export coqlib.
@@ -310,8 +372,27 @@ def run_coq_script(coq_script, timeout=100):
       Parameter ...
       Theorem t1 ... <tactics>. Qed.
     Returns the output lines.
+    If a proof cache is active, scripts that were already run are not
+    sent to coqtop again. Setting the threading.Event `cancel` aborts a
+    script that runs in the coqtop pool (see CoqtopWorker.run).
     """
-    coq_script = substitute_invalid_chars(coq_script, 'replacement.txt')
+    coq_script = substitute_invalid_chars(coq_script)
+    cache = get_proof_cache()
+    if cache is not None:
+        output_lines = cache.get(coq_script)
+        if output_lines is not None:
+            return output_lines
+    start = time.time()
+    output_lines = run_coqtop(coq_script, timeout, cancel)
+    if cache is not None and output_lines:
+        cache.put(coq_script, output_lines, is_theorem_defined(output_lines),
+                  time.time() - start)
+    return output_lines
+
+def run_coqtop(coq_script, timeout=100, cancel=None):
+    pool = get_coqtop_pool()
+    if pool is not None:
+        return pool.run(coq_script, timeout, cancel)
     try:
         ps = subprocess.Popen(('echo', coq_script), stdout=subprocess.PIPE)
         output = subprocess.check_output(
@@ -400,10 +481,12 @@ class MasterTheorem(Theorem):
         use_gold_trees = False if args is None else args.gold_trees
         timeout = 100 if args is None else args.timeout
         theorems = []
+        required_predicates = get_required_predicates(doc)
         for semantics in generate_semantics_from_doc(doc, 100, use_gold_trees):
             formulas = [sem.xpath('./span[1]/@sem')[0] for sem in semantics]
             assert formulas and len(formulas) > 1
-            dynamic_library_str, formulas = get_dynamic_library_from_doc(doc, semantics)
+            dynamic_library_str, formulas = get_dynamic_library_from_doc(
+                doc, semantics, required_predicates)
             premises, conclusion = formulas[:-1], formulas[-1]
             theorem = Theorem(premises, conclusion, set(), dynamic_library_str)
             labels = [(s.get('ccg_id', None), s.get('ccg_parser', None)) for s in semantics]
@@ -416,12 +499,57 @@ class MasterTheorem(Theorem):
         return master_theorem
 
     def prove(self, abduction=None):
+        pool = get_coqtop_pool()
+        if pool is not None and pool.size > 1 and self.theorems:
+            self.prove_par(abduction, pool.size)
+            return
         for theorem in self.theorems:
             theorem.prove(abduction)
             if theorem.result != 'unknown':
                 break
         return
 
+    def prove_par(self, abduction=None, num_workers=2):
+        """
+        Same as prove, but the scripts of all candidate theorems and of their
+        negations are sent at once to num_workers threads (each running one
+        coqtop of the pool). Candidates are still decided in their original
+        order, so the verdict does not depend on which proof finishes first.
+        Once a candidate is decided, the proofs that are still pending or
+        running for the following candidates are cancelled.
+        """
+        cancel = threading.Event()
+        futures = OrderedDict()
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            for theorem in self.theorems:
+                for conclusion in [theorem.conclusion,
+                                   negate_conclusion(theorem.conclusion)]:
+                    coq_script = make_coq_script(
+                        theorem.premises,
+                        conclusion,
+                        theorem.dynamic_library_str,
+                        theorem.axioms,
+                        theorem.coq_strings)
+                    if coq_script not in futures:
+                        futures[coq_script] = executor.submit(
+                            run_coq_script, coq_script, theorem.timeout, cancel)
+
+            def get_output_lines(coq_script, timeout):
+                if coq_script in futures:
+                    return futures[coq_script].result()
+                return run_coq_script(coq_script, timeout)
+
+            try:
+                for theorem in self.theorems:
+                    theorem.prove(abduction, get_output_lines)
+                    if theorem.result != 'unknown':
+                        break
+            finally:
+                cancel.set()
+                for future in futures.values():
+                    future.cancel()
+        return
+
     @property
     def result(self):
         for theorem in self.theorems:
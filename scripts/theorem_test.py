@@ -0,0 +1,184 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import threading
+import time
+import unittest
+
+from lxml import etree
+
+from . import failure_logs
+from .logic_parser import lexpr
+from . import theorem as theorem_module
+from .theorem import kDebugTactics
+from .theorem import MasterTheorem
+from .theorem import set_failure_logs
+from .theorem import Theorem
+
+class MasterTheoremProveParTestCase(unittest.TestCase):
+    """
+    Replaces coqtop by a function that proves the theorems whose script
+    contains one of the `provable` conclusions, after some delay.
+    """
+
+    def setUp(self):
+        self.run_coq_script = theorem_module.run_coq_script
+        self.lock = threading.Lock()
+        self.started = []
+        self.cancelled = []
+        self.provable = []
+        self.delays = {}
+
+        def fake_run_coq_script(coq_script, timeout=100, cancel=None):
+            conclusion = coq_script.split(' -> ')[-1].split('.')[0]
+            with self.lock:
+                self.started.append(conclusion)
+            deadline = time.time() + self.delays.get(conclusion, 0)
+            while time.time() < deadline:
+                if cancel is not None and cancel.is_set():
+                    with self.lock:
+                        self.cancelled.append(conclusion)
+                    raise Exception('cancelled')
+                time.sleep(0.01)
+            return ['t1 is defined'] if conclusion in self.provable else []
+        theorem_module.run_coq_script = fake_run_coq_script
+
+    def tearDown(self):
+        theorem_module.run_coq_script = self.run_coq_script
+
+    def make_master_theorem(self, conclusions):
+        theorems = [Theorem([lexpr('dog(d)')], lexpr(c), set(), '')
+                    for c in conclusions]
+        return MasterTheorem(theorems)
+
+    def prove_seq_and_par(self, conclusions):
+        master_seq = self.make_master_theorem(conclusions)
+        master_seq.prove()
+        master_par = self.make_master_theorem(conclusions)
+        master_par.prove_par(num_workers=3)
+        return master_seq, master_par
+
+    def assert_same_proofs(self, master_seq, master_par):
+        self.assertEqual(master_seq.result, master_par.result)
+        for t_seq, t_par in zip(master_seq.theorems, master_par.theorems):
+            self.assertEqual(
+                [(t.coq_script, t.inference_result) for t in t_seq.variations],
+                [(t.coq_script, t.inference_result) for t in t_par.variations])
+
+    def test_first_candidate_is_preferred(self):
+        # the proof of the second candidate finishes first,
+        # but the first candidate decides the result.
+        self.provable = ['(run d)', '(not (sleep d))']
+        self.delays = {'(run d)': 0.3}
+        master_seq, master_par = self.prove_seq_and_par(['run(d)', 'sleep(d)'])
+        self.assertEqual('yes', master_par.result)
+        self.assert_same_proofs(master_seq, master_par)
+
+    def test_negation_of_later_candidate(self):
+        self.provable = ['(not (walk d))']
+        master_seq, master_par = self.prove_seq_and_par(
+            ['run(d)', 'walk(d)', 'sleep(d)'])
+        self.assertEqual('no', master_par.result)
+        self.assert_same_proofs(master_seq, master_par)
+
+    def test_unknown(self):
+        master_seq, master_par = self.prove_seq_and_par(['run(d)', 'walk(d)'])
+        self.assertEqual('unknown', master_par.result)
+        self.assert_same_proofs(master_seq, master_par)
+
+    def test_slow_later_candidates_are_cancelled(self):
+        self.provable = ['(run d)']
+        self.delays = {'(walk d)': 10, '(not (walk d))': 10}
+        start = time.time()
+        master = self.make_master_theorem(['run(d)', 'walk(d)'])
+        master.prove_par(num_workers=4)
+        self.assertEqual('yes', master.result)
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual([], master.theorems[1].variations)
+
+class FailureLogTestCase(unittest.TestCase):
+    """
+    Replaces coqtop by a function that proves the theorems whose conclusion
+    is (run d), and otherwise prints an unproved subgoal.
+    """
+
+    def setUp(self):
+        self.run_coq_script = theorem_module.run_coq_script
+        self.failure_logs_run_coq_script = failure_logs.run_coq_script
+        self.scripts = []
+
+        def fake_run_coq_script(coq_script, timeout=100, cancel=None):
+            self.scripts.append(coq_script)
+            if '-> (run d).' in coq_script:
+                return ['t1 is defined']
+            return ['1 subgoal', '', 'H : dog d', '=' * 28, 'sleep d']
+        theorem_module.run_coq_script = fake_run_coq_script
+        failure_logs.run_coq_script = fake_run_coq_script
+
+    def tearDown(self):
+        theorem_module.run_coq_script = self.run_coq_script
+        failure_logs.run_coq_script = self.failure_logs_run_coq_script
+        set_failure_logs('all')
+
+    def prove_to_xml(self, conclusion):
+        theorem = Theorem([lexpr('dog(d)')], lexpr(conclusion), set(), '')
+        theorem.prove()
+        self.scripts = []
+        return theorem.to_xml()
+
+    def count_debug_runs(self):
+        return len([s for s in self.scripts if kDebugTactics in s])
+
+    def test_none(self):
+        set_failure_logs('none')
+        ts_node = self.prove_to_xml('sleep(d)')
+        self.assertEqual(0, len(self.scripts))
+        self.assertEqual(0, len(ts_node.xpath('.//subgoal')))
+
+    def test_failed_reuses_output_of_proof_attempt(self):
+        set_failure_logs('failed')
+        ts_node = self.prove_to_xml('sleep(d)')
+        self.assertEqual(0, len(self.scripts))
+        # the direct and negated theorems were not proved.
+        self.assertEqual(2, len(ts_node.xpath('.//failure_log[other_sub-goals]')))
+        self.assertEqual(['sleep', 'sleep'], ts_node.xpath('.//subgoal/@predicate'))
+
+    def test_failed_skips_proved_theorems(self):
+        set_failure_logs('failed')
+        ts_node = self.prove_to_xml('run(d)')
+        self.assertEqual(0, len(self.scripts))
+        self.assertEqual(0, len(ts_node.xpath('.//subgoal')))
+
+    def test_all_runs_debug_tactics(self):
+        set_failure_logs('all')
+        self.prove_to_xml('sleep(d)')
+        self.assertEqual(2, self.count_debug_runs())
+
+    def test_regenerate_from_xml(self):
+        set_failure_logs('none')
+        ts_node = self.prove_to_xml('sleep(d)')
+        root = etree.fromstring(etree.tostring(ts_node))
+        failure_logs.regenerate_failure_logs(root, 'failed')
+        self.assertEqual(2, self.count_debug_runs())
+        self.assertEqual(2, len(root.xpath('.//failure_log')))
+        self.assertEqual(['sleep', 'sleep'], root.xpath('.//subgoal/@predicate'))
+
+if __name__ == '__main__':
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(MasterTheoremProveParTestCase)
+    suite2 = unittest.TestLoader().loadTestsFromTestCase(FailureLogTestCase)
+    suites = unittest.TestSuite([suite1, suite2])
+    unittest.TextTestRunner(verbosity=2).run(suites)
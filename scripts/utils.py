@@ -16,6 +16,7 @@
 #  limitations under the License.
 
 import logging
+import sys
 import time
 
 def time_count(fn):
@@ -27,3 +28,30 @@ def time_count(fn):
     return returns
   return _wrapper
 
+
+class ProgressReporter(object):
+  """
+  Prints to stderr how many of `total` items (None if unknown) are done and
+  the throughput, at most once every `interval` seconds (0 disables them).
+  """
+
+  def __init__(self, total, interval=60, name='documents'):
+    self.total = total
+    self.interval = interval
+    self.name = name
+    self.done = 0
+    self.start = time.time()
+    self.last_report = self.start
+
+  def update(self, num_done=1):
+    self.done += num_done
+    now = time.time()
+    if self.interval > 0 and now - self.last_report >= self.interval:
+      self.last_report = now
+      self.report()
+
+  def report(self):
+    elapsed = max(time.time() - self.start, 1e-6)
+    done = self.done if self.total is None else '{0}/{1}'.format(self.done, self.total)
+    print('Progress: {0} {1} in {2:.0f}s ({3:.2f} {1}/s)'.format(
+      done, self.name, elapsed, self.done / elapsed), file=sys.stderr)
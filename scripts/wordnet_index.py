@@ -0,0 +1,169 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from __future__ import print_function
+
+import argparse
+from collections import namedtuple
+from functools import lru_cache
+import logging
+import os
+import sqlite3
+import sys
+import threading
+
+from nltk.corpus import wordnet as wn
+
+# WordNet information of a word that linguistic_tools.linguistic_relationship
+# needs, as sets of synset names (or lemma names for derivations).
+kFeatureNames = ['morphy', 'synsets', 'hypernyms', 'similar', 'holonyms',
+                 'antonyms', 'entailments', 'derivations']
+WordFeatures = namedtuple('WordFeatures', kFeatureNames)
+kFeatureCacheSize = 100000
+kMmapSize = 1 << 30
+
+def compute_word_features(word):
+    """
+    Queries WordNet for the features of a word.
+    """
+    synsets = wn.synsets(word)
+    hyper = lambda s: s.hypernyms()
+    lemmas = [lemma for synset in synsets for lemma in synset.lemmas()]
+    antonym_names = set(antonym.name() for lemma in lemmas
+                                       for antonym in lemma.antonyms())
+    return WordFeatures(
+        morphy=wn.morphy(word),
+        synsets=frozenset(s.name() for s in synsets),
+        hypernyms=frozenset(h.name() for s in synsets for h in s.closure(hyper)),
+        similar=frozenset(t.name() for s in synsets for t in s.similar_tos()),
+        holonyms=frozenset(h.name() for s in synsets
+                           for h in s.member_holonyms() + \
+                                    s.substance_holonyms() + \
+                                    s.part_holonyms()),
+        antonyms=frozenset(s.name() for name in antonym_names
+                           for s in wn.synsets(name)),
+        entailments=frozenset(e.name() for s in synsets for e in s.entailments()),
+        derivations=frozenset(d.name() for lemma in lemmas
+                              for d in lemma.derivationally_related_forms()))
+
+class WordnetIndex(object):
+    """
+    Read-only SQLite file with the WordNet features of every lemma name,
+    built once by build_wordnet_index. The file is memory-mapped, so that
+    processes that use the same index share its pages.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(
+            'file:{0}?mode=ro'.format(path), uri=True, check_same_thread=False)
+        self.conn.execute('PRAGMA mmap_size = {0}'.format(kMmapSize))
+
+    def get(self, word):
+        """
+        Returns the WordFeatures of a word, or None if it is not indexed.
+        """
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT {0} FROM features WHERE word = ?'.format(
+                    ', '.join(kFeatureNames)), (word,)).fetchone()
+        if row is None:
+            return None
+        return WordFeatures(row[0], *(frozenset(r.split()) for r in row[1:]))
+
+    def close(self):
+        self.conn.close()
+
+def build_wordnet_index(path, words=None):
+    """
+    Writes the features of `words` (by default, all lemma names of WordNet)
+    into a new index file. Returns the number of indexed words.
+    """
+    if words is None:
+        words = wn.all_lemma_names()
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    num_words = 0
+    with conn:
+        conn.execute('CREATE TABLE features (word text primary key, {0})'.format(
+            ', '.join(name + ' text' for name in kFeatureNames)))
+        rows = []
+        for word in words:
+            features = compute_word_features(word)
+            rows.append((word, features.morphy) + \
+                tuple(' '.join(sorted(f)) for f in features[1:]))
+            num_words += 1
+        conn.executemany('INSERT OR REPLACE INTO features VALUES ({0})'.format(
+            ', '.join('?' * (len(kFeatureNames) + 1))), rows)
+    conn.close()
+    return num_words
+
+@lru_cache(maxsize=kFeatureCacheSize)
+def get_word_features(word):
+    """
+    Returns the WordFeatures of a word from the index, if any,
+    or from WordNet otherwise.
+    """
+    index = get_wordnet_index()
+    if index is not None:
+        features = index.get(word)
+        if features is not None:
+            return features
+    return compute_word_features(word)
+
+INDEX_PATH = ''
+_index = None
+_index_pid = None
+_index_lock = threading.Lock()
+
+def set_wordnet_index(path):
+    """
+    Sets the file of the WordNet index. An empty path disables the index.
+    """
+    global INDEX_PATH
+    INDEX_PATH = path
+
+def get_wordnet_index():
+    """
+    Returns the WordNet index of the current process, or None if disabled.
+    """
+    global _index, _index_pid
+    if not INDEX_PATH:
+        return None
+    with _index_lock:
+        if _index is None or _index_pid != os.getpid() or _index.path != INDEX_PATH:
+            _index = WordnetIndex(INDEX_PATH)
+            _index_pid = os.getpid()
+    return _index
+
+def main(args = None):
+    DESCRIPTION=('Build an index with the WordNet relations of all lemmas, '
+                 'to be used with prove.py --wordnet_index.')
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+    parser.add_argument("index", help="SQLite output filename")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    num_words = build_wordnet_index(args.index)
+    print('Indexed {0} words into {1}'.format(num_words, args.index),
+          file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
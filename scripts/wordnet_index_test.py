@@ -0,0 +1,121 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+import tempfile
+import unittest
+
+from .linguistic_tools import get_linguistic_relations
+from .linguistic_tools import linguistic_relationship
+from . import wordnet_index
+from .wordnet_index import build_wordnet_index
+from .wordnet_index import get_word_features
+from .wordnet_index import set_wordnet_index
+from .wordnet_index import WordFeatures
+
+def make_features(morphy=None, **features):
+    return WordFeatures(morphy, *(frozenset(features.get(name, []))
+                                  for name in wordnet_index.kFeatureNames[1:]))
+
+# Small imitation of WordNet, so that these tests do not need its data.
+fake_wordnet = {
+    'dog': make_features('dog', synsets=['dog.n.01'],
+                         hypernyms=['canine.n.02', 'animal.n.01'],
+                         holonyms=['pack.n.06']),
+    'dogs': make_features('dog', synsets=['dog.n.01']),
+    'animal': make_features('animal', synsets=['animal.n.01']),
+    'pack': make_features('pack', synsets=['pack.n.06']),
+    'hound': make_features('hound', synsets=['dog.n.01', 'hound.n.01']),
+    'large': make_features('large', synsets=['large.a.01'],
+                           antonyms=['small.a.01'], similar=['big.a.01']),
+    'small': make_features('small', synsets=['small.a.01'],
+                           antonyms=['large.a.01']),
+    'big': make_features('big', synsets=['big.a.01']),
+    'snore': make_features('snore', synsets=['snore.v.01'],
+                           entailments=['sleep.v.01']),
+    'sleep': make_features('sleep', synsets=['sleep.v.01'],
+                           derivations=['sleeper']),
+    'sleeper': make_features('sleeper', synsets=['sleeper.n.01']),
+}
+
+class WordnetIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.compute_word_features = wordnet_index.compute_word_features
+        self.queried_words = []
+        def fake_compute_word_features(word):
+            self.queried_words.append(word)
+            return fake_wordnet.get(word, make_features())
+        wordnet_index.compute_word_features = fake_compute_word_features
+        fd, self.path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        get_word_features.cache_clear()
+        get_linguistic_relations.cache_clear()
+
+    def tearDown(self):
+        wordnet_index.compute_word_features = self.compute_word_features
+        set_wordnet_index('')
+        get_word_features.cache_clear()
+        get_linguistic_relations.cache_clear()
+        os.remove(self.path)
+
+    def get_all_relations(self):
+        return {(w1, w2): linguistic_relationship(w1, w2)
+                for w1 in fake_wordnet for w2 in fake_wordnet}
+
+    def test_relations(self):
+        self.assertEqual(['copy'], linguistic_relationship('dog', 'dog'))
+        self.assertEqual(['inflection'], linguistic_relationship('dogs', 'dog'))
+        self.assertEqual(['hypernym'], linguistic_relationship('dog', 'animal'))
+        self.assertEqual(['meronym'], linguistic_relationship('dog', 'pack'))
+        self.assertEqual(['hyponym'], linguistic_relationship('animal', 'dog'))
+        self.assertEqual(['holonym'], linguistic_relationship('pack', 'dog'))
+        self.assertEqual(['synonym'], linguistic_relationship('dog', 'hound'))
+        self.assertEqual(['similar'], linguistic_relationship('large', 'big'))
+        self.assertEqual(['antonym'], linguistic_relationship('small', 'large'))
+        self.assertEqual(['entailed'], linguistic_relationship('sleep', 'snore'))
+        self.assertEqual(['derivation'], linguistic_relationship('sleep', 'sleeper'))
+        self.assertEqual([], linguistic_relationship('snore', 'big'))
+
+    def test_relations_are_cached(self):
+        linguistic_relationship('dog', 'hound')
+        num_queries = len(self.queried_words)
+        relations = linguistic_relationship('dog', 'hound')
+        relations.append('modified')
+        self.assertEqual(num_queries, len(self.queried_words))
+        self.assertEqual(['synonym'], linguistic_relationship('dog', 'hound'))
+
+    def test_index_gives_same_relations(self):
+        expected_relations = self.get_all_relations()
+        self.assertEqual(len(fake_wordnet), build_wordnet_index(self.path, fake_wordnet))
+        set_wordnet_index(self.path)
+        get_word_features.cache_clear()
+        get_linguistic_relations.cache_clear()
+        self.queried_words = []
+        self.assertEqual(expected_relations, self.get_all_relations())
+        self.assertEqual([], self.queried_words)
+
+    def test_words_not_in_index_are_queried(self):
+        build_wordnet_index(self.path, ['dog'])
+        set_wordnet_index(self.path)
+        self.queried_words = []
+        self.assertEqual(['synonym'], linguistic_relationship('dog', 'hound'))
+        self.assertEqual(['hound'], self.queried_words)
+
+if __name__ == '__main__':
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(WordnetIndexTestCase)
+    suites = unittest.TestSuite([suite1])
+    unittest.TextTestRunner(verbosity=2).run(suites)
@@ -1,11 +1,28 @@
+from collections import Counter
 import json as js
+import os
 from flask import Flask, send_from_directory, request
 
 import operate as op
+from jobs import JobQueue, QueueFull
 
 app = Flask(__name__)
 app.config['JSON_AS_ASCII'] = False  # JSONでの日本語文字化け対策
 
+# slow operations (jigg parsing, coqtop proving) run in the background
+JOBS = JobQueue(num_workers=2, max_pending=100)
+# batches of proofs run one at a time on their own queue,
+# so that they never hold the workers of interactive jobs
+BATCH_JOBS = JobQueue(num_workers=1, max_pending=4, prefix='batch-')
+# processes used by each batch of proofs
+PROVE_NCORES = 4
+
+
+@app.teardown_request
+def release_db_connection(exception):
+    # the connection used by this request goes back to the pool
+    op.release_conn()
+
 
 @app.route('/api/delete', methods=['POST'])
 def delete_table():
@@ -26,16 +43,20 @@ def delete_table():
     return js.dumps(json)
 
 
+def _reg_ja(ja):
+    success = op.register_japanese(ja)
+    if success is True:
+        msg = f'Register: {ja}'
+    else:
+        msg = f'Fail to register:{success}'
+    return msg
+
+
 @app.route('/api/reg_ja', methods=['POST'])
 def reg_ja():
     posted = request.get_json()
     if 'japanese' in posted:
-        ja = posted['japanese']
-        success = op.register_japanese(ja)
-        if success is True:
-            msg = f'Register: {ja}'
-        else:
-            msg = f'Fail to register:{success}'
+        msg = _reg_ja(posted['japanese'])
     else:
         msg = 'Fail to register: Wrong json'
     json = {
@@ -105,20 +126,23 @@ def update_good():
     return js.dumps(json)
 
 
+def _try_prove(pre_id_text, c_id):
+    pre_id = list(map(int, pre_id_text.split('&')))
+    success = op.try_prove(pre_id, c_id)
+    if success is True:
+        msg = f'prove: {pre_id_text}->{c_id}'
+    elif success is False:
+        msg = f'not proved: {pre_id_text}->{c_id}'
+    else:
+        msg = f'Fail to prove: one of errors:{success[0]}'
+    return msg
+
+
 @app.route('/api/try_prove', methods=['POST'])
 def try_prove():
     posted = request.get_json()
     if "premises_id" in posted and "conclusion_id" in posted:
-        pre_id_text = posted['premises_id']
-        c_id = posted['conclusion_id']
-        pre_id = list(map(int, pre_id_text.split('&')))
-        success = op.try_prove(pre_id, c_id)
-        if success is True:
-            msg = f'prove: {pre_id_text}->{c_id}'
-        elif success is False:
-            msg = f'not proved: {pre_id_text}->{c_id}'
-        else:
-            msg = f'Fail to prove: one of errors:{success[0]}'
+        msg = _try_prove(posted['premises_id'], posted['conclusion_id'])
     else:
         msg = 'Fail to prove: Wrong json'
     json = {
@@ -127,17 +151,184 @@ def try_prove():
     return js.dumps(json)
 
 
+def _run_job(fn, *args):
+    try:
+        return fn(*args)
+    finally:
+        op.release_conn()
+
+
+def _submit(kind, fn, *args, jobs=JOBS):
+    try:
+        job_id = jobs.submit(kind, _run_job, fn, *args)
+    except QueueFull as e:
+        json = {
+            'message': f'Server busy, try again later: {e}'
+        }
+        return js.dumps(json), 503
+    json = {
+        'job_id': job_id,
+        'message': f'Submitted {kind}: job {job_id}'
+    }
+    return js.dumps(json)
+
+
+@app.route('/api/jobs/reg_ja', methods=['POST'])
+def submit_reg_ja():
+    posted = request.get_json()
+    if 'japanese' in posted:
+        return _submit('reg_ja', _reg_ja, posted['japanese'])
+    json = {
+        'message': 'Fail to register: Wrong json'
+    }
+    return js.dumps(json), 400
+
+
+@app.route('/api/jobs/try_prove', methods=['POST'])
+def submit_try_prove():
+    posted = request.get_json()
+    if "premises_id" in posted and "conclusion_id" in posted:
+        return _submit('try_prove', _try_prove,
+                       posted['premises_id'], posted['conclusion_id'])
+    json = {
+        'message': 'Fail to prove: Wrong json'
+    }
+    return js.dumps(json), 400
+
+
+def _try_prove_batch(pairs):
+    rows = op.prove_many(pairs, ncores=PROVE_NCORES)
+    if isinstance(rows, op.Error):
+        return f'Fail to prove: {rows}'
+    counts = Counter(result_text.split(':')[0] for _, _, result_text in rows)
+    summary = ', '.join(f'{n} {result}' for result, n in sorted(counts.items()))
+    return f'prove batch of {len(rows)} pairs: {summary}'
+
+
+@app.route('/api/try_prove_batch', methods=['POST'])
+def try_prove_batch():
+    # {"pairs": [{"premises_id": "1&2", "conclusion_id": 3}, ...]}
+    # or {"all": true} to prove every pair of good formulas
+    posted = request.get_json()
+    if posted.get('all') is True:
+        return _submit('try_prove_batch', _try_prove_batch, None,
+                       jobs=BATCH_JOBS)
+    try:
+        pairs = [(list(map(int, str(pair['premises_id']).split('&'))),
+                  int(pair['conclusion_id']))
+                 for pair in posted['pairs']]
+    except (KeyError, TypeError, ValueError):
+        json = {
+            'message': 'Fail to prove: Wrong json'
+        }
+        return js.dumps(json), 400
+    return _submit('try_prove_batch', _try_prove_batch, pairs,
+                   jobs=BATCH_JOBS)
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    if job_id.startswith(BATCH_JOBS.prefix):
+        job = BATCH_JOBS.status(job_id)
+    else:
+        job = JOBS.status(job_id)
+    if job is None:
+        json = {
+            'message': f'Unknown job: {job_id}'
+        }
+        return js.dumps(json), 404
+    if job['status'] == 'done':
+        job['message'] = job['result']
+    elif job['status'] == 'failed':
+        job['message'] = f"Job failed: {job['error']}"
+    else:
+        job['message'] = f"Job {job_id} is {job['status']}"
+    return js.dumps(job)
+
+
 @app.route('/api/alltable', methods=['GET'])
 def alltable():
+    # read the revision first: later changes are then reported by /api/changes
+    rev = op.current_revision()
     japanese = op.info_japanese()
     logic_table = op.info_logic()
     theorems = op.info_theorem()
     alltable = {"jatable": japanese,
                 "lotable": logic_table,
-                "thtable": theorems}
+                "thtable": theorems,
+                "rev": rev if isinstance(rev, int) else None}
     return js.dumps(alltable)
 
 
+@app.route('/api/table/<table>', methods=['GET'])
+def table_page(table):
+    # e.g. /api/table/logic?offset=0&limit=100&jid=3&good=1&q=dog
+    if table not in op.TABLE_COLUMNS:
+        json = {
+            'message': f'Unknown table: {table}'
+        }
+        return js.dumps(json), 404
+    try:
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args.get('limit', 100))
+    except ValueError:
+        json = {
+            'message': 'Fail to fetch: Wrong offset or limit'
+        }
+        return js.dumps(json), 400
+    filters = {column: request.args[column]
+               for column in op.TABLE_COLUMNS[table]
+               if column in request.args}
+    rev = op.current_revision()
+    page = op.page_table(table, offset, limit, filters, request.args.get('q'))
+    if isinstance(page, op.Error) or isinstance(rev, op.Error):
+        json = {
+            'message': f'Fail to fetch: {page if isinstance(page, op.Error) else rev}'
+        }
+        return js.dumps(json), 500
+    rows, total = page
+    json = {
+        'rows': rows,
+        'total': total,
+        'offset': offset,
+        'rev': rev
+    }
+    return js.dumps(json)
+
+
+@app.route('/api/changes', methods=['GET'])
+def changes():
+    # rows inserted, updated or deleted after revision ?since=N
+    try:
+        since = int(request.args.get('since', 0))
+    except ValueError:
+        json = {
+            'message': 'Fail to fetch: Wrong revision'
+        }
+        return js.dumps(json), 400
+    delta = op.changes_since(since)
+    if delta is None:
+        json = {
+            'message': f'Fail to fetch: revision {since} is too old, '
+                       'reload /api/alltable'
+        }
+        return js.dumps(json), 410
+    if isinstance(delta, op.Error):
+        json = {
+            'message': f'Fail to fetch: {delta}'
+        }
+        return js.dumps(json), 500
+    rev, changed, deleted = delta
+    json = {
+        'rev': rev,
+        'jatable': changed['japanese'],
+        'lotable': changed['logic'],
+        'thtable': changed['theorem'],
+        'deleted': deleted
+    }
+    return js.dumps(json)
+
+
 @app.route('/')
 def root():
     init_response = op.init_db()
@@ -151,4 +342,9 @@ def root():
 
 
 if __name__ == '__main__':
-    app.run(port=9999, host='localhost', debug=True)
+    # the debugger is opt-in (SERVER_DEBUG=1), and the reloader is always off:
+    # it would import this module twice, with two sets of job queues
+    debug = os.environ.get('SERVER_DEBUG') == '1'
+    # requests are independent (per-thread DB connections, no shared temp files)
+    app.run(port=9999, host='localhost', debug=debug, threaded=True,
+            use_reloader=False)